@@ -0,0 +1,64 @@
+"""
+Memory and time of adding expectations: bytes per expectation kept by expectation manager
+compared with expectations kept as raw dicts parsed from JSON. Synthetic expectations share
+a limited set of path patterns, as mocks of one service usually do
+
+Usage: python -m benchmarks.expectation_memory_benchmark [--expectations 100000] [--patterns 100]
+"""
+import gc
+import json
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+from expectation_manager import ExpectationManager
+
+
+def make_expectations_as_json(count, count_of_patterns):
+    """
+    :return: list of expectations as JSON, as they are posted to admin API
+    """
+    return [json.dumps({"request": {"method": "GET",
+                                    "path": "^/api/v1/resource%d/[0-9]+$" % (i % count_of_patterns),
+                                    "headers": {"Accept": "application/json"}},
+                        "response": {"httpcode": 200, "body": '{"id": %d}' % i,
+                                     "headers": {"Content-Type": "application/json"}},
+                        "tags": ["benchmark"]})
+            for i in range(count)]
+
+
+def measure(make_store, expectations_as_json):
+    """
+    :param make_store: function, which makes function to keep expectation parsed from JSON
+    :return: tuple (bytes per expectation, add time per expectation in microseconds). Time is measured
+     in separate run without tracing of memory
+    """
+    store = make_store()
+    start_time = time.perf_counter()
+    for expectation_as_json in expectations_as_json:
+        store(json.loads(expectation_as_json))
+    duration = time.perf_counter() - start_time
+    del store
+
+    gc.collect()
+    tracemalloc.start()
+    store = make_store()
+    for expectation_as_json in expectations_as_json:
+        store(json.loads(expectation_as_json))
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del store
+    return size / len(expectations_as_json), duration / len(expectations_as_json) * 1e6
+
+
+if __name__ == '__main__':
+    argument_parser = ArgumentParser(description='Flamock expectation memory benchmark')
+    argument_parser.add_argument("--expectations", type=int, default=100000, help="Count of expectations")
+    argument_parser.add_argument("--patterns", type=int, default=100, help="Count of distinct path patterns")
+    args = argument_parser.parse_args()
+
+    expectations = make_expectations_as_json(args.expectations, args.patterns)
+    print("raw dicts: %.0f bytes per expectation" % measure(lambda: [].append, expectations)[0])
+    print("expectation manager: %.0f bytes per expectation, add %.1f us" % measure(
+        lambda: ExpectationManager().add, expectations))
@@ -0,0 +1,24 @@
+"""
+Requests per second with in-memory log only and with persistent journal
+
+Usage: python -m benchmarks.journal_benchmark [--requests 5000] [--expectations 50]
+"""
+import shutil
+import tempfile
+from argparse import ArgumentParser
+
+from benchmarks.logging_benchmark import run
+
+if __name__ == '__main__':
+    argument_parser = ArgumentParser(description='Flamock persistent journal benchmark')
+    argument_parser.add_argument("--requests", type=int, default=5000, help="Count of requests")
+    argument_parser.add_argument("--expectations", type=int, default=50, help="Count of expectations")
+    args = argument_parser.parse_args()
+
+    print("requests per second in memory: %.1f" % run(args.requests, args.expectations))
+    directory = tempfile.mkdtemp()
+    try:
+        print("requests per second with journal: %.1f" % run(args.requests, args.expectations,
+                                                             journal_directory=directory))
+    finally:
+        shutil.rmtree(directory)
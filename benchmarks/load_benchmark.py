@@ -0,0 +1,273 @@
+"""
+Throughput and latency of flamock under concurrent HTTP load. Flamock is started in this process
+(threaded server of flamock in background thread) or as subprocess (python flamock.py), gets synthetic
+expectations through admin API and is loaded by scenarios:
+ - matching # request without matched expectation: every expectation is evaluated, response is short miss response
+ - canned # request matched to expectation with static response
+ - delayed # request matched to expectation with response delayed by --delay_ms (throttle ttfb)
+ - forward # request forwarded to local stub server
+
+Load generator shares the interpreter with in-process flamock, so subprocess mode gives more realistic numbers.
+Results are printed and written to JSON (--output) to compare them across commits
+
+Usage: python -m benchmarks.load_benchmark [--mode subprocess] [--expectations 1000]
+ [--pattern_mix literal=0.6,regex=0.3,headers=0.1] [--requests 2000] [--concurrency 8]
+ [--scenarios matching,canned,delayed,forward] [--output results.json]
+"""
+import http.client
+import http.server
+import json
+import logging
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+
+from benchmarks.load_generator import run_load
+
+SCENARIOS = ('matching', 'canned', 'delayed', 'forward')
+PATTERN_KINDS = ('literal', 'regex', 'headers')
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_pattern_mix(text):
+    """
+    :param text: shares of pattern kinds in format literal=0.6,regex=0.3,headers=0.1
+    :return: dict with <kind: share>. Shares are normalized to sum 1
+    """
+    mix = {}
+    for pair in text.split(','):
+        kind, _, share = pair.partition('=')
+        if kind not in PATTERN_KINDS:
+            raise ValueError("Unknown kind of pattern '%s'. Known kinds: %s" % (kind, ', '.join(PATTERN_KINDS)))
+        mix[kind] = float(share)
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError("Sum of shares of patterns must be positive")
+    return {kind: round(share / total, 6) for kind, share in mix.items()}
+
+
+def make_expectations(count, pattern_mix):
+    """
+    Expectations, which don't match requests of scenarios, so all of them are evaluated for every request
+    :param count: count of expectations
+    :param pattern_mix: dict with <kind: share> from parse_pattern_mix
+    :return: list of expectations
+    """
+    expectations = []
+    kinds = sorted(pattern_mix.items())
+    for position, (kind, share) in enumerate(kinds):
+        count_of_kind = count - len(expectations) if position == len(kinds) - 1 else int(round(count * share))
+        for i in range(min(count_of_kind, count - len(expectations))):
+            index = len(expectations)
+            if kind == 'literal':
+                request = {'method': 'GET', 'path': 'synthetic/service%s/items' % index}
+            elif kind == 'regex':
+                request = {'method': 'GET', 'path': r'^synthetic/service%s/items/[0-9]+$' % index}
+            else:
+                request = {'path': 'synthetic', 'headers': {'X-Synthetic': str(index)}}
+            expectations.append({'key': 'synthetic%s' % index,
+                                 'request': request,
+                                 'response': {'httpcode': 200, 'body': '{"id": %s}' % index}})
+    return expectations
+
+
+def make_scenario_expectations(delay_ms, stub_port):
+    """
+    :return: dict with <scenario: expectation or None>
+    """
+    return {'matching': None,
+            'canned': {'key': 'bench-canned', 'request': {'path': '^bench/canned$'},
+                       'response': {'httpcode': 200, 'body': '{"status": "ok"}',
+                                    'headers': {'Content-Type': 'application/json'}}},
+            'delayed': {'key': 'bench-delayed', 'request': {'path': '^bench/delayed$'},
+                        'response': {'httpcode': 200, 'body': 'delayed', 'throttle': {'ttfb': delay_ms}}},
+            'forward': {'key': 'bench-forward', 'request': {'path': '^bench/forward$'},
+                        'forward': {'scheme': 'http', 'host': '127.0.0.1:%s' % stub_port}}}
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    body = b'stub'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server():
+    """
+    :return: local HTTP server, which answers 200 to any GET request
+    """
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='flamock-stub', daemon=True).start()
+    return server
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_status(port, timeout=30):
+    """
+    Waits until flamock answers to status request
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+        try:
+            connection.request('GET', '/flamock/status')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.05)
+        finally:
+            connection.close()
+    raise RuntimeError("Flamock didn't start on port %s in %s seconds" % (port, timeout))
+
+
+def start_in_process():
+    """
+    :return: tuple (port, function to stop flamock)
+    """
+    from flask_factory import FlaskFactory
+    from wsgi_server import WSGIServer
+
+    app = FlaskFactory.flask_factory()
+    app.logger.setLevel(logging.ERROR)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = WSGIServer('127.0.0.1', 0, app)
+    threading.Thread(target=server.serve_forever, name='flamock-server', daemon=True).start()
+    return server.server_port, server.shutdown
+
+
+def start_subprocess():
+    """
+    :return: tuple (port, function to stop flamock)
+    """
+    port = get_free_port()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT_DIRECTORY, 'flamock.py'),
+                                '--port', str(port), '--loglevel', str(logging.ERROR)],
+                               cwd=ROOT_DIRECTORY, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def stop():
+        process.terminate()
+        process.wait()
+
+    try:
+        wait_for_status(port)
+    except RuntimeError:
+        stop()
+        raise
+    return port, stop
+
+
+def add_expectations(port, expectations):
+    """
+    Adds expectations through admin API over one connection
+    """
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    try:
+        for expectation in expectations:
+            connection.request('POST', '/flamock/add_expectation', json.dumps(expectation))
+            response = connection.getresponse()
+            text = response.read()
+            if response.status != 200:
+                raise RuntimeError("Expectation was not added: %s" % text)
+    finally:
+        connection.close()
+
+
+def get_commit():
+    """
+    :return: hash of current git commit or None
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIRECTORY,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(settings):
+    """
+    :param settings: dict with mode, expectations, pattern_mix, requests, concurrency, delay_ms and scenarios
+    :return: dict with settings, environment and results of scenarios
+    """
+    stub_server = start_stub_server()
+    port, stop = start_in_process() if settings['mode'] == 'inprocess' else start_subprocess()
+    try:
+        start_time = time.perf_counter()
+        add_expectations(port, make_expectations(settings['expectations'], settings['pattern_mix']))
+        scenario_expectations = make_scenario_expectations(settings['delay_ms'], stub_server.server_port)
+        add_expectations(port, [scenario_expectations[name] for name in settings['scenarios']
+                                if scenario_expectations[name] is not None])
+        setup_duration = time.perf_counter() - start_time
+
+        scenarios = {}
+        for name in settings['scenarios']:
+            path = '/bench/%s' % name
+            run_load('127.0.0.1', port, path, min(100, settings['requests']), settings['concurrency'])  # warm up
+            scenarios[name] = run_load('127.0.0.1', port, path, settings['requests'], settings['concurrency'])
+    finally:
+        stop()
+        stub_server.shutdown()
+    return {"commit": get_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": settings,
+            "setup_duration_s": round(setup_duration, 3),
+            "scenarios": scenarios}
+
+
+if __name__ == '__main__':
+    argument_parser = ArgumentParser(description='Flamock load benchmark')
+    argument_parser.add_argument("--mode", choices=['inprocess', 'subprocess'], default='subprocess',
+                                 help="Run flamock in this process or as subprocess")
+    argument_parser.add_argument("--expectations", type=int, default=1000, help="Count of synthetic expectations")
+    argument_parser.add_argument("--pattern_mix", type=str, default='literal=0.6,regex=0.3,headers=0.1',
+                                 help="Shares of literal, regex and header patterns of synthetic expectations")
+    argument_parser.add_argument("--requests", type=int, default=2000, help="Count of requests in each scenario")
+    argument_parser.add_argument("--concurrency", type=int, default=8, help="Count of concurrent connections")
+    argument_parser.add_argument("--delay_ms", type=int, default=20, help="Delay of response in delayed scenario")
+    argument_parser.add_argument("--scenarios", type=str, default=','.join(SCENARIOS),
+                                 help="Comma separated scenarios: %s" % ', '.join(SCENARIOS))
+    argument_parser.add_argument("--output", type=str, default=None, help="File to write results in JSON")
+    args = argument_parser.parse_args()
+
+    scenario_names = [name for name in args.scenarios.split(',') if len(name) > 0]
+    unknown_scenarios = [name for name in scenario_names if name not in SCENARIOS]
+    if len(unknown_scenarios) > 0:
+        argument_parser.error("Unknown scenarios: %s" % ', '.join(unknown_scenarios))
+    try:
+        pattern_mix = parse_pattern_mix(args.pattern_mix)
+    except ValueError as e:
+        argument_parser.error(str(e))
+
+    result = run({"mode": args.mode,
+                  "expectations": args.expectations,
+                  "pattern_mix": pattern_mix,
+                  "requests": args.requests,
+                  "concurrency": args.concurrency,
+                  "delay_ms": args.delay_ms,
+                  "scenarios": scenario_names})
+    print("%-10s %10s %8s %10s %10s %10s" % ('scenario', 'req/s', 'errors', 'p50 ms', 'p99 ms', 'p999 ms'))
+    for name, scenario in result['scenarios'].items():
+        print("%-10s %10s %8s %10s %10s %10s" % (name, scenario['rps'], scenario['errors'], scenario['p50_ms'],
+                                                 scenario['p99_ms'], scenario['p999_ms']))
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(result, file, indent=2)
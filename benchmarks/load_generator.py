@@ -0,0 +1,91 @@
+"""
+Concurrent HTTP load generator. Every worker thread sends requests over its own keep-alive connection
+and records latency of every request
+"""
+import http.client
+import itertools
+import math
+import threading
+import time
+
+
+def percentile(sorted_values, fraction):
+    """
+    :param sorted_values: sorted list of numbers
+    :param fraction: 0.5 for median, 0.99 for p99 and so on
+    :return: value by nearest rank or None if list is empty
+    """
+    if len(sorted_values) == 0:
+        return None
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def summarize(latencies, count_of_errors, duration):
+    """
+    :param latencies: list of latencies of successful requests in seconds
+    :param count_of_errors: count of failed requests
+    :param duration: duration of load in seconds
+    :return: dict with count of requests, errors, requests per second and p50/p99/p999 latency in ms
+    """
+    latencies = sorted(latencies)
+
+    def to_ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {"requests": len(latencies),
+            "errors": count_of_errors,
+            "duration_s": round(duration, 3),
+            "rps": round(len(latencies) / duration, 1) if duration > 0 else None,
+            "p50_ms": to_ms(percentile(latencies, 0.5)),
+            "p99_ms": to_ms(percentile(latencies, 0.99)),
+            "p999_ms": to_ms(percentile(latencies, 0.999))}
+
+
+def run_load(host, port, path, count_of_requests, concurrency, method='GET', body=None, headers=None,
+             expected_status=200, timeout=60):
+    """
+    Sends count_of_requests requests by concurrency threads
+    :param path: path of request, starts with slash
+    :param expected_status: status of successful response. Other statuses are counted as errors
+    :return: dict from summarize
+    """
+    counter = itertools.count()
+    results = []  # tuples (list of latencies, count of errors) of workers
+    lock = threading.Lock()
+    body = body.encode() if isinstance(body, str) else body
+    headers = headers or {}
+
+    def worker():
+        latencies = []
+        count_of_errors = 0
+        connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        try:
+            while next(counter) < count_of_requests:
+                start_time = time.perf_counter()
+                try:
+                    connection.request(method, path, body, headers)
+                    response = connection.getresponse()
+                    response.read()
+                    is_success = response.status == expected_status
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    is_success = False
+                if is_success:
+                    latencies.append(time.perf_counter() - start_time)
+                else:
+                    count_of_errors += 1
+        finally:
+            connection.close()
+            with lock:
+                results.append((latencies, count_of_errors))
+
+    threads = [threading.Thread(target=worker, name='flamock-load-%s' % i) for i in range(concurrency)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start_time
+    return summarize([latency for latencies, _ in results for latency in latencies],
+                     sum(count_of_errors for _, count_of_errors in results),
+                     duration)
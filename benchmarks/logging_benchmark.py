@@ -0,0 +1,55 @@
+"""
+Requests per second of mocked responses at INFO log level.
+Log messages are written to os.devnull, so only formatting and encoding are measured
+
+Usage: python -m benchmarks.logging_benchmark [--requests 5000] [--expectations 50]
+"""
+import logging
+import os
+import time
+from argparse import ArgumentParser
+
+from flask_factory import FlaskFactory
+from logging_format import logging_format
+
+
+def run(count_of_requests, count_of_expectations, log_level=logging.INFO, journal_directory=None):
+    null_stream = open(os.devnull, 'w')
+    handler = logging.StreamHandler(null_stream)
+    handler.setFormatter(logging.Formatter(logging_format))
+
+    app = FlaskFactory.flask_factory()
+    app.logger.handlers = [handler]
+    app.logger.propagate = False
+    app.logger.setLevel(log_level)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    if journal_directory is not None:
+        app.namespace_manager.enable_journal(journal_directory)
+
+    for i in range(count_of_expectations):
+        app.expectation_manager.add({
+            'key': 'exp%s' % i,
+            'request': {'method': 'POST', 'path': 'service/%s' % i, 'body': '<id>%s</id>' % i},
+            'response': {'httpcode': 200, 'body': '<result>%s</result>' % i}})
+
+    client = app.test_client()
+    body = '<request>%s<id>%s</id></request>' % ('<item>value</item>' * 100, count_of_expectations - 1)
+    headers = {'X-Header-%s' % i: 'value' * 10 for i in range(20)}
+    path = '/service/%s' % (count_of_expectations - 1)
+
+    start_time = time.perf_counter()
+    for i in range(count_of_requests):
+        client.post(path, data=body, headers=headers)
+    duration = time.perf_counter() - start_time
+    null_stream.close()
+    app.response_manager.log_container.close()
+    return count_of_requests / duration
+
+
+if __name__ == '__main__':
+    argument_parser = ArgumentParser(description='Flamock logging benchmark')
+    argument_parser.add_argument("--requests", type=int, default=5000, help="Count of requests")
+    argument_parser.add_argument("--expectations", type=int, default=50, help="Count of expectations")
+    args = argument_parser.parse_args()
+
+    print("requests per second at INFO level: %.1f" % run(args.requests, args.expectations))
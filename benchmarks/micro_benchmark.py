@@ -0,0 +1,268 @@
+"""
+Micro-benchmarks of hot paths: matching, expectation manager, logging and responses. Requests have realistic
+shape: browser-like headers and XML or JSON bodies of a few KB. Every benchmark is timed as timeit does:
+count of calls per run is chosen automatically, min and median time of call over runs are reported.
+
+Results can be saved as baseline and compared with it later. Comparison fails (exit code 1), if any benchmark
+is slower than baseline by more than threshold. Min time is compared, as the least noisy one.
+Baseline depends on machine, so compare runs on the same machine
+
+Usage: python -m benchmarks.micro_benchmark [--filter manager] [--repeat 5]
+ [--save benchmarks/micro_baseline.json] [--compare benchmarks/micro_baseline.json] [--threshold 20]
+"""
+import contextlib
+import json
+import logging
+import os
+import statistics
+import sys
+import timeit
+from argparse import ArgumentParser
+
+from custom_reponse import CustomResponse
+from expectation import Expectation
+from expectation_manager import ExpectationManager
+from expectation_matcher import ExpectationMatcher
+from extensions import Extensions
+from flask_factory import FlaskFactory
+from json_logging import JsonLogging
+from log_container import LogContainer
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'micro_baseline.json')
+BENCHMARKS = []  # list of tuples (name, function which returns context manager with benchmarked function)
+
+
+def benchmark(name):
+    """
+    Registers generator function as benchmark. Generator prepares data, yields function to be timed and cleans up
+    """
+    def decorator(function):
+        BENCHMARKS.append((name, contextlib.contextmanager(function)))
+        return function
+
+    return decorator
+
+
+def make_headers():
+    headers = {'Host': 'api.example.com',
+               'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                             'Chrome/120.0.0.0 Safari/537.36',
+               'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+               'Accept-Encoding': 'gzip, deflate, br',
+               'Accept-Language': 'en-US,en;q=0.9,nl;q=0.8',
+               'Cookie': '; '.join('cookie%s=%s' % (i, 'v' * 40) for i in range(20)),
+               'Authorization': 'Bearer ' + 'a' * 600,
+               'X-Request-Id': '5f2b6a0e-0b4e-4b8e-9a53-6f1b1f0b7c11'}
+    headers.update({'X-Custom-Header-%s' % i: 'value' * 8 for i in range(15)})
+    return headers
+
+
+def make_xml_body():
+    items = ''.join('<item id="%s"><name>Item %s</name><price>%s.99</price></item>' % (i, i, i) for i in range(100))
+    return '<?xml version="1.0"?><request><customer>12345</customer><items>%s</items></request>' % items
+
+
+def make_json_body():
+    return json.dumps({'customer': 12345, 'items': [{'id': i, 'name': 'Item %s' % i, 'price': i + 0.99}
+                                                    for i in range(100)]})
+
+
+def make_request(body):
+    return {'method': 'POST', 'path': 'api/v1/orders/12345?currency=EUR', 'headers': make_headers(),
+            'body': body, 'cookies': {}}
+
+
+def make_expectations(count):
+    """
+    :return: list of expectations with regex and literal patterns. Only the last one matches request
+    """
+    expectations = []
+    for i in range(count - 1):
+        path = r'^api/v1/service%s/[0-9]+' % i if i % 2 == 0 else 'api/v1/service%s/items' % i
+        expectations.append({'key': 'exp%s' % i, 'request': {'method': 'POST', 'path': path},
+                             'response': {'httpcode': 200, 'body': '<result>%s</result>' % i}, 'priority': i % 3})
+    expectations.append({'key': 'orders', 'request': {'method': 'POST', 'path': r'^api/v1/orders/[0-9]+',
+                                                      'body': '<customer>12345</customer>'},
+                         'response': {'httpcode': 200, 'body': '<result>ok</result>'}})
+    return expectations
+
+
+@benchmark('matcher.is_expectation_match_request.xml')
+def matcher_xml():
+    request = make_request(make_xml_body())
+    pattern = {'method': 'POST', 'path': r'^api/v1/orders/[0-9]+', 'body': '<customer>12345</customer>',
+               'headers': {'Host': 'api.example.com'}}
+    yield lambda: ExpectationMatcher.is_expectation_match_request(pattern, request)
+
+
+@benchmark('matcher.is_expectation_match_request.json')
+def matcher_json():
+    request = make_request(make_json_body())
+    pattern = {'method': 'POST', 'path': 'api/v1/orders', 'body': r'"customer":\s*12345'}
+    yield lambda: ExpectationMatcher.is_expectation_match_request(pattern, request)
+
+
+@benchmark('matcher.request_pattern.is_match.xml')
+def request_pattern_xml():
+    request = make_request(make_xml_body())
+    expectation = Expectation({'request': {'method': 'POST', 'path': r'^api/v1/orders/[0-9]+',
+                                           'body': '<customer>12345</customer>',
+                                           'headers': {'Host': 'api.example.com'}}})
+    yield lambda: expectation.request.is_match(request)
+
+
+def expectation_manager_benchmark(method_name, count):
+    def function():
+        expectation_manager = ExpectationManager()
+        for expectation in make_expectations(count):
+            expectation_manager.add(dict(expectation, unlimited=True))
+        request = make_request(make_xml_body())
+        method = getattr(expectation_manager, method_name)
+        yield lambda: method(request)
+        expectation_manager.clear()
+
+    return function
+
+
+for method_name in ('get_matched_expectations_for_request', 'get_expectation_for_request'):
+    for count_of_expectations in (10, 1000, 50000):
+        benchmark('manager.%s.%s' % (method_name, count_of_expectations))(
+            expectation_manager_benchmark(method_name, count_of_expectations))
+
+
+@benchmark('extensions.order_by_priority.1000')
+def order_by_priority():
+    expectations = make_expectations(1000)
+    yield lambda: Extensions.order_by_priority(expectations)
+
+
+@benchmark('log_container.add')
+def log_container_add():
+    log_container = LogContainer(1000)
+    request = make_request(make_xml_body())
+    yield lambda: log_container.add({'request': request}, method='POST', path='api/v1/orders/12345')
+    log_container.close()
+
+
+@benchmark('log_container.update_last_with_kv')
+def log_container_update_last_with_kv():
+    log_container = LogContainer(1000)
+    log_container.add({'request': make_request(make_xml_body())})
+    response = {'status_code': 200, 'text': '<result>ok</result>', 'headers': {}}
+    yield lambda: log_container.update_last_with_kv('response', response)
+    log_container.close()
+
+
+@benchmark('json_logging.info')
+def json_logging_info():
+    null_stream = open(os.devnull, 'w')
+    logger = logging.getLogger('flamock-micro-benchmark')
+    logger.handlers = [logging.StreamHandler(null_stream)]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    previous_logger = JsonLogging.logger
+    JsonLogging.logger = logger
+    headers = make_headers()
+    try:
+        yield lambda: JsonLogging.info("Log id %s for request %s %s headers: %s", 10, 'POST', 'api/v1/orders', headers)
+    finally:
+        JsonLogging.logger = previous_logger
+        null_stream.close()
+
+
+def to_flask_response_benchmark(is_static):
+    def function():
+        app = FlaskFactory.flask_factory()
+        expected_response = {'httpcode': 200, 'body': make_json_body(), 'headers': {'Content-Type': 'application/json'}}
+        with app.test_request_context(headers={'Accept-Encoding': 'gzip'}):
+            if is_static:
+                response = CustomResponse.from_expected_response(expected_response, is_static=True)
+                yield response.to_flask_response
+            else:
+                yield lambda: CustomResponse.from_expected_response(expected_response).to_flask_response()
+
+    return function
+
+
+benchmark('custom_response.to_flask_response.dynamic')(to_flask_response_benchmark(False))
+benchmark('custom_response.to_flask_response.static')(to_flask_response_benchmark(True))
+
+
+def measure(function, repeat):
+    """
+    :param function: benchmarked function without arguments
+    :param repeat: count of runs
+    :return: dict with count of calls per run and min and median time of call in microseconds
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    times = [duration / number * 1e6 for duration in timer.repeat(repeat, number)]
+    return {"number": number, "min_us": round(min(times), 3), "median_us": round(statistics.median(times), 3)}
+
+
+def run(name_filter=None, repeat=5):
+    """
+    :param name_filter: substring of names of benchmarks to run. None - all benchmarks
+    :return: dict with <name: result of measure>
+    """
+    results = {}
+    for name, make_function in BENCHMARKS:
+        if name_filter is not None and name_filter not in name:
+            continue
+        with make_function() as function:
+            results[name] = measure(function, repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    :param results: dict from run
+    :param baseline: dict from run, saved earlier
+    :param threshold: allowed slowdown in percents
+    :return: list of tuples (name, baseline min time, current min time, change in percents, is_slower)
+     for benchmarks which are in both results
+    """
+    comparison = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base_time = baseline[name]['min_us']
+        change = (result['min_us'] - base_time) / base_time * 100 if base_time > 0 else 0.0
+        comparison.append((name, base_time, result['min_us'], round(change, 1), change > threshold))
+    return comparison
+
+
+if __name__ == '__main__':
+    argument_parser = ArgumentParser(description='Flamock micro-benchmarks')
+    argument_parser.add_argument("--filter", type=str, default=None, help="Run benchmarks with substring in name")
+    argument_parser.add_argument("--repeat", type=int, default=5, help="Count of runs of each benchmark")
+    argument_parser.add_argument("--save", type=str, nargs='?', const=BASELINE_PATH, default=None,
+                                 help="Save results as baseline to file (%s by default)" % BASELINE_PATH)
+    argument_parser.add_argument("--compare", type=str, nargs='?', const=BASELINE_PATH, default=None,
+                                 help="Compare results with baseline from file (%s by default)" % BASELINE_PATH)
+    argument_parser.add_argument("--threshold", type=float, default=20,
+                                 help="Allowed slowdown against baseline in percents")
+    args = argument_parser.parse_args()
+
+    results = run(args.filter, args.repeat)
+    is_slower = False
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)['benchmarks']
+        print("%-50s %12s %12s %8s" % ('benchmark', 'baseline us', 'min us', 'change'))
+        for name, base_time, time, change, is_slower_than_baseline in compare(results, baseline, args.threshold):
+            print("%-50s %12s %12s %7s%%%s" % (name, base_time, time, change,
+                                               ' SLOWER' if is_slower_than_baseline else ''))
+            is_slower = is_slower or is_slower_than_baseline
+    else:
+        print("%-50s %12s %12s %10s" % ('benchmark', 'median us', 'min us', 'calls'))
+        for name, result in results.items():
+            print("%-50s %12s %12s %10s" % (name, result['median_us'], result['min_us'], result['number']))
+    if args.save is not None:
+        if args.filter is not None and os.path.exists(args.save):
+            with open(args.save) as file:
+                saved = json.load(file)['benchmarks']
+            results = dict(saved, **results)
+        with open(args.save, 'w') as file:
+            json.dump({"python": sys.version.split()[0], "benchmarks": results}, file, indent=2, sort_keys=True)
+    sys.exit(1 if is_slower else 0)
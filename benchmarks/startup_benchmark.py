@@ -0,0 +1,124 @@
+"""
+Cold start of flamock: time to import flamock modules, time until port accepts connections and
+time until the first 200 from /flamock/status (flamock is ready). Every run is a new python process,
+the median of runs is reported. Synthetic expectations are passed with --expectations, as CI pipelines do
+
+Usage: python -m benchmarks.startup_benchmark [--runs 5] [--expectations 100] [--output startup.json]
+"""
+import http.client
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+
+from benchmarks.load_benchmark import ROOT_DIRECTORY, get_commit, get_free_port, make_expectations
+
+IMPORT_SCRIPT = "import time; start_time = time.perf_counter(); import flask_factory; " \
+                "print(time.perf_counter() - start_time)"
+
+
+def measure_import(with_requests=False):
+    """
+    :param with_requests: if true, modules needed for forwarding are imported too
+    :return: seconds to import flamock modules in a new process
+    """
+    script = IMPORT_SCRIPT if not with_requests else IMPORT_SCRIPT.replace('import flask_factory',
+                                                                          'import flask_factory, requests')
+    output = subprocess.check_output([sys.executable, '-c', script], cwd=ROOT_DIRECTORY)
+    return float(output)
+
+
+def is_port_open(port):
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=0.1):
+            return True
+    except OSError:
+        return False
+
+
+def get_status(port):
+    """
+    :return: status code of /flamock/status or None if flamock doesn't answer
+    """
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+    try:
+        connection.request('GET', '/flamock/status')
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    except OSError:
+        return None
+    finally:
+        connection.close()
+
+
+def measure_start(expectations, timeout=30):
+    """
+    :param expectations: list of expectations for --expectations argument
+    :return: tuple (seconds until port is open, seconds until the first 200 from status)
+    """
+    port = get_free_port()
+    arguments = [sys.executable, os.path.join(ROOT_DIRECTORY, 'flamock.py'), '--port', str(port), '--loglevel', '40']
+    if len(expectations) > 0:
+        arguments += ['--expectations', json.dumps(expectations)]
+    start_time = time.perf_counter()
+    process = subprocess.Popen(arguments, cwd=ROOT_DIRECTORY, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        port_time = None
+        while time.perf_counter() - start_time < timeout:
+            if process.poll() is not None:
+                raise RuntimeError("Flamock exited with code %s" % process.returncode)
+            if port_time is None and is_port_open(port):
+                port_time = time.perf_counter() - start_time
+            if port_time is not None and get_status(port) == 200:
+                return port_time, time.perf_counter() - start_time
+            time.sleep(0.002)
+        raise RuntimeError("Flamock wasn't ready in %s seconds" % timeout)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def run(count_of_runs, count_of_expectations):
+    """
+    :return: dict with environment and median times in ms
+    """
+    expectations = make_expectations(count_of_expectations, {'literal': 0.6, 'regex': 0.3, 'headers': 0.1})
+    imports = [measure_import() for i in range(count_of_runs)]
+    imports_with_requests = [measure_import(with_requests=True) for i in range(count_of_runs)]
+    starts = [measure_start(expectations) for i in range(count_of_runs)]
+
+    def median_ms(values):
+        return round(statistics.median(values) * 1000, 1)
+
+    return {"commit": get_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": {"runs": count_of_runs, "expectations": count_of_expectations},
+            "import_ms": median_ms(imports),
+            "import_with_requests_ms": median_ms(imports_with_requests),
+            "port_open_ms": median_ms([port_time for port_time, _ in starts]),
+            "first_200_ms": median_ms([ready_time for _, ready_time in starts])}
+
+
+if __name__ == '__main__':
+    argument_parser = ArgumentParser(description='Flamock startup benchmark')
+    argument_parser.add_argument("--runs", type=int, default=5, help="Count of runs")
+    argument_parser.add_argument("--expectations", type=int, default=100,
+                                 help="Count of synthetic expectations passed with --expectations")
+    argument_parser.add_argument("--output", type=str, default=None, help="File to write results in JSON")
+    args = argument_parser.parse_args()
+
+    result = run(args.runs, args.expectations)
+    print("import of flamock modules: %s ms (%s ms with requests)" % (result['import_ms'],
+                                                                       result['import_with_requests_ms']))
+    print("port is open after %s ms, the first 200 from status after %s ms" % (result['port_open_ms'],
+                                                                              result['first_200_ms']))
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(result, file, indent=2)
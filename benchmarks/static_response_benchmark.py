@@ -0,0 +1,42 @@
+"""
+Cost of one hit of 'response' expectation: making custom response and converting it to flask response.
+Expectation added to expectation manager has prepared static response. Dynamic response is built per hit
+
+Usage: python -m benchmarks.static_response_benchmark [--hits 10000]
+"""
+import time
+from argparse import ArgumentParser
+
+from custom_reponse import CustomResponse
+from expectation import Expectation
+from flask_factory import FlaskFactory
+
+BODY_SIZES = [('small', 100), ('1 MB', 1024 * 1024)]
+
+
+def run(flask_app, make_response, count_of_hits):
+    """
+    :param make_response: function, which makes custom response for hit
+    :return: mean cost of hit in microseconds
+    """
+    with flask_app.test_request_context():
+        start_time = time.perf_counter()
+        for i in range(count_of_hits):
+            make_response().to_flask_response()
+        return (time.perf_counter() - start_time) / count_of_hits * 1e6
+
+
+if __name__ == '__main__':
+    argument_parser = ArgumentParser(description='Flamock static response benchmark')
+    argument_parser.add_argument("--hits", type=int, default=10000, help="Count of hits for each body size")
+    args = argument_parser.parse_args()
+
+    app = FlaskFactory.flask_factory()
+    for name, size in BODY_SIZES:
+        expected_response = {'httpcode': 200, 'body': 'a' * size, 'headers': {'X-Mock': 'flamock'}}
+        expectation = Expectation({'response': expected_response})
+        print("%s body, per hit: dynamic %.1f us, static %.1f us" % (
+            name,
+            run(app, lambda: CustomResponse.from_expected_response(expected_response), args.hits),
+            run(app, lambda: app.response_manager.apply_action_from_expectation_to_request(expectation, {}),
+                args.hits)))
@@ -1,10 +1,24 @@
-from requests.status_codes import codes
+import gzip
+import zlib
+
+from flask import request
+from werkzeug.utils import get_content_type
+
+from status_codes import codes
+from throttle import Throttle
 
 
 class CustomResponse(object):
+    COMPRESSORS = {'gzip': lambda body: gzip.compress(body, 6, mtime=0),
+                   'deflate': lambda body: zlib.compress(body, 6)}
+
     _status_code = codes.ok
     _text = ''
     _headers = {}
+    _is_static = False
+    _encodings = ()  # content encodings which static response can be compressed with
+    _variants = None  # dict with <content encoding or None: (tuple with body, list of headers)> of static response
+    throttle = None  # throttle of body or None
     flask_app = None
 
     @property
@@ -27,6 +41,32 @@ class CustomResponse(object):
         else:
             self._headers = headers
 
+    @classmethod
+    def from_expected_response(cls, expected_response, is_static=False):
+        """
+        :param expected_response: 'response' field of expectation
+        :param is_static: if true, response is going to be reused for many requests.
+         Its body and headers are encoded once, on the first conversion to flask response.
+         Field 'compress' of static response (true or list of content encodings) enables compressed variants
+        :return: custom response
+        :raise ValueError: if content encoding in 'compress' is not supported
+        """
+        response = cls(text=expected_response['body'] if 'body' in expected_response else "",
+                       status_code=expected_response['httpcode'] if 'httpcode' in expected_response else codes.ok,
+                       headers=expected_response['headers'] if 'headers' in expected_response else {})
+        response._is_static = is_static and isinstance(response._text, (str, bytes))
+        if response._is_static:
+            response._variants = {}
+            compress = expected_response.get('compress', False)
+            if compress is True:
+                response._encodings = tuple(cls.COMPRESSORS.keys())
+            elif isinstance(compress, list):
+                unsupported = [encoding for encoding in compress if encoding not in cls.COMPRESSORS]
+                if len(unsupported) > 0:
+                    raise ValueError("Content encodings %s are not supported" % unsupported)
+                response._encodings = tuple(compress)
+        return response
+
     def __str__(self):
         return "status_code: %s, text: %s, headers: %s" % (
             self._status_code,
@@ -39,5 +79,45 @@ class CustomResponse(object):
                 "headers": self._headers}
 
     def to_flask_response(self):
+        if self._is_static:
+            encoding = request.accept_encodings.best_match(self._encodings) if len(self._encodings) > 0 else None
+            variant = self._variants.get(encoding)
+            if variant is None:
+                variant = self._variants[encoding] = self._prepare(encoding)
+            return self._throttled(self.flask_app.response_class(variant[0], self._status_code, variant[1]))
         resp = self.flask_app.make_response((self._text, self._status_code, dict(self._headers)))
+        return self._throttled(resp)
+
+    def _throttled(self, resp):
+        """
+        :param resp: flask response
+        :return: the same response with body sent through throttle, if it is set.
+         If server sends throttled responses by scheduler, throttle is passed to server in WSGI environ
+        """
+        if self.throttle is None:
+            return resp
+        if Throttle.ENVIRON_KEY in request.environ:
+            request.environ[Throttle.ENVIRON_KEY] = self.throttle
+        else:
+            resp.response = self.throttle.wrap(resp.response)
         return resp
+
+    def _prepare(self, encoding=None):
+        """
+        Encodes body and makes final list of headers, as flask does for str body
+        :param encoding: content encoding to compress body with or None
+        :return: tuple (tuple with encoded body, list of headers)
+        """
+        response_class = self.flask_app.response_class
+        body = self._text.encode() if isinstance(self._text, str) else self._text
+        ignored_headers = ('content-length', 'content-encoding') if len(self._encodings) > 0 else ('content-length',)
+        headers = [(key, str(value)) for key, value in self._headers.items() if key.lower() not in ignored_headers]
+        if not any(key.lower() == 'content-type' for key, value in headers):
+            headers.append(('Content-Type', get_content_type(response_class.default_mimetype, 'utf-8')))
+        if len(self._encodings) > 0:
+            headers.append(('Vary', 'Accept-Encoding'))
+        if encoding is not None:
+            body = self.COMPRESSORS[encoding](body)
+            headers.append(('Content-Encoding', encoding))
+        headers.append(('Content-Length', str(len(body))))
+        return (body,), headers
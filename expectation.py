@@ -0,0 +1,148 @@
+import copy
+import hashlib
+import json
+import sys
+
+from custom_reponse import CustomResponse
+from expectation_matcher import RequestPattern
+from file_body import FileBody, FileResponse
+from response_template import ResponseTemplate
+from status_codes import codes
+from throttle import Throttle
+
+
+class Expectation(object):
+    """
+    Compact representation of expectation. Only fields used for matching and actions are kept as objects:
+    request pattern with shared compiled regexes, interned strings and response prepared once, when expectation
+    is added. Original expectation is kept as compact JSON and is restored by to_dict. Request and text body
+    of response are kept out of JSON: request is kept as dict, so filters don't decode JSON, and body is
+    the same string, which response is made of, so big body isn't copied.
+    Response with 'template': true is compiled to response template instead of static response
+    """
+    __slots__ = ('_source', '_request_as_dict', '_response_body', 'request', 'priority', 'delay', 'tags', 'forward',
+                 'has_response', 'static_response', 'response_template', 'forward_throttle')
+
+    def __init__(self, expectation_as_dict, body_file_dir=None):
+        """
+        :param expectation_as_dict: expectation as it was posted
+        :param body_file_dir: directory, which 'body_file' of response can be read from.
+         None - 'body_file' is not allowed
+        :raise OSError: if 'body_file' of response can't be read
+        :raise ValueError: if request is not object, content encoding in 'compress' of response is not supported,
+         throttle or template is not valid, 'body_file' is not allowed or is out of body_file_dir
+        """
+        self._request_as_dict = None
+        self._response_body = None
+        self._source = self._dump_source(expectation_as_dict)
+        self.request = RequestPattern(expectation_as_dict['request']) if 'request' in expectation_as_dict else None
+        self.priority = expectation_as_dict['priority'] if 'priority' in expectation_as_dict else 0
+        self.delay = expectation_as_dict.get('delay')
+        self.tags = tuple(sys.intern(tag) for tag in expectation_as_dict.get('tags', []) if isinstance(tag, str))
+        self.forward = self._intern(expectation_as_dict['forward']) if 'forward' in expectation_as_dict else None
+        self.has_response = 'response' in expectation_as_dict
+        self.static_response = None
+        self.response_template = None
+        self.forward_throttle = None
+
+        expected_response = expectation_as_dict.get('response')
+        if isinstance(expected_response, dict) and expected_response.get('template', False):
+            if 'body_file' in expected_response:
+                raise ValueError("Response with 'body_file' can't be template")
+            throttle = Throttle.from_dict(expected_response['throttle']) if 'throttle' in expected_response else None
+            self.response_template = ResponseTemplate(expected_response, expectation_as_dict.get('request'), throttle)
+        elif isinstance(expected_response, dict):
+            self.static_response = self.make_response(expected_response, is_static=True, body_file_dir=body_file_dir)
+        if isinstance(self.forward, dict) and 'throttle' in self.forward:
+            self.forward_throttle = Throttle.from_dict(self.forward['throttle'])
+
+    @staticmethod
+    def fingerprint(expectation_as_dict):
+        """
+        :param expectation_as_dict: expectation as it was posted
+        :return: hash of canonical JSON of expectation. The same for any order of fields
+        """
+        canonical = json.dumps(expectation_as_dict, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+    def _dump_source(self, expectation_as_dict):
+        """
+        Keeps request and text body of response as objects and the rest of expectation as JSON.
+        Their fields are null in JSON, so order of fields is kept
+        :return: compact JSON of expectation in bytes
+        """
+        if isinstance(expectation_as_dict.get('request'), dict):
+            self._request_as_dict = copy.deepcopy(expectation_as_dict['request'])
+            expectation_as_dict = dict(expectation_as_dict, request=None)
+        expected_response = expectation_as_dict.get('response')
+        if isinstance(expected_response, dict) and isinstance(expected_response.get('body'), str):
+            self._response_body = expected_response['body']
+            expectation_as_dict = dict(expectation_as_dict, response=dict(expected_response, body=None))
+        return json.dumps(expectation_as_dict, separators=(',', ':'), ensure_ascii=False, default=str).encode()
+
+    @property
+    def request_as_dict(self):
+        """
+        :return: 'request' field of expectation as it was posted or None. It must not be modified
+        """
+        return self._request_as_dict
+
+    @classmethod
+    def _intern(cls, value):
+        """
+        :return: copy of dict with interned strings
+        """
+        if isinstance(value, str):
+            return sys.intern(value)
+        if isinstance(value, dict):
+            return {cls._intern(key): cls._intern(item) for key, item in value.items()}
+        return value
+
+    def to_dict(self):
+        """
+        :return: expectation as it was posted
+        """
+        expectation_as_dict = json.loads(self._source)
+        if self._request_as_dict is not None:
+            expectation_as_dict['request'] = copy.deepcopy(self._request_as_dict)
+        if self._response_body is not None:
+            expectation_as_dict['response']['body'] = self._response_body
+        return expectation_as_dict
+
+    def __eq__(self, other):
+        if isinstance(other, Expectation):
+            return (self._source, self._request_as_dict, self._response_body) == \
+                (other._source, other._request_as_dict, other._response_body)
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def close(self):
+        """
+        Releases memory map of 'body_file'. Called when expectation is removed or replaced
+        """
+        if isinstance(self.static_response, FileResponse):
+            self.static_response.file_body.close()
+
+    @staticmethod
+    def make_response(expected_response, is_static=False, body_file_dir=None):
+        """
+        :param expected_response: 'response' field of expectation
+        :param is_static: if true, response is going to be reused for many requests
+        :param body_file_dir: directory, which 'body_file' can be read from
+        :return: custom response. Body is read from 'body_file' if it is set
+        """
+        if 'body_file' in expected_response:
+            response = FileResponse(FileBody(expected_response['body_file'], body_file_dir),
+                                    expected_response['httpcode'] if 'httpcode' in expected_response else codes.ok,
+                                    expected_response['headers'] if 'headers' in expected_response else {})
+        else:
+            response = CustomResponse.from_expected_response(expected_response, is_static)
+        if 'throttle' in expected_response:
+            response.throttle = Throttle.from_dict(expected_response['throttle'])
+        return response
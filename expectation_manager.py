@@ -1,43 +1,121 @@
-import hashlib
+import heapq
+import itertools
 import json
-
-from requests.status_codes import codes
+import threading
+import time
 
 from custom_reponse import CustomResponse
-from expectation_matcher import ExpectationMatcher
+from expectation import Expectation
+from expectation_matcher import ExpectationMatcher, MatchCosts
 from json_logging import JsonLogging
+from status_codes import codes
 
 
 class ExpectationManager:
     """
     Class for managing set of expectations
 
+    Optional lifetime fields of expectation:
+     - times # int. Expectation is removed after it was used given count of times
+     - ttl # number of seconds. Expectation is removed when ttl is over
+     - unlimited # bool. If true, 'times' is ignored
+
+    Optional field 'tags' (list of strings) allows to remove group of expectations at once
+
+    Time of matching is accounted per expectation. If match_time_budget is set, time is measured as CPU time
+    of thread, so waiting for GIL or preemption isn't counted, and expectation which was matched longer than
+    budget SLOW_STREAK times in a row is flagged as slow and skipped until it is added again
+
     todo: fix return types
     """
-    _expectations = None  # dict with <md5: json_object>
+    _expectations = None  # dict with <key: Expectation>
+    _remaining_hits = None  # dict with <key: int>. Only for expectations with 'times'
+    _expire_at = None  # dict with <key: (expire_at, seq)>. Only for expectations with 'ttl'
+    _expiry_heap = None  # heap with (expire_at, seq, key)
+    _keys_by_tag = None  # dict with <tag: set of key>
+    _hits = None  # dict with <key: count of hits by requests to this manager>. Kept after expectation is removed
+    _slow_keys = None  # dict with <key: duration of matching in ns>. Expectations skipped by match_time_budget
+    _slow_streaks = None  # dict with <key: count of the last matchings in a row, which were longer than budget>
+    body_file_dir = None  # directory, which 'body_file' of responses is read from. None - 'body_file' is not allowed
+    match_time_budget = None  # max time of matching of one expectation in seconds. None - unlimited
+    SLOW_STREAK = 3
+    near_miss_max_evaluations = 1000  # max count of expectations evaluated to find near misses
+    NEAR_MISS_VALUE_LIMIT = 100  # max count of chars of expected and actual values in near misses
     _logger = JsonLogging
+    _clock = time.monotonic
+    _match_clock = time.perf_counter_ns
+    _budget_clock = time.thread_time_ns  # slower than perf_counter_ns, so it is used only with match_time_budget
 
-    def __init__(self):
+    def __init__(self, body_file_dir=None):
+        self.body_file_dir = body_file_dir
         self._expectations = dict()
+        self._remaining_hits = dict()
+        self._expire_at = dict()
+        self._expiry_heap = []
+        self._keys_by_tag = dict()
+        self._hits = dict()
+        self._slow_keys = dict()
+        self._slow_streaks = dict()
+        self.match_costs = MatchCosts()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
 
     def clear(self):
         """
         :return: custom response
         """
-        self._expectations.clear()
+        with self._lock:
+            for expectation in self._expectations.values():
+                expectation.close()
+            self._expectations.clear()
+            self._remaining_hits.clear()
+            self._expire_at.clear()
+            self._expiry_heap = []
+            self._keys_by_tag.clear()
+            self._hits.clear()
+            self._slow_keys.clear()
+            self._slow_streaks.clear()
+        self.match_costs.clear()
 
     def get_expectations(self):
         """
 
         :return: expectations as dict. Useful for inner operations
         """
+        self._remove_expired()
         return self._expectations.copy()
 
     def get_expectations_as_response(self):
         """
         :return: Expectations as custom response
         """
-        return CustomResponse(str(self._expectations))
+        return CustomResponse(str(self.get_expectations()))
+
+    def get_remaining_hits(self, key):
+        """
+        :param key: key of expectation
+        :return: how many times expectation can be used yet. None if it is unlimited or doesn't exist
+        """
+        return self._remaining_hits.get(key)
+
+    def get_hit_count(self, key):
+        """
+        :param key: key of expectation
+        :return: how many times expectation was used by requests to this manager since it was added.
+         Exhausted expectations and expectations of fallback manager are counted too
+        """
+        return self._hits.get(key, 0)
+
+    def get_match_costs_as_response(self, count, sort='total'):
+        """
+        :param count: max count of expectations in result
+        :param sort: 'total' or 'max'. Field to find the slowest expectations by
+        :return: custom response with JSON list of the slowest expectations
+        """
+        top = self.match_costs.get_top(count, sort)
+        for cost in top:
+            cost['skipped'] = cost['key'] in self._slow_keys
+        return CustomResponse(json.dumps(top), headers={'Content-Type': 'application/json'})
 
     def remove(self, dict_with_key):
         """
@@ -45,24 +123,103 @@ class ExpectationManager:
         :param dict_with_key: dictionary with field 'key' and md5=value
         :return: custom response
         """
-        self._logger.debug("arg: %s" % str(dict_with_key))
-        if 'key' in dict_with_key and dict_with_key['key'] in self._expectations:
-            del (self._expectations[dict_with_key['key']])
-            self._logger.info("Expectation with key %s was removed" % dict_with_key)
+        self._logger.debug("arg: %s", dict_with_key)
+        with self._lock:
+            is_removed = 'key' in dict_with_key and self._delete(dict_with_key['key'])
+        if is_removed:
+            self._logger.info("Expectation with key %s was removed", dict_with_key)
             return CustomResponse("Expectation with key %s was removed" % dict_with_key)
-        self._logger.error("Expectation with key %s was NOT removed" % dict_with_key)
+        self._logger.error("Expectation with key %s was NOT removed", dict_with_key)
         return CustomResponse("Error! Expectation with key %s was NOT removed" % dict_with_key, codes.bad)
 
+    def remove_by_filter(self, dict_with_filter):
+        """
+        Removes all expectations which match filter. Fields of filter are combined with AND:
+         - key_prefix # string. Key of expectation starts with it
+         - tag # string. Expectation has this tag
+         - request # request pattern. Fields of expectation's request match it as actual request
+        :param dict_with_filter: dictionary with at least one field of filter
+        :return: custom response
+        """
+        key_prefix = dict_with_filter.get('key_prefix')
+        tag = dict_with_filter.get('tag')
+        request_filter = dict_with_filter.get('request')
+        if key_prefix is None and tag is None and request_filter is None:
+            self._logger.error("Filter for removing expectations is empty: %s", dict_with_filter)
+            return CustomResponse("Error! Filter must have 'key_prefix', 'tag' or 'request'", codes.bad)
+
+        with self._lock:
+            if tag is not None:
+                candidate_keys = self._keys_by_tag.get(tag, set())
+            else:
+                candidate_keys = self._expectations.keys()
+            keys_to_remove = set()
+            for key in candidate_keys:
+                expectation = self._expectations[key]
+                if key_prefix is not None and not str(key).startswith(key_prefix):
+                    continue
+                if request_filter is not None and not ExpectationMatcher.is_expectation_match_request(
+                        request_filter, expectation.request_as_dict or {}):
+                    continue
+                keys_to_remove.add(key)
+
+            if len(keys_to_remove) > 0:
+                for key in keys_to_remove:
+                    self._forget(key)
+                self._expectations = {key: expectation for key, expectation in self._expectations.items()
+                                      if key not in keys_to_remove}
+
+        self._logger.info("%s expectations were removed by filter %s", len(keys_to_remove), dict_with_filter)
+        return CustomResponse("%s expectations were removed" % len(keys_to_remove))
+
     def add(self, expectation_as_dict):
         if 'key' in expectation_as_dict:
             key = expectation_as_dict['key']
         else:
-            key = hashlib.md5(str(expectation_as_dict).encode()).hexdigest()
+            key = Expectation.fingerprint(expectation_as_dict)
+
+        times = None
+        if 'times' in expectation_as_dict and not expectation_as_dict.get('unlimited', False):
+            times = expectation_as_dict['times']
+            if not isinstance(times, int) or isinstance(times, bool) or times <= 0:
+                self._logger.error("Field 'times' must be positive integer. Expectation with key '%s'", key)
+                return CustomResponse("Error! Field 'times' must be positive integer", codes.bad)
 
-        if key in self._expectations:
-            self._logger.warning("Expectation with key '%s' already exists. Expectation will be updated" % key)
+        ttl = None
+        if 'ttl' in expectation_as_dict:
+            ttl = expectation_as_dict['ttl']
+            if not isinstance(ttl, (int, float)) or isinstance(ttl, bool) or ttl <= 0:
+                self._logger.error("Field 'ttl' must be positive number. Expectation with key '%s'", key)
+                return CustomResponse("Error! Field 'ttl' must be positive number", codes.bad)
 
-        self._expectations[key] = expectation_as_dict
+        tags = expectation_as_dict.get('tags', [])
+        if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+            self._logger.error("Field 'tags' must be list of strings. Expectation with key '%s'", key)
+            return CustomResponse("Error! Field 'tags' must be list of strings", codes.bad)
+
+        try:
+            expectation = Expectation(expectation_as_dict, self.body_file_dir)
+        except (OSError, ValueError) as e:
+            self._logger.error("Can't prepare response of expectation with key '%s': %s", key, e)
+            return CustomResponse("Error! Can't prepare response: %s" % e, codes.bad)
+
+        with self._lock:
+            if key in self._expectations:
+                self._logger.warning("Expectation with key '%s' already exists. Expectation will be updated", key)
+                self._delete(key)
+
+            self._expectations[key] = expectation
+            self._hits.pop(key, None)
+            self.match_costs.remove(key)
+            if times is not None:
+                self._remaining_hits[key] = times
+            if ttl is not None:
+                expire_at = self._clock() + ttl
+                seq = next(self._seq)
+                self._expire_at[key] = (expire_at, seq)
+                heapq.heappush(self._expiry_heap, (expire_at, seq, key))
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
         return CustomResponse("Expectation has been added with key '%s'" % key)
 
     def json_to_dict(self, json_text):
@@ -70,7 +227,7 @@ class ExpectationManager:
         try:
             json_dict = json.loads(json_text)
         except Exception as e:
-            self._logger.error("Can't convert json to dict! Json %s" % json_text)
+            self._logger.error("Can't convert json to dict! Json %s", json_text)
             self._logger.exception(e)
             return json_dict, CustomResponse("Error! Can't convert json to dict! Json %s"
                                              "Exception: %s" % (json_text, str(e)), codes.bad)
@@ -85,14 +242,220 @@ class ExpectationManager:
         :param request: incoming request
         :return: list of all matched expectations in random order
         """
+        return [expectation for key, expectation in self._get_matched_items(request)]
 
+    def get_expectation_for_request(self, request, fallback=None):
+        """
+        Gets matched expectation with the highest priority and counts a hit for it in this manager,
+        even if expectation is from fallback. Expectation is removed when its 'times' are exhausted
+        :param request: incoming request
+        :param fallback: another expectation manager. Its expectations are also matched,
+         but have lower precedence for the same priority
+        :return: tuple (key, expectation). (None, None) if there is no matched expectation
+        """
+        matched_items = [(self, key, expectation) for key, expectation in self._get_matched_items(request)]
+        if fallback is not None:
+            matched_items.extend((fallback, key, expectation)
+                                 for key, expectation in fallback._get_matched_items(request))
+        matched_items.sort(key=lambda item: item[2].priority, reverse=True)
+        for manager, key, expectation in matched_items:
+            if manager._use(key, expectation):
+                with self._lock:
+                    self._hits[key] = self._hits.get(key, 0) + 1
+                return key, expectation
+        return None, None
+
+    def _get_matched_items(self, request):
+        """
+        :param request: incoming request
+        :return: list of tuples (key, expectation) of all matched expectations
+        """
+        self._remove_expired()
         if len(self._expectations) == 0:
             return []
 
-        list_matched_expectations = []
-        for key, expectation in self._expectations.items():
-            if 'request' not in expectation or ExpectationMatcher.is_expectation_match_request(expectation['request'],
-                                                                                               request):
-                list_matched_expectations.append(expectation)
-        self._logger.debug("Count of matched expectations: %s" % len(list_matched_expectations))
-        return list_matched_expectations
+        budget = None if self.match_time_budget is None else self.match_time_budget * 1e9
+        slow_keys = self._slow_keys
+        slow_streaks = self._slow_streaks
+        clock = self._match_clock if budget is None else self._budget_clock
+        list_matched_items = []
+        costs = self.match_costs.get_local_store()
+        for key, expectation in list(self._expectations.items()):
+            if expectation.request is None:
+                list_matched_items.append((key, expectation))
+                continue
+            if key in slow_keys:
+                continue
+            start_time = clock()
+            is_match = expectation.request.is_match(request)
+            duration = clock() - start_time
+            cost = costs.get(key)
+            if cost is None:
+                costs[key] = [1, duration, duration]
+            else:
+                cost[0] += 1
+                cost[1] += duration
+                if duration > cost[2]:
+                    cost[2] = duration
+            if budget is not None:
+                if duration > budget:
+                    if self._flag_slow(key, expectation, duration):
+                        continue
+                elif len(slow_streaks) > 0 and key in slow_streaks:
+                    slow_streaks.pop(key, None)
+            if is_match:
+                list_matched_items.append((key, expectation))
+        self._logger.debug("Count of matched expectations: %s", len(list_matched_items))
+        return list_matched_items
+
+    def get_near_misses(self, request, count, fallback=None):
+        """
+        Finds expectations, which are the closest to request without matched expectation.
+        Expectations are ordered by count of failed fields. At most near_miss_max_evaluations expectations
+        are evaluated. Slow expectations and expectations without request are skipped
+        :param request: incoming request
+        :param count: max count of expectations in result
+        :param fallback: another expectation manager. Its expectations are evaluated too
+        :return: list of dicts with key, priority, matched fields and failed fields with expected and actual values
+        """
+        candidates = []
+        count_of_evaluations = 0
+        for manager in (self, fallback):
+            if manager is None:
+                continue
+            slow_keys = manager._slow_keys
+            for key, expectation in list(manager._expectations.items()):
+                if count_of_evaluations >= self.near_miss_max_evaluations:
+                    break
+                if expectation.request is None or key in slow_keys:
+                    continue
+                count_of_evaluations += 1
+                matched_fields, failed_fields = expectation.request.get_failed_fields(request)
+                candidates.append((len(failed_fields), -len(matched_fields), count_of_evaluations,
+                                   key, expectation, matched_fields, failed_fields))
+        closest = heapq.nsmallest(count, candidates, key=lambda candidate: candidate[:3])
+        return [self._near_miss_to_dict(key, expectation, matched_fields, failed_fields, request)
+                for _, _, _, key, expectation, matched_fields, failed_fields in closest]
+
+    @classmethod
+    def _near_miss_to_dict(cls, key, expectation, matched_fields, failed_fields, request):
+        failed = []
+        for field in failed_fields:
+            expected_value = expectation.request.get_expected_value(field)
+            actual_value = request.get(field)
+            if isinstance(expected_value, dict) and isinstance(actual_value, dict):
+                expected_value = {name: value for name, value in expected_value.items()
+                                  if actual_value.get(name) != value}
+                actual_value = {name: actual_value.get(name) for name in expected_value}
+            failed.append({"field": field,
+                           "expected": cls._shorten(expected_value),
+                           "actual": cls._shorten(actual_value)})
+        return {"key": key, "priority": expectation.priority, "matched": matched_fields, "failed": failed}
+
+    @classmethod
+    def _shorten(cls, value):
+        """
+        :return: value with strings cut to NEAR_MISS_VALUE_LIMIT chars
+        """
+        if isinstance(value, str) and len(value) > cls.NEAR_MISS_VALUE_LIMIT:
+            return value[:cls.NEAR_MISS_VALUE_LIMIT] + '...'
+        if isinstance(value, dict):
+            return {name: cls._shorten(item) for name, item in value.items()}
+        return value
+
+    def _flag_slow(self, key, expectation, duration):
+        """
+        Counts matching of expectation longer than budget. After SLOW_STREAK such matchings in a row expectation is
+        marked as slow, so it is skipped by matching until it is added again
+        :return: True if expectation is marked as slow
+        """
+        with self._lock:
+            if self._expectations.get(key) is not expectation:
+                return False
+            if key in self._slow_keys:
+                return True
+            streak = self._slow_streaks.get(key, 0) + 1
+            if streak < self.SLOW_STREAK:
+                self._slow_streaks[key] = streak
+                return False
+            self._slow_streaks.pop(key, None)
+            self._slow_keys[key] = duration
+        self._logger.warning("Matching of expectation with key '%s' took %s ms %s times in a row. "
+                             "Expectation is skipped", key, duration / 1e6, streak)
+        return True
+
+    def _use(self, key, expectation):
+        """
+        Atomically decrements count of remaining hits of expectation
+        :return: False if expectation was exhausted or removed by another request. Otherwise - True
+        """
+        if key not in self._remaining_hits and key not in self._expire_at:
+            if self._expectations.get(key) is not expectation:
+                return False
+        else:
+            with self._lock:
+                if self._expectations.get(key) is not expectation:
+                    return False
+                if key in self._expire_at and self._expire_at[key][0] <= self._clock():
+                    self._delete(key)
+                    return False
+                if key in self._remaining_hits:
+                    self._remaining_hits[key] -= 1
+                    if self._remaining_hits[key] == 0:
+                        self._logger.info("Expectation with key '%s' is exhausted and was removed", key)
+                        self._delete(key)
+        return True
+
+    def _remove_expired(self):
+        """
+        Pops expired expectations from the top of expiry heap. Entries of removed or updated
+        expectations are skipped by sequence number
+        """
+        if len(self._expiry_heap) == 0 or self._expiry_heap[0][0] > self._clock():
+            return
+
+        with self._lock:
+            now = self._clock()
+            while len(self._expiry_heap) > 0 and self._expiry_heap[0][0] <= now:
+                expire_at, seq, key = heapq.heappop(self._expiry_heap)
+                if self._expire_at.get(key) == (expire_at, seq):
+                    self._logger.info("Expectation with key '%s' is expired and was removed", key)
+                    self._delete(key)
+
+    def _compact_expiry_heap(self):
+        """
+        Rebuilds expiry heap from live entries, when entries of removed or updated expectations outnumber them.
+        Otherwise such entries are kept until their time of expiration. Must be called under lock
+        """
+        if len(self._expiry_heap) > 2 * len(self._expire_at):
+            self._expiry_heap = [(expire_at, seq, key) for key, (expire_at, seq) in self._expire_at.items()]
+            heapq.heapify(self._expiry_heap)
+
+    def _delete(self, key):
+        """
+        Removes expectation with all its counters. Must be called under lock
+        :return: True if expectation existed
+        """
+        if key not in self._expectations:
+            return False
+        self._forget(key)
+        del self._expectations[key]
+        return True
+
+    def _forget(self, key):
+        """
+        Removes counters and index entries of expectation. Must be called under lock before expectation is removed
+        """
+        self._remaining_hits.pop(key, None)
+        if self._expire_at.pop(key, None) is not None:
+            self._compact_expiry_heap()
+        self._slow_keys.pop(key, None)
+        self._slow_streaks.pop(key, None)
+        self.match_costs.remove(key)
+        self._expectations[key].close()
+        for tag in self._expectations[key].tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if len(keys) == 0:
+                    del self._keys_by_tag[tag]
@@ -1,11 +1,53 @@
+import collections
+import heapq
 import re
+import sys
+import threading
+import weakref
 
 from json_logging import JsonLogging
 
 
 class ExpectationMatcher:
+    max_scan_length = None  # max count of chars of actual value scanned by regex pattern. None - unlimited
+
     _logger = JsonLogging
     _re_flags = re.DOTALL
+    _re_special_chars = frozenset('.^$*+?{}[]\\|()')
+    _compiled_patterns = weakref.WeakValueDictionary()  # dict with <pattern: compiled pattern> shared by expectations
+
+    @classmethod
+    def compile_pattern(cls, pattern):
+        """
+        Compiles pattern once for all expectations which use it
+        :param pattern: regex pattern or string
+        :return: interned string if pattern is literal or not valid regex. Otherwise - compiled regex
+        """
+        if cls._re_special_chars.isdisjoint(pattern):
+            return sys.intern(pattern)
+        compiled_pattern = cls._compiled_patterns.get(pattern)
+        if compiled_pattern is None:
+            try:
+                compiled_pattern = re.compile(pattern, cls._re_flags)
+            except re.error:
+                return sys.intern(pattern)
+            compiled_pattern = cls._compiled_patterns.setdefault(pattern, compiled_pattern)
+        return compiled_pattern
+
+    @classmethod
+    def search(cls, compiled_pattern, actual_value):
+        """
+        :param compiled_pattern: result of compile_pattern
+        :param actual_value: string
+        :return: True if actual value contains string or matches regex
+        """
+        if isinstance(compiled_pattern, str):
+            if cls.max_scan_length is None:
+                return compiled_pattern in actual_value
+            return actual_value.find(compiled_pattern, 0, cls.max_scan_length) >= 0
+        if cls.max_scan_length is None:
+            return compiled_pattern.search(actual_value) is not None
+        return compiled_pattern.search(actual_value, 0, cls.max_scan_length) is not None
 
     @classmethod
     def is_expectation_match_request(cls, request_exp, request_act):
@@ -21,16 +63,7 @@ class ExpectationMatcher:
             if attr in request_exp:
                 result = (attr in request_act) and cls.value_matcher(request_exp[attr], request_act[attr])
                 if result is False:
-                    cls._logger.debug(
-                        'Difference in {attribute}. expected: {expected_value}, actual: {actual_value}'.format(
-                            attribute=attr,
-                            expected_value=request_exp[attr],
-                            actual_value=request_act[attr] if attr in request_act else 'None')
-                    )
                     return False
-
-        cls._logger.debug('Requests are match expected: {expected_value}, actual: {actual_value}'.format(
-            expected_value=str(request_exp), actual_value=str(request_act)))
         return True
 
     @classmethod
@@ -43,9 +76,7 @@ class ExpectationMatcher:
         :return: true if actual value matches expected value or contains expected value as substring. Otherwise - false
         """
         try:
-            compiled_pattern = re.compile(expected_value, cls._re_flags)
-            search_result = compiled_pattern.search(actual_value)
-            return search_result is not None
+            return cls.search(cls.compile_pattern(expected_value), actual_value)
         except TypeError as e:
             cls._logger.exception(e)
             return expected_value in actual_value
@@ -79,3 +110,194 @@ class ExpectationMatcher:
             return cls.__value_matcher_dict(expected_value, actual_value)
         else:
             return False
+
+
+class RequestPattern(object):
+    """
+    'request' field of expectation with patterns compiled once. It is matched as ExpectationMatcher
+    matches dicts. Fields, which are absent in expectation, are None. Null fields are False and match nothing
+    """
+    FIELDS = ('method', 'path', 'body', 'headers')
+    __slots__ = FIELDS
+
+    def __init__(self, request_exp):
+        """
+        :param request_exp: request from expectation
+        :raise ValueError: if request is not dict
+        """
+        if not isinstance(request_exp, dict):
+            raise ValueError("Field 'request' must be object")
+        for field in self.FIELDS:
+            value = request_exp.get(field)
+            if isinstance(value, str):
+                value = ExpectationMatcher.compile_pattern(value)
+            elif isinstance(value, dict):
+                value = {sys.intern(key) if isinstance(key, str) else key:
+                         sys.intern(item) if isinstance(item, str) else item for key, item in value.items()}
+            elif value is None and field in request_exp:
+                value = False
+            setattr(self, field, value)
+
+    def is_match(self, request_act):
+        """
+        :param request_act: actual request
+        :return: True if all fields of actual request are match to pattern
+        """
+        for field in self.FIELDS:
+            expected_value = getattr(self, field)
+            if expected_value is not None and not self._is_field_match(expected_value, field, request_act):
+                return False
+        return True
+
+    def get_failed_fields(self, request_act):
+        """
+        Matches all fields without short-circuiting. Useful for diagnostics of requests without expectation
+        :param request_act: actual request
+        :return: tuple (list of matched fields, list of failed fields)
+        """
+        matched_fields = []
+        failed_fields = []
+        for field in self.FIELDS:
+            expected_value = getattr(self, field)
+            if expected_value is not None:
+                is_match = self._is_field_match(expected_value, field, request_act)
+                (matched_fields if is_match else failed_fields).append(field)
+        return matched_fields, failed_fields
+
+    @staticmethod
+    def _is_field_match(expected_value, field, request_act):
+        if field not in request_act:
+            return False
+        actual_value = request_act[field]
+        if isinstance(expected_value, (str, re.Pattern)):
+            return isinstance(actual_value, str) and ExpectationMatcher.search(expected_value, actual_value)
+        return ExpectationMatcher.value_matcher(expected_value, actual_value)
+
+    def get_expected_value(self, field):
+        """
+        :return: pattern of field as string or dict. None if field is absent or null
+        """
+        value = getattr(self, field)
+        if isinstance(value, re.Pattern):
+            return value.pattern
+        return value if value is not False else None
+
+
+class MatchCosts(object):
+    """
+    Accounting of time spent to match requests against expectations: count of evaluations,
+    cumulative and maximum time per key of expectation.
+    Every thread accumulates costs in its own store, as Metrics does, so there is no lock on request path.
+    Stores are merged on reading. Stores of finished threads are merged into one, when a new thread registers
+    its store, so count of stores is bounded by count of running threads
+    """
+    SORT_FIELDS = ('total', 'max')
+
+    def __init__(self):
+        self._local = threading.local()
+        self._stores = collections.deque()  # deque of tuples (thread, dict with <key: [count, total ns, max ns]>)
+        self._retired_store = {}
+        self._lock = threading.Lock()
+
+    def get_local_store(self):
+        """
+        :return: store of current thread - dict with <key: [count, total ns, max ns]>, which matching
+         updates in place
+        """
+        store = getattr(self._local, 'store', None)
+        if store is None:
+            store = {}
+            self._local.store = store
+            with self._lock:
+                self._retire_finished()
+                self._stores.append((threading.current_thread(), store))
+        return store
+
+    def add(self, durations):
+        """
+        :param durations: list of tuples (key of expectation, duration of matching in ns)
+        """
+        costs = self.get_local_store()
+        for key, duration in durations:
+            cost = costs.get(key)
+            if cost is None:
+                costs[key] = [1, duration, duration]
+            else:
+                cost[0] += 1
+                cost[1] += duration
+                if duration > cost[2]:
+                    cost[2] = duration
+
+    def remove(self, key):
+        with self._lock:
+            for store in self._get_all_stores():
+                store.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            for store in self._get_all_stores():
+                store.clear()
+
+    def get(self, key):
+        """
+        :return: dict with count, total_ms and max_ms of expectation. None if it wasn't evaluated
+        """
+        cost = self._collect().get(key)
+        return None if cost is None else self._cost_to_dict(key, cost)
+
+    def get_top(self, count, sort='total'):
+        """
+        :param count: max count of expectations in result
+        :param sort: 'total' or 'max'. Field to find the slowest expectations by
+        :return: list of dicts with key, count, total_ms and max_ms. The slowest expectation is the first
+        """
+        sort_index = 1 if sort == 'total' else 2
+        items = heapq.nlargest(count, self._collect().items(), key=lambda item: item[1][sort_index])
+        return [self._cost_to_dict(key, cost) for key, cost in items]
+
+    def _retire_finished(self):
+        """
+        Merges stores of finished threads into retired store. Must be called under lock
+        """
+        for i in range(len(self._stores)):
+            thread, store = self._stores.popleft()
+            if thread.is_alive():
+                self._stores.append((thread, store))
+            else:
+                self._merge(self._retired_store, store)
+
+    def _get_all_stores(self):
+        """
+        Must be called under lock
+        :return: list of stores
+        """
+        self._retire_finished()
+        return [self._retired_store] + [store for thread, store in list(self._stores)]
+
+    def _collect(self):
+        """
+        :return: dict with <key: [count, total ns, max ns]> merged over all threads
+        """
+        costs = {}
+        with self._lock:
+            for store in self._get_all_stores():
+                self._merge(costs, store)
+        return costs
+
+    @staticmethod
+    def _merge(target, source):
+        for key, (count, total, maximum) in source.copy().items():
+            cost = target.get(key)
+            if cost is None:
+                target[key] = [count, total, maximum]
+            else:
+                cost[0] += count
+                cost[1] += total
+                cost[2] = max(cost[2], maximum)
+
+    @staticmethod
+    def _cost_to_dict(key, cost):
+        return {"key": key,
+                "count": cost[0],
+                "total_ms": cost[1] / 1e6,
+                "max_ms": cost[2] / 1e6}
@@ -1,3 +1,7 @@
+import sys
+import types
+
+
 class Extensions:
     @classmethod
     def list_of_tuples_to_dict(cls, headers_list):
@@ -22,3 +26,60 @@ class Extensions:
     @staticmethod
     def remove_linebreaks(string_with_linebreaks):
         return string_with_linebreaks.replace('\r\n', ' ').replace('\r', ' ').replace('\n', ' ')
+
+    @staticmethod
+    def get_header(headers, name, default=None):
+        """
+        Gets header value with case-insensitive name
+        :param headers: dict with headers
+        :param name: name of header
+        :return: value of header or default
+        """
+        if name in headers:
+            return headers[name]
+        name = name.lower()
+        for key, value in headers.items():
+            if key.lower() == name:
+                return value
+        return default
+
+    @classmethod
+    def get_deep_size(cls, obj):
+        """
+        Approximate size of object with all nested dicts, lists and strings.
+        Attributes of objects (__slots__ and __dict__) are counted too
+        :param obj: any object
+        :return: size in bytes
+        """
+        seen = set()
+        size = 0
+        objects_to_check = [obj]
+        while len(objects_to_check) > 0:
+            current = objects_to_check.pop()
+            if id(current) in seen:
+                continue
+            seen.add(id(current))
+            size += sys.getsizeof(current)
+            if isinstance(current, dict):
+                objects_to_check.extend(current.keys())
+                objects_to_check.extend(current.values())
+            elif isinstance(current, (list, tuple, set, frozenset)):
+                objects_to_check.extend(current)
+            elif not isinstance(current, (type, types.ModuleType, types.FunctionType, types.MethodType)):
+                objects_to_check.extend(cls._get_attributes(current))
+        return size
+
+    @staticmethod
+    def _get_attributes(obj):
+        """
+        :return: values of attributes of object from __slots__ of its classes and from __dict__
+        """
+        values = []
+        for klass in type(obj).__mro__:
+            for name in klass.__dict__.get('__slots__', ()):
+                if name not in ('__dict__', '__weakref__') and hasattr(obj, name):
+                    values.append(getattr(obj, name))
+        instance_dict = getattr(obj, '__dict__', None)
+        if isinstance(instance_dict, dict):
+            values.append(instance_dict)
+        return values
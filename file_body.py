@@ -0,0 +1,162 @@
+import mimetypes
+import mmap
+import os
+import threading
+
+from flask import request
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.wsgi import FileWrapper
+
+from custom_reponse import CustomResponse
+from status_codes import codes
+
+
+class FileBody(object):
+    """
+    Body of response saved in file. File is described once, when expectation is added.
+    File must not be changed while expectation exists. Files are served only from directory for body files
+    """
+    BUFFER_SIZE = 64 * 1024
+
+    def __init__(self, path, directory):
+        """
+        :param path: path to file, relative to directory or absolute
+        :param directory: directory, which files can be served from. None - files are not allowed
+        :raise ValueError: if directory is not set or file is out of it
+        :raise OSError: if file can't be read
+        """
+        self.path = self.resolve_path(path, directory)
+        with open(self.path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            self.size = stat.st_size
+            self.mtime = stat.st_mtime
+            # shared by all requests, if server doesn't provide wsgi.file_wrapper
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if self.size > 0 else b''
+        self.etag = '%x-%x' % (stat.st_mtime_ns, self.size)
+        self.mimetype = mimetypes.guess_type(self.path)[0] or 'application/octet-stream'
+        self._lock = threading.Lock()
+        self._count_of_readers = 0
+        self._is_closed = False
+
+    @staticmethod
+    def resolve_path(path, directory):
+        """
+        :param path: path to file, relative to directory or absolute
+        :param directory: directory, which files can be served from. None - files are not allowed
+        :return: real path to file
+        :raise ValueError: if directory is not set or file is out of it
+        """
+        if directory is None:
+            raise ValueError("Field 'body_file' is allowed only if directory for body files is set")
+        real_directory = os.path.realpath(directory)
+        real_path = os.path.realpath(os.path.join(real_directory, path))
+        if os.path.commonpath([real_directory, real_path]) != real_directory:
+            raise ValueError("File '%s' is out of directory for body files" % path)
+        return real_path
+
+    def open(self, environ):
+        """
+        :param environ: WSGI environment of request
+        :return: iterable over file content. It uses wsgi.file_wrapper (e.g. sendfile) if server provides it
+        """
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return file_wrapper(open(self.path, 'rb'), self.BUFFER_SIZE)
+        with self._lock:
+            if self._is_closed:
+                return FileWrapper(open(self.path, 'rb'), self.BUFFER_SIZE)
+            self._count_of_readers += 1
+        return FileWrapper(MmapReader(self._mmap, self._release), self.BUFFER_SIZE)
+
+    def close(self):
+        """
+        Closes memory map, when the last reader of it is closed. Requests after close read file
+        """
+        with self._lock:
+            self._is_closed = True
+            if self._count_of_readers == 0:
+                self._close_mmap()
+
+    def _release(self):
+        with self._lock:
+            self._count_of_readers -= 1
+            if self._is_closed and self._count_of_readers == 0:
+                self._close_mmap()
+
+    def _close_mmap(self):
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+
+
+class MmapReader(object):
+    """
+    File-like reader with own position over shared memory map
+    """
+
+    def __init__(self, buffer, on_close=None):
+        """
+        :param buffer: memory map or bytes
+        :param on_close: function, which is called once, when reader is closed
+        """
+        self._buffer = buffer
+        self._position = 0
+        self._on_close = on_close
+
+    def read(self, size=-1):
+        end = len(self._buffer) if size is None or size < 0 else min(self._position + size, len(self._buffer))
+        data = self._buffer[self._position:end]
+        self._position = max(self._position, end)
+        return data
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += len(self._buffer)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        on_close, self._on_close = self._on_close, None
+        if on_close is not None:
+            on_close()
+
+
+class FileResponse(CustomResponse):
+    """
+    Response with body streamed from file. Supports conditional requests (ETag, If-Modified-Since)
+    and Range requests for status 200
+    """
+
+    def __init__(self, file_body, status_code=codes.ok, headers=None):
+        super().__init__('', status_code, headers)
+        self.file_body = file_body
+
+    def to_dict(self):
+        result = super().to_dict()
+        result['body_file'] = self.file_body.path
+        return result
+
+    def to_flask_response(self):
+        environ = request.environ
+        file_body = self.file_body
+        headers = [(key, str(value)) for key, value in self._headers.items() if key.lower() != 'content-length']
+        mimetype = None if any(key.lower() == 'content-type' for key, value in headers) else file_body.mimetype
+        resp = self.flask_app.response_class(file_body.open(environ), self._status_code, headers,
+                                             mimetype=mimetype, direct_passthrough=True)
+        resp.content_length = file_body.size
+        if self._status_code != codes.ok:
+            return self._throttled(resp)
+        resp.last_modified = file_body.mtime
+        resp.set_etag(file_body.etag)
+        try:
+            return self._throttled(resp.make_conditional(environ, accept_ranges=True, complete_length=file_body.size))
+        except RequestedRangeNotSatisfiable as e:
+            resp.close()
+            return e.get_response(environ)
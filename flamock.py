@@ -1,10 +1,20 @@
 import logging
+import sys
+import threading
+import time
 from argparse import ArgumentParser
 
+from expectation_manager import ExpectationManager
+from expectation_matcher import ExpectationMatcher
 from flask_factory import FlaskFactory
+from host_whitelist import HostWhitelist
+from log_body_limiter import LogBodyLimiter
+from log_container import LogContainer
 from logging_format import logging_format
+from wsgi_server import WSGIServer
 
 if __name__ == '__main__':
+    start_time = time.perf_counter()
 
     argument_parser = ArgumentParser(description='Flamock')
 
@@ -43,6 +53,13 @@ if __name__ == '__main__':
                                  required=False,
                                  help="Whitelist of hosts. A list in format host1,host2...")
 
+    argument_parser.add_argument("-wcs", "--whitelist_cache_size",
+                                 type=int,
+                                 default=HostWhitelist.DEFAULT_CACHE_SIZE,
+                                 action="store",
+                                 required=False,
+                                 help="Max count of distinct hosts with cached whitelist decision")
+
     argument_parser.add_argument("-p", "--port",
                                  type=int,
                                  default=1080,
@@ -50,6 +67,14 @@ if __name__ == '__main__':
                                  required=False,
                                  help="flamock port for incoming requests")
 
+    argument_parser.add_argument("-mt", "--max_threads",
+                                 type=int,
+                                 default=None,
+                                 action="store",
+                                 required=False,
+                                 help="Count of threads, which handle requests. By default, thread per connection. "
+                                      "Throttled responses are sent by one background thread")
+
     argument_parser.add_argument("-e", "--expectations",
                                  type=str,
                                  default=None,
@@ -57,6 +82,168 @@ if __name__ == '__main__':
                                  required=False,
                                  help="Expectations to be loaded to flamock at startup. JSON format")
 
+    argument_parser.add_argument("-bfd", "--body_file_dir",
+                                 type=str,
+                                 default=None,
+                                 action="store",
+                                 required=False,
+                                 help="Directory, which 'body_file' of responses is read from. "
+                                      "Without it, expectations with 'body_file' are rejected")
+
+    argument_parser.add_argument("-nh", "--namespace_header",
+                                 type=str,
+                                 default=None,
+                                 action="store",
+                                 required=False,
+                                 help="Header with namespace of request, e.g. X-Flamock-Namespace")
+
+    argument_parser.add_argument("-np", "--namespace_prefix",
+                                 type=str,
+                                 default=None,
+                                 action="store",
+                                 required=False,
+                                 help="Path prefix for namespaces. With prefix 'ns' request to 'ns/team/path' "
+                                      "goes to namespace 'team' with path 'path'")
+
+    argument_parser.add_argument("-ni", "--namespace_isolated",
+                                 default=False,
+                                 action="store_true",
+                                 required=False,
+                                 help="Don't match requests of namespaces against expectations of global namespace")
+
+    argument_parser.add_argument("-lq", "--log_queue_size",
+                                 type=int,
+                                 default=0,
+                                 action="store",
+                                 required=False,
+                                 help="Write logs from background thread through queue of given size. "
+                                      "0 - write logs synchronously")
+
+    argument_parser.add_argument("-lqb", "--log_queue_block",
+                                 default=False,
+                                 action="store_true",
+                                 required=False,
+                                 help="Wait when log queue is full instead of dropping log message")
+
+    argument_parser.add_argument("-ls", "--log_size",
+                                 type=int,
+                                 default=LogContainer.DEFAULT_SIZE,
+                                 action="store",
+                                 required=False,
+                                 help="Count of requests saved in log of each namespace")
+
+    argument_parser.add_argument("-jd", "--journal_dir",
+                                 type=str,
+                                 default=None,
+                                 action="store",
+                                 required=False,
+                                 help="Directory for persistent journal of requests. Logs and verification "
+                                      "are read from journal if it is set")
+
+    argument_parser.add_argument("-js", "--journal_segment_size",
+                                 type=int,
+                                 default=64,
+                                 action="store",
+                                 required=False,
+                                 help="Size of journal segment file in MB")
+
+    argument_parser.add_argument("-jms", "--journal_max_segments",
+                                 type=int,
+                                 default=None,
+                                 action="store",
+                                 required=False,
+                                 help="Max count of journal segment files of each namespace. "
+                                      "The oldest segments are removed. By default, unlimited")
+
+    argument_parser.add_argument("-lmb", "--log_max_body_size",
+                                 type=int,
+                                 default=None,
+                                 action="store",
+                                 required=False,
+                                 help="Max size of one body saved in log in bytes. Bigger bodies are truncated")
+
+    argument_parser.add_argument("-lme", "--log_max_entry_size",
+                                 type=int,
+                                 default=None,
+                                 action="store",
+                                 required=False,
+                                 help="Max size of all bodies of one log entry in bytes")
+
+    argument_parser.add_argument("-lmt", "--log_max_total_size",
+                                 type=int,
+                                 default=None,
+                                 action="store",
+                                 required=False,
+                                 help="Max size of all bodies in log of each namespace in bytes")
+
+    argument_parser.add_argument("-lbp", "--log_body_prefix",
+                                 type=int,
+                                 default=LogBodyLimiter.DEFAULT_PREFIX_SIZE,
+                                 action="store",
+                                 required=False,
+                                 help="Size of prefix saved for truncated body in bytes")
+
+    argument_parser.add_argument("-lsd", "--log_spill_dir",
+                                 type=str,
+                                 default=None,
+                                 action="store",
+                                 required=False,
+                                 help="Directory to save full truncated bodies. "
+                                      "They are available at /flamock/logs/bodies/<sha256>")
+
+    argument_parser.add_argument("-st", "--server_timing",
+                                 default=False,
+                                 action="store_true",
+                                 required=False,
+                                 help="Add 'Server-Timing' header with duration of matching, delay, forward and "
+                                      "response phases to mocked responses and 'timing' field to request log")
+
+    argument_parser.add_argument("-mtb", "--match_time_budget",
+                                 type=float,
+                                 default=None,
+                                 action="store",
+                                 required=False,
+                                 help="Max CPU time of matching of one expectation in ms. Expectation, which is slower "
+                                      "in %s requests in a row, is skipped until it is added again"
+                                      % ExpectationManager.SLOW_STREAK)
+
+    argument_parser.add_argument("-msl", "--match_max_scan_length",
+                                 type=int,
+                                 default=None,
+                                 action="store",
+                                 required=False,
+                                 help="Max count of chars of request field scanned by regex pattern of expectation")
+
+    argument_parser.add_argument("-ms", "--miss_status",
+                                 type=int,
+                                 default=200,
+                                 action="store",
+                                 required=False,
+                                 help="Status of response to request without matched expectation")
+
+    argument_parser.add_argument("-mb", "--miss_body",
+                                 type=str,
+                                 default=None,
+                                 action="store",
+                                 required=False,
+                                 help="Body of response to request without matched expectation. "
+                                      "By default it is method and path of request")
+
+    argument_parser.add_argument("-md", "--miss_diagnostics",
+                                 type=int,
+                                 default=0,
+                                 action="store",
+                                 required=False,
+                                 help="Count of the closest expectations with failed fields in JSON response to "
+                                      "request without matched expectation and in its log entry. 0 - disabled")
+
+    argument_parser.add_argument("-mdl", "--miss_diagnostics_limit",
+                                 type=int,
+                                 default=ExpectationManager.near_miss_max_evaluations,
+                                 action="store",
+                                 required=False,
+                                 help="Max count of expectations evaluated to find the closest ones")
+
     args = argument_parser.parse_args()
 
     logging.basicConfig(format=logging_format)
@@ -65,37 +252,84 @@ if __name__ == '__main__':
         logging.getLogger('werkzeug').setLevel(logging.WARNING)
     logging.getLogger().setLevel(args.loglevel)
 
-    app = FlaskFactory.flask_factory()
-
-    if args.proxy_host is not None:
-        scheme = args.proxy_scheme
-        expectation = {
-            'key': 'fwd',
-            'forward':
-                {
-                    'scheme': scheme,
-                    'host': args.proxy_host
-                },
-            'priority': 0
-        }
-
-        if args.proxy_headers is not None:
-            dict_headers = {}
-            for pair in args.proxy_headers.split(';'):
-                key, value = pair.split('=')
-                dict_headers[key] = value
-            expectation['forward']['headers'] = dict_headers
-
-        app.expectation_manager.add(expectation)
-
-        if args.whitelist is not None:
-            app.response_manager.host_whitelist = args.whitelist.split(',')
-
-    if args.expectations is not None:
-        expectations, response = app.expectation_manager.json_to_dict(args.expectations)
-        if response.status_code != 200:
-            raise Exception(response.text)
-        for expectation in expectations:
-            app.expectation_manager.add(expectation)
+    if args.log_size <= 0:
+        raise Exception("Size of log must be positive")
+    log_body_limiter = LogBodyLimiter(args.log_max_body_size,
+                                      args.log_max_entry_size,
+                                      args.log_max_total_size,
+                                      args.log_body_prefix,
+                                      args.log_spill_dir)
+    if args.match_time_budget is not None:
+        ExpectationManager.match_time_budget = args.match_time_budget / 1000
+    ExpectationMatcher.max_scan_length = args.match_max_scan_length
+    ExpectationManager.near_miss_max_evaluations = args.miss_diagnostics_limit
+    app = FlaskFactory.flask_factory(args.log_size, log_body_limiter)
+    app.is_ready = False
+    app.debug = args.loglevel == logging.DEBUG
+    app.response_manager.whitelist.cache_size = args.whitelist_cache_size
+    app.expectation_manager.body_file_dir = args.body_file_dir
+    if args.log_queue_size > 0:
+        app.json_logger.enable_queue(args.log_queue_size, args.log_queue_block)
+    app.namespace_manager.header = args.namespace_header
+    if args.namespace_prefix is not None:
+        app.namespace_manager.path_prefix = args.namespace_prefix.strip('/')
+    app.namespace_manager.use_global = not args.namespace_isolated
+    app.response_manager.server_timing = args.server_timing
+    app.response_manager.miss_status_code = args.miss_status
+    app.response_manager.miss_body = args.miss_body
+    app.response_manager.miss_diagnostics = args.miss_diagnostics
     app.response_manager.logs_url = '/%s/logs' % FlaskFactory.admin_path
-    app.run(debug=(args.loglevel == logging.DEBUG), host='0.0.0.0', port=args.port, threaded=True)
+
+    # port is bound before journal and expectations are loaded. Until then, status and mocked requests get 503
+    server = WSGIServer('0.0.0.0', args.port, app, args.max_threads)
+    app.json_logger.info("Flamock is listening on port %s", server.server_port)
+    startup_errors = []
+
+    def load():
+        try:
+            if args.journal_dir is not None:
+                app.namespace_manager.enable_journal(args.journal_dir, args.journal_segment_size * 1024 * 1024,
+                                                     args.journal_max_segments)
+
+            if args.proxy_host is not None:
+                scheme = args.proxy_scheme
+                expectation = {
+                    'key': 'fwd',
+                    'forward':
+                        {
+                            'scheme': scheme,
+                            'host': args.proxy_host
+                        },
+                    'priority': 0
+                }
+
+                if args.proxy_headers is not None:
+                    dict_headers = {}
+                    for pair in args.proxy_headers.split(';'):
+                        key, value = pair.split('=')
+                        dict_headers[key] = value
+                    expectation['forward']['headers'] = dict_headers
+
+                app.expectation_manager.add(expectation)
+
+                if args.whitelist is not None:
+                    app.response_manager.whitelist.update(args.whitelist.split(','))
+
+            if args.expectations is not None:
+                expectations, response = app.expectation_manager.json_to_dict(args.expectations)
+                if response.status_code != 200:
+                    raise Exception(response.text)
+                for expectation in expectations:
+                    app.expectation_manager.add(expectation)
+        except Exception as e:
+            app.json_logger.exception(e)
+            startup_errors.append(e)
+            server.shutdown()
+            return
+        app.is_ready = True
+        app.json_logger.info("Flamock is ready in %.3f s", time.perf_counter() - start_time)
+
+    threading.Thread(target=load, name='flamock-startup', daemon=True).start()
+    server.serve_forever()
+    if len(startup_errors) > 0:
+        sys.exit(1)
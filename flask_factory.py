@@ -1,78 +1,287 @@
+import json
+import pstats
+
 from flask import Flask
 from flask import request
 
 from custom_reponse import CustomResponse
 from expectation_manager import ExpectationManager
+from expectation_matcher import MatchCosts
 from extensions import Extensions
 from json_logging import JsonLogging
+from log_container import LogContainer
+from namespace_manager import NamespaceManager
+from profiler import Profiler
 from response_manager import ResponseManager
+from status_codes import codes
 
 
 class FlaskFactory:
     admin_path = 'flamock'
 
     @classmethod
-    def flask_factory(cls):
+    def flask_factory(cls, log_size=None, log_body_limiter=None):
+        """
+        :param log_size: count of messages in log of each namespace. None - LogContainer.DEFAULT_SIZE
+        :param log_body_limiter: limits of bodies in log of each namespace. None - bodies are not limited
+        :return: flask application
+        """
         flask_app = Flask(__name__)
-        cls.__set_context(flask_app)
+        cls.__set_context(flask_app, log_size, log_body_limiter)
         cls.__set_routes(flask_app)
         CustomResponse.flask_app = flask_app
         return flask_app
 
     @classmethod
-    def __set_context(cls, flask_app):
+    def __set_context(cls, flask_app, log_size, log_body_limiter):
         with flask_app.app_context():
             JsonLogging.logger = flask_app.logger
             flask_app.json_logger = JsonLogging
             flask_app.expectation_manager = ExpectationManager()
-            flask_app.response_manager = ResponseManager(flask_app.expectation_manager)
+            flask_app.response_manager = ResponseManager(flask_app.expectation_manager,
+                                                         log_container=LogContainer(log_size, log_body_limiter))
+            flask_app.namespace_manager = NamespaceManager(flask_app.expectation_manager,
+                                                           flask_app.response_manager.log_container,
+                                                           log_size,
+                                                           log_body_limiter)
+            flask_app.response_manager.namespace_manager = flask_app.namespace_manager
+            flask_app.profiler = None
+            flask_app.is_ready = True  # false while flamock.py loads journal and expectations after port is bound
+
+    @staticmethod
+    def __get_namespace(flask_app, create=False):
+        """
+        Namespace of admin request is taken from query parameter 'namespace' or from namespace header
+        :param create: if True, namespace is created if it doesn't exist. Only adding of expectation creates it
+        :return: tuple (namespace or None, custom response). Response has status 404 if namespace doesn't exist
+        """
+        name = request.args.get('namespace')
+        if name is None and flask_app.namespace_manager.header is not None:
+            name = request.headers.get(flask_app.namespace_manager.header)
+        if create:
+            return flask_app.namespace_manager.get(name), CustomResponse()
+        namespace = flask_app.namespace_manager.find(name)
+        if namespace is None:
+            return None, CustomResponse("Error! Namespace '%s' is not found" % name, codes.not_found)
+        return namespace, CustomResponse()
+
+    @staticmethod
+    def __get_status_details(flask_app):
+        """
+        :return: dict with status and statistics of flamock components
+        """
+        status = {"status": flask_app.expectation_manager.status().text,
+                  "ready": flask_app.is_ready,
+                  "logging": flask_app.json_logger.get_statistics(),
+                  "log": flask_app.response_manager.log_container.get_statistics()}
+        journal = flask_app.response_manager.log_container.journal
+        if journal is not None:
+            status["journal"] = journal.get_statistics()
+        status["whitelist"] = flask_app.response_manager.whitelist.get_statistics()
+        if flask_app.profiler is not None:
+            status["profiler"] = flask_app.profiler.get_statistics()
+        return status
+
+    @staticmethod
+    def __get_starting_response():
+        return CustomResponse("Flamock is starting", codes.service_unavailable, {'Retry-After': '1'})
 
     @classmethod
     def __set_routes(cls, flask_app):
 
         @flask_app.route('/%s/remove_all_expectations' % cls.admin_path, methods=['POST'])
         def admin_remove_all_expectations():
-            flask_app.json_logger.info("Remove all expectations")
-            flask_app.expectation_manager.clear()
+            namespace, resp = cls.__get_namespace(flask_app)
+            if namespace is None:
+                return resp.to_flask_response()
+            flask_app.json_logger.info("Remove all expectations from namespace '%s'", namespace.name)
+            namespace.expectation_manager.clear()
             return CustomResponse("All expectations were removed").to_flask_response()
 
         @flask_app.route('/%s/remove_expectation' % cls.admin_path, methods=['POST'])
         def admin_remove_expectation():
             request_data = request.data.decode()
-            flask_app.json_logger.info("Remove expectation: %s" % request_data)
+            flask_app.json_logger.info("Remove expectation: %s", request_data)
             req_data_dict, resp = flask_app.expectation_manager.json_to_dict(request_data)
-            if req_data_dict is None and resp.staus_code != 200:
+            if req_data_dict is None and resp.status_code != 200:
                 return resp.to_flask_response()
 
-            return flask_app.expectation_manager.remove(req_data_dict).to_flask_response()
+            namespace, resp = cls.__get_namespace(flask_app)
+            if namespace is None:
+                return resp.to_flask_response()
+            return namespace.expectation_manager.remove(req_data_dict).to_flask_response()
+
+        @flask_app.route('/%s/remove_expectations' % cls.admin_path, methods=['POST'])
+        def admin_remove_expectations():
+            request_data = request.data.decode()
+            req_data_dict, resp = flask_app.expectation_manager.json_to_dict(request_data)
+            if req_data_dict is None and resp.status_code != 200:
+                return resp.to_flask_response()
+
+            namespace, resp = cls.__get_namespace(flask_app)
+            if namespace is None:
+                return resp.to_flask_response()
+            return namespace.expectation_manager.remove_by_filter(req_data_dict).to_flask_response()
 
         @flask_app.route('/%s/get_expectations' % cls.admin_path, methods=['POST'])
         def admin_get_expectations():
             flask_app.json_logger.info("Get expectations")
-            return flask_app.expectation_manager.get_expectations_as_response().to_flask_response()
+            namespace, resp = cls.__get_namespace(flask_app)
+            if namespace is None:
+                return resp.to_flask_response()
+            return namespace.expectation_manager.get_expectations_as_response().to_flask_response()
 
         @flask_app.route('/%s/add_expectation' % cls.admin_path, methods=['POST'])
         def admin_add_expectation():
             request_data = request.data.decode()
-            flask_app.json_logger.info("Add expectation: %s" % request_data)
+            flask_app.json_logger.info("Add expectation: %s", request_data)
             req_data_dict, resp = flask_app.expectation_manager.json_to_dict(request_data)
             if req_data_dict is None and resp.status_code != 200:
                 return resp.to_flask_response()
 
-            return flask_app.expectation_manager.add(req_data_dict).to_flask_response()
+            namespace, resp = cls.__get_namespace(flask_app, create=True)
+            return namespace.expectation_manager.add(req_data_dict).to_flask_response()
 
         @flask_app.route('/%s/logs' % cls.admin_path, defaults={'log_id': ''}, methods=['GET'])
         @flask_app.route('/%s/logs/<path:log_id>' % cls.admin_path, methods=['GET'])
         def admin_logs(log_id):
-            return flask_app.response_manager.return_log_messages(log_id).to_flask_response()
+            namespace, resp = cls.__get_namespace(flask_app)
+            if namespace is None:
+                return resp.to_flask_response()
+            log_container = namespace.log_container
+            query_args = request.args.to_dict()
+            query_args.pop('namespace', None)
+            if len(log_id) == 0 and len(query_args) > 0:
+                return flask_app.response_manager.query_log_messages(query_args, log_container).to_flask_response()
+            return flask_app.response_manager.return_log_messages(log_id, log_container).to_flask_response()
+
+        @flask_app.route('/%s/logs/stream' % cls.admin_path, methods=['GET'])
+        def admin_logs_stream():
+            namespace, resp = cls.__get_namespace(flask_app)
+            if namespace is None:
+                return resp.to_flask_response()
+            stream = flask_app.response_manager.stream_log_messages(request.args.to_dict(), namespace.log_container)
+            return flask_app.response_class(stream, mimetype='text/event-stream',
+                                            headers={'Cache-Control': 'no-cache'})
+
+        @flask_app.route('/%s/logs/bodies/<sha256>' % cls.admin_path, methods=['GET'])
+        def admin_logs_body(sha256):
+            # limiter and its spill directory are shared by all namespaces
+            body = flask_app.response_manager.log_container.body_limiter.read_spilled(sha256)
+            if body is None:
+                return CustomResponse("Body %s is not found" % sha256, codes.not_found).to_flask_response()
+            return CustomResponse(body, headers={'Content-Type': 'application/octet-stream'}).to_flask_response()
+
+        @flask_app.route('/%s/verify' % cls.admin_path, methods=['POST'])
+        def admin_verify():
+            req_data_dict, resp = flask_app.expectation_manager.json_to_dict(request.data.decode())
+            if req_data_dict is None and resp.status_code != 200:
+                return resp.to_flask_response()
+
+            namespace, resp = cls.__get_namespace(flask_app)
+            if namespace is None:
+                return resp.to_flask_response()
+            return flask_app.response_manager.verify_requests(req_data_dict,
+                                                              namespace.expectation_manager,
+                                                              namespace.log_container).to_flask_response()
+
+        @flask_app.route('/%s/metrics' % cls.admin_path, methods=['GET'])
+        def admin_metrics():
+            return flask_app.response_manager.get_metrics_as_response().to_flask_response()
+
+        @flask_app.route('/%s/match_costs' % cls.admin_path, methods=['GET'])
+        def admin_match_costs():
+            top = request.args.get('top', '10')
+            sort = request.args.get('sort', 'total')
+            if not top.isdigit() or sort not in MatchCosts.SORT_FIELDS:
+                return CustomResponse("Error! 'top' must be a number and 'sort' must be one of %s" %
+                                      (MatchCosts.SORT_FIELDS,), codes.bad).to_flask_response()
+            namespace, resp = cls.__get_namespace(flask_app)
+            if namespace is None:
+                return resp.to_flask_response()
+            return namespace.expectation_manager.get_match_costs_as_response(int(top), sort).to_flask_response()
+
+        @flask_app.route('/%s/profiler/start' % cls.admin_path, methods=['POST'])
+        def admin_profiler_start():
+            request_data = request.data.decode()
+            flask_app.json_logger.info("Start profiler: %s", request_data)
+            settings, resp = flask_app.expectation_manager.json_to_dict(request_data or '{}')
+            if settings is None and resp.status_code != 200:
+                return resp.to_flask_response()
+
+            profiler, resp = Profiler.from_dict(settings)
+            if profiler is not None:
+                if flask_app.profiler is not None:
+                    flask_app.profiler.stop()
+                flask_app.profiler = profiler
+            return resp.to_flask_response()
+
+        @flask_app.route('/%s/profiler/stop' % cls.admin_path, methods=['POST'])
+        @flask_app.route('/%s/profiler' % cls.admin_path, methods=['GET'])
+        def admin_profiler():
+            profiler = flask_app.profiler
+            if profiler is None:
+                return CustomResponse("Profiler was not started", codes.not_found).to_flask_response()
+            if request.method == 'POST':
+                flask_app.json_logger.info("Stop profiler")
+                profiler.stop()
+
+            sort = request.args.get('sort', Profiler.DEFAULT_PSTATS_SORT)
+            limit = request.args.get('limit', str(Profiler.DEFAULT_PSTATS_LIMIT))
+            if sort not in pstats.Stats.sort_arg_dict_default or not limit.isdigit():
+                return CustomResponse("Error! Unknown sort key '%s' or limit '%s' is not a number" % (sort, limit),
+                                      codes.bad).to_flask_response()
+            return CustomResponse(profiler.get_stats_as_text(sort, int(limit)),
+                                  headers={'Content-Type': 'text/plain'}).to_flask_response()
+
+        @flask_app.route('/%s/whitelist' % cls.admin_path, methods=['GET', 'POST'])
+        def admin_whitelist():
+            whitelist = flask_app.response_manager.whitelist
+            if request.method == 'POST':
+                request_data = request.data.decode()
+                flask_app.json_logger.info("Update whitelist: %s", request_data)
+                settings, resp = flask_app.expectation_manager.json_to_dict(request_data)
+                if settings is None and resp.status_code != 200:
+                    return resp.to_flask_response()
+                hosts = settings.get('hosts') if isinstance(settings, dict) else None
+                if not isinstance(hosts, list) or not all(isinstance(host, str) for host in hosts):
+                    return CustomResponse("Error! Field 'hosts' must be list of strings",
+                                          codes.bad).to_flask_response()
+                whitelist.update(hosts)
+            return CustomResponse(json.dumps(whitelist.get_statistics()),
+                                  headers={'Content-Type': 'application/json'}).to_flask_response()
+
+        @flask_app.route('/%s/namespaces' % cls.admin_path, methods=['GET'])
+        def admin_namespaces():
+            namespaces = flask_app.namespace_manager.to_list()
+            return CustomResponse(json.dumps(namespaces),
+                                  headers={'Content-Type': 'application/json'}).to_flask_response()
+
+        @flask_app.route('/%s/remove_namespace' % cls.admin_path, methods=['POST'])
+        def admin_remove_namespace():
+            namespace, resp = cls.__get_namespace(flask_app)
+            if namespace is None:
+                return resp.to_flask_response()
+            name = namespace.name
+            flask_app.json_logger.info("Remove namespace '%s'", name)
+            flask_app.namespace_manager.remove(name)
+            return CustomResponse("Namespace '%s' was removed" % name).to_flask_response()
 
         @flask_app.route('/%s/status' % cls.admin_path, methods=['GET'])
         def admin_status():
+            if request.args.get('details', 'false').lower() == 'true':
+                return CustomResponse(json.dumps(cls.__get_status_details(flask_app)),
+                                      codes.ok if flask_app.is_ready else codes.service_unavailable,
+                                      {'Content-Type': 'application/json'}).to_flask_response()
+            if not flask_app.is_ready:
+                return cls.__get_starting_response().to_flask_response()
             return flask_app.expectation_manager.status().to_flask_response()
 
         @flask_app.route('/', defaults={'request_path': ''}, methods=['GET', 'POST'])
         @flask_app.route('/<path:request_path>', methods=['GET', 'POST'])
         def mock_process(request_path):
+            if not flask_app.is_ready:
+                return cls.__get_starting_response().to_flask_response()
             query_string = request.query_string.decode()
             path = request.full_path[1:]  # copy full path without first slash
             if len(query_string) == 0:
@@ -82,4 +291,12 @@ class FlaskFactory:
                    'headers': Extensions.list_of_tuples_to_dict(request.headers),
                    'body': request.get_data(True).decode(),
                    'cookies': request.cookies}
-            return flask_app.response_manager.generate_response(req).to_flask_response()
+            metrics = flask_app.response_manager.metrics
+            metrics.inc('flamock_requests_started_total')
+            try:
+                profiler = flask_app.profiler
+                if profiler is not None and profiler.is_active:
+                    return profiler.run(flask_app.response_manager.generate_flask_response, req)
+                return flask_app.response_manager.generate_flask_response(req)
+            finally:
+                metrics.inc('flamock_requests_finished_total')
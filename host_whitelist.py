@@ -0,0 +1,87 @@
+import re
+import threading
+
+from expectation_matcher import ExpectationMatcher
+
+
+class HostWhitelist(object):
+    """
+    Hosts, which requests are allowed from. Host patterns are matched as patterns of expectations:
+    regex or substring. Patterns are compiled into one regex, when whitelist is updated,
+    and decisions are cached per distinct Host header. Cache is reset by update and is bounded by
+    cache_size: the oldest decisions are dropped first
+    """
+    DEFAULT_CACHE_SIZE = 10000
+
+    def __init__(self, hosts=None, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        :param hosts: list of host patterns. Empty list allows all hosts
+        :param cache_size: max count of cached decisions
+        """
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._hosts = []
+        self._state = (None, {})  # tuple (matcher or None, dict with <host: decision>). Replaced by update
+        self.update(hosts or [])
+
+    @property
+    def hosts(self):
+        return list(self._hosts)
+
+    def update(self, hosts):
+        """
+        :param hosts: list of host patterns. Empty list allows all hosts
+        """
+        hosts = [str(host) for host in hosts]
+        matcher = self.compile(hosts) if len(hosts) > 0 else None
+        with self._lock:
+            self._hosts = hosts
+            self._state = (matcher, {})
+
+    @staticmethod
+    def compile(hosts):
+        """
+        Patterns without groups are combined into one regex. Patterns with groups are matched one by one,
+        because numbers of groups and backreferences change in combined regex
+        :param hosts: list of host patterns
+        :return: function, which returns True if host matches any of patterns
+        """
+        compiled_patterns = [ExpectationMatcher.compile_pattern(host) for host in hosts]
+        separate_patterns = [pattern for pattern in compiled_patterns
+                             if not isinstance(pattern, str) and pattern.groups > 0]
+        combined_patterns = [pattern for pattern in compiled_patterns
+                             if isinstance(pattern, str) or pattern.groups == 0]
+        if len(combined_patterns) > 1:
+            try:
+                combined_patterns = [re.compile('|'.join(
+                    '(?:%s)' % (re.escape(pattern) if isinstance(pattern, str) else pattern.pattern)
+                    for pattern in combined_patterns), ExpectationMatcher._re_flags)]
+            except re.error:
+                # patterns can't be combined, e.g. because of inline flags
+                pass
+        patterns = combined_patterns + separate_patterns
+        return lambda host: any(ExpectationMatcher.search(pattern, host) for pattern in patterns)
+
+    def is_allowed(self, host):
+        """
+        :param host: value of Host header
+        :return: True if whitelist is empty or host matches any of its patterns
+        """
+        matcher, decisions = self._state
+        if matcher is None:
+            return True
+        decision = decisions.get(host)
+        if decision is None:
+            decision = matcher(host)
+            with self._lock:
+                if len(decisions) > 0 and len(decisions) >= self.cache_size:
+                    decisions.pop(next(iter(decisions)))
+                decisions[host] = decision
+        return decision
+
+    def get_statistics(self):
+        """
+        :return: dict with hosts and count of cached decisions
+        """
+        return {"hosts": self.hosts,
+                "cached_decisions": len(self._state[1])}
@@ -1,31 +1,204 @@
 import datetime
+import itertools
 import json
 import logging
+import queue
+import threading
+import time
+import traceback
 
 from extensions import Extensions
 
 
+def encode_to_json(encoder, level, created, message, args):
+    """
+    :param encoder: json encoder
+    :param level: log level
+    :param created: timestamp of message
+    :param message: message with placeholders for args
+    :param args: deferred arguments of message
+    :return: message in JSON format
+    """
+    if len(args) > 0:
+        message = message % args
+    kwargs = {'ts': datetime.datetime.fromtimestamp(created).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3],
+              'level': logging.getLevelName(level),
+              'message': Extensions.remove_linebreaks(message)}
+    return encoder.encode(kwargs)
+
+
 def encode_to_json_decorator(level):
+    """
+    Formats message with deferred arguments and encodes it to JSON only if level is enabled for logger.
+    If queued mode is enabled, formatted message is passed to background writer, which encodes it
+    """
     def decorator(func):
-        def func_wrapper(cls, message):
-            kwargs = {'ts': datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3],
-                      'level': logging.getLevelName(level),
-                      'message': Extensions.remove_linebreaks(message)}
-            s = cls.encoder.encode(kwargs)
-            return func(cls, s)
+        def func_wrapper(cls, message, *args):
+            if not cls.logger.isEnabledFor(level):
+                return None
+            if cls.queued_writer is not None:
+                cls.queued_writer.put(level, message, args)
+                return None
+            return func(cls, encode_to_json(cls.encoder, level, time.time(), message, args))
 
         return func_wrapper
 
     return decorator
 
 
+class QueuedJsonWriter:
+    """
+    Background writer of log messages. As in logging.handlers.QueueHandler, request thread formats arguments
+    into message, so arguments changed after logging don't change it, and puts it with time to bounded queue.
+    Writer thread encodes messages to JSON in batches and emits them through handlers of logger.
+    Stream handler gets the whole batch with one write and one flush.
+    When queue is full, message is dropped or request thread is blocked according to 'block'
+    """
+    DEFAULT_QUEUE_SIZE = 10000
+    DEFAULT_BATCH_SIZE = 100
+
+    def __init__(self, logger, queue_size=DEFAULT_QUEUE_SIZE, block=False, batch_size=DEFAULT_BATCH_SIZE):
+        self._logger = logger
+        self._queue = queue.Queue(queue_size)
+        self._block = block
+        self._batch_size = batch_size
+        self._encoder = json.JSONEncoder(sort_keys=True)
+        self._dropped_counter = itertools.count(1)
+        self._dropped = 0
+        self._thread = threading.Thread(target=self._run, name='json-log-writer', daemon=True)
+        self._thread.start()
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+    @property
+    def queue_size(self):
+        return self._queue.qsize()
+
+    def put(self, level, message, args):
+        """
+        Formats arguments into message and puts it to queue
+        :param level: log level
+        :param message: message with placeholders for args
+        :param args: deferred arguments of message
+        """
+        try:
+            record = (level, time.time(), message % args if len(args) > 0 else message)
+        except Exception as e:
+            record = (logging.ERROR, time.time(), "Can't format log message %r: %s" % (message, e))
+        try:
+            self._queue.put(record, block=self._block)
+        except queue.Full:
+            self._dropped = next(self._dropped_counter)
+
+    def stop(self):
+        """
+        Writes all queued records and stops writer thread
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            is_stopped = batch[-1] is None
+            if is_stopped:
+                batch.pop()
+            self._write(batch)
+            if is_stopped:
+                return
+
+    def _write(self, batch):
+        records = []
+        for level, created, message in batch:
+            try:
+                line = encode_to_json(self._encoder, level, created, message, ())
+            except Exception as e:
+                level, line = logging.ERROR, "Can't encode log message %r: %s" % (message, e)
+            record = self._logger.makeRecord(self._logger.name, level, __file__, 0, line, None, None)
+            record.created = created
+            if self._logger.filter(record):
+                records.append(record)
+        for handler in self._get_handlers():
+            try:
+                self._emit(handler, [record for record in records if record.levelno >= handler.level])
+            except Exception:
+                self._dropped = next(self._dropped_counter)
+
+    def _get_handlers(self):
+        """
+        :return: list of handlers of logger and its parents, as Logger.callHandlers finds them
+        """
+        handlers = []
+        logger = self._logger
+        while logger is not None:
+            handlers.extend(logger.handlers)
+            logger = logger.parent if logger.propagate else None
+        if len(handlers) == 0 and logging.lastResort is not None:
+            handlers.append(logging.lastResort)
+        return handlers
+
+    @staticmethod
+    def _emit(handler, records):
+        """
+        Emits records through handler. Stream handler writes all of them at once and flushes once
+        """
+        if isinstance(handler, logging.StreamHandler) and handler.stream is not None:
+            text = ''.join(handler.format(record) + handler.terminator for record in records if handler.filter(record))
+            if len(text) > 0:
+                with handler.lock:
+                    handler.stream.write(text)
+                    handler.flush()
+        else:
+            for record in records:
+                handler.handle(record)
+
+
 class JsonLogging:
     """
-    Class for saving log messages in JSON format
+    Class for saving log messages in JSON format.
+    Arguments are formatted into message lazily, like in logging module: JsonLogging.debug("Request: %s", request)
     """
 
     logger = logging.getLogger()
     encoder = json.JSONEncoder(sort_keys=True)
+    queued_writer = None
+
+    @classmethod
+    def enable_queue(cls, queue_size=QueuedJsonWriter.DEFAULT_QUEUE_SIZE, block=False):
+        """
+        Switches to queued mode: messages are formatted by caller and emitted through handlers of logger
+        by background thread
+        :param queue_size: max count of messages in queue
+        :param block: if True, request thread waits when queue is full. Otherwise message is dropped
+        """
+        cls.disable_queue()
+        cls.queued_writer = QueuedJsonWriter(cls.logger, queue_size, block)
+
+    @classmethod
+    def disable_queue(cls):
+        if cls.queued_writer is not None:
+            queued_writer = cls.queued_writer
+            cls.queued_writer = None
+            queued_writer.stop()
+
+    @classmethod
+    def get_statistics(cls):
+        if cls.queued_writer is None:
+            return {"queued": False}
+        return {"queued": True,
+                "queue_size": cls.queued_writer.queue_size,
+                "dropped": cls.queued_writer.dropped}
+
+    @classmethod
+    def is_enabled_for(cls, level):
+        return cls.logger.isEnabledFor(level)
 
     @classmethod
     @encode_to_json_decorator(logging.DEBUG)
@@ -49,4 +222,11 @@ class JsonLogging:
 
     @classmethod
     def exception(cls, msg):
+        """
+        Logs message with traceback of current exception. In queued mode traceback is formatted by caller
+        """
+        if cls.queued_writer is not None:
+            if cls.logger.isEnabledFor(logging.ERROR):
+                cls.queued_writer.put(logging.ERROR, "%s\n%s", (msg, traceback.format_exc()))
+            return
         cls.logger.exception(msg)
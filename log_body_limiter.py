@@ -0,0 +1,155 @@
+import hashlib
+import os
+import threading
+
+
+class LogBodyLimiter(object):
+    """
+    Limits size of bodies saved in log messages. Sizes are counted in bytes, str body is counted in UTF-8.
+    Body bigger than allowed size is replaced with dict:
+    {"truncated": true, "length": size in bytes, "sha256": hash, "prefix": first bytes of body}
+    If spill directory is set, full body is saved to file named by its hash and dict has field "spilled".
+    Spill files are counted by references of log messages, file is removed, when the last message with it
+    is released by log container
+    """
+    DEFAULT_PREFIX_SIZE = 256
+    BODY_FIELDS = [('request', 'body'), ('forward', 'body'), ('response', 'text')]
+
+    def __init__(self, max_body_size=None, max_entry_size=None, max_total_size=None,
+                 prefix_size=DEFAULT_PREFIX_SIZE, spill_directory=None):
+        """
+        :param max_body_size: max size of one body. None - unlimited
+        :param max_entry_size: max size of all bodies of one log message. None - unlimited
+        :param max_total_size: max size of all bodies in log container. None - unlimited
+        :param prefix_size: size of prefix saved for truncated body
+        :param spill_directory: directory for full truncated bodies. None - bodies are not saved
+        """
+        self.max_body_size = max_body_size
+        self.max_entry_size = max_entry_size
+        self.max_total_size = max_total_size
+        self.prefix_size = prefix_size
+        self.spill_directory = spill_directory
+        self._references = {}  # dict with <sha256: count of log messages with spilled body>
+        self._lock = threading.Lock()
+        if spill_directory is not None:
+            os.makedirs(spill_directory, exist_ok=True)
+
+    def limit(self, message, total_size):
+        """
+        Replaces too long bodies of message
+        :param message: log message
+        :param total_size: size of bodies already saved in log container
+        :return: tuple (size of bodies saved in message, count of truncated bodies)
+        """
+        if not isinstance(message, dict):
+            return 0, 0
+        entry_size = 0
+        count_of_truncated = 0
+        for section, field in self.BODY_FIELDS:
+            part = message.get(section)
+            if not isinstance(part, dict) or field not in part or not isinstance(part[field], (str, bytes)):
+                continue
+            body = part[field]
+            body_size = self.get_size(body)
+            allowed_size = self._get_allowed_size(entry_size, total_size + entry_size)
+            if allowed_size is not None and body_size > allowed_size:
+                part = dict(part)
+                part[field] = self.truncate(body, min(self.prefix_size, allowed_size))
+                message[section] = part
+                count_of_truncated += 1
+                entry_size += self.get_size(part[field]['prefix'])
+            else:
+                entry_size += body_size
+        return entry_size, count_of_truncated
+
+    @staticmethod
+    def get_size(body):
+        """
+        :param body: str or bytes
+        :return: size of body in bytes
+        """
+        if isinstance(body, str):
+            return len(body) if body.isascii() else len(body.encode())
+        return len(body)
+
+    def truncate(self, body, prefix_size):
+        """
+        :param body: str or bytes
+        :param prefix_size: size of prefix to keep in bytes. Prefix of str body doesn't end with part of character
+        :return: dict with description of body
+        """
+        body_bytes = body.encode() if isinstance(body, str) else body
+        sha256 = hashlib.sha256(body_bytes).hexdigest()
+        prefix = body_bytes[:prefix_size]
+        truncated = {"truncated": True,
+                     "length": len(body_bytes),
+                     "sha256": sha256,
+                     "prefix": prefix.decode(errors='ignore') if isinstance(body, str) else prefix}
+        if self.spill_directory is not None:
+            path = os.path.join(self.spill_directory, sha256)
+            with self._lock:
+                count = self._references.get(sha256, 0)
+                if count == 0 and not os.path.exists(path):
+                    with open(path + '.tmp', 'wb') as spill_file:
+                        spill_file.write(body_bytes)
+                    os.replace(path + '.tmp', path)
+                self._references[sha256] = count + 1
+            truncated["spilled"] = sha256
+        return truncated
+
+    def get_spilled(self, message):
+        """
+        :param message: log message limited by limit
+        :return: list of hashes of spilled bodies of message
+        """
+        if self.spill_directory is None or not isinstance(message, dict):
+            return []
+        spilled = []
+        for section, field in self.BODY_FIELDS:
+            part = message.get(section)
+            if isinstance(part, dict) and isinstance(part.get(field), dict) and 'spilled' in part[field]:
+                spilled.append(part[field]['spilled'])
+        return spilled
+
+    def release(self, spilled):
+        """
+        Releases references of log message to spilled bodies. File is removed, when it isn't referenced anymore
+        :param spilled: list of hashes of spilled bodies
+        """
+        with self._lock:
+            for sha256 in spilled:
+                count = self._references.get(sha256, 0) - 1
+                if count > 0:
+                    self._references[sha256] = count
+                    continue
+                self._references.pop(sha256, None)
+                try:
+                    os.remove(os.path.join(self.spill_directory, sha256))
+                except FileNotFoundError:
+                    pass
+
+    def read_spilled(self, sha256):
+        """
+        :param sha256: hash of body
+        :return: bytes of spilled body or None
+        """
+        if self.spill_directory is None or len(sha256) != 64 or \
+                any(char not in '0123456789abcdef' for char in sha256):
+            return None
+        try:
+            with open(os.path.join(self.spill_directory, sha256), 'rb') as spill_file:
+                return spill_file.read()
+        except FileNotFoundError:
+            return None
+
+    def _get_allowed_size(self, entry_size, total_size):
+        limits = []
+        if self.max_body_size is not None:
+            limits.append(self.max_body_size)
+        if self.max_entry_size is not None:
+            limits.append(self.max_entry_size - entry_size)
+        if self.max_total_size is not None:
+            limits.append(self.max_total_size - total_size)
+        if len(limits) == 0:
+            return None
+        return max(0, min(limits))
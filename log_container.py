@@ -1,28 +1,225 @@
+import itertools
+import queue
+import threading
+import time
+
+from log_body_limiter import LogBodyLimiter
+
+
+class LogSubscription(object):
+    """
+    Bounded buffer of new log messages for one subscriber.
+    When buffer is full, new messages are dropped, so slow subscriber never blocks requests
+    """
+    DEFAULT_BUFFER_SIZE = 1000
+
+    def __init__(self, filters=None, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.filters = filters or {}
+        self._queue = queue.Queue(buffer_size)
+        self._dropped_counter = itertools.count(1)
+        self._dropped = 0
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+    def is_match(self, indexed_values):
+        for field, value in self.filters.items():
+            if indexed_values.get(field) != value:
+                return False
+        return True
+
+    def put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._dropped = next(self._dropped_counter)
+
+    def get(self, timeout=None):
+        """
+        :param timeout: seconds to wait for new message
+        :return: tuple (sequential id, timestamp, message) or None if there is no new message
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
 class LogContainer(object):
     """
     Special container for log messages
     By default, saves 100 messages. When adds 101 message, it rewrites first message.
+
+    Every message gets sequential id, which is used as cursor for queries.
+    Messages can be indexed by fields (e.g. method, path, key, status) and queried by them
+    and by time of adding
     """
     DEFAULT_SIZE = 100
+    DEFAULT_QUERY_LIMIT = 100
     size = None
-    container = None
+    container = None  # dict with <position in ring: message>
+    journal = None  # persistent journal for completed messages or None
+    body_limiter = None  # limits of bodies in completed messages
+
+    _clock = time.time
 
-    def __init__(self, size=DEFAULT_SIZE):
+    def __init__(self, size=None, body_limiter=None):
+        """
+        :param size: max count of messages. None - DEFAULT_SIZE
+        :param body_limiter: limits of bodies in completed messages. None - bodies are not limited
+        """
         self.container = {}
-        self.size = size
+        self.size = self.DEFAULT_SIZE if size is None else size
+        self.body_limiter = LogBodyLimiter() if body_limiter is None else body_limiter
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._reset()
+
+    def _reset(self):
         self._latest_id = -1
+        self._next_seq = 0
+        self._seqs = {}  # dict with <position in ring: sequential id>
+        self._timestamps = {}  # dict with <position in ring: timestamp>
+        self._indexed_values = {}  # dict with <position in ring: dict with <field: value>>
+        self._indexes = {}  # dict with <field: dict with <value: set of sequential ids>>
+        self._body_sizes = {}  # dict with <position in ring: size of bodies in bytes>
+        self._body_size = 0
+        self._count_of_truncated = 0
+        self._spilled = {}  # dict with <position in ring: list of hashes of spilled bodies>
 
     def clear(self):
-        self.container = dict()
-        self._latest_id = -1
+        with self._lock:
+            spilled = self._spilled
+            self.container = dict()
+            self._reset()
+        for hashes in spilled.values():
+            self.body_limiter.release(hashes)
+        if self.journal is not None:
+            self.journal.clear()
+
+    def set_journal(self, journal):
+        """
+        Saves completed messages to persistent journal. Sequential ids continue after the last id in journal,
+        so ids of messages are the same in container and in journal after restart
+        :param journal: persistent journal
+        """
+        with self._lock:
+            self._next_seq = max(self._next_seq, journal.next_id)
+            self.journal = journal
+
+    def close(self):
+        """
+        Writes all queued messages to journal and stops it
+        """
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
 
     def get_latest_id(self):
         return self._latest_id
 
-    def add(self, value):
-        log_id = (self._latest_id + 1) % self.size
-        self.container[log_id] = value
-        self._latest_id = log_id
+    def add(self, value, **index_values):
+        """
+        Adds message. The oldest message is rewritten if container is full
+        :param value: message
+        :param index_values: values of fields to index message by
+        :return: sequential id of message
+        """
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            log_id = seq % self.size
+            if log_id in self._indexed_values:
+                self._remove_from_indexes(self._seqs[log_id], self._indexed_values[log_id])
+            self._body_size -= self._body_sizes.pop(log_id, 0)
+            spilled = self._spilled.pop(log_id, None)
+            self.container[log_id] = value
+            self._seqs[log_id] = seq
+            self._timestamps[log_id] = self._clock()
+            self._indexed_values[log_id] = {}
+            self._latest_id = log_id
+            self._add_to_indexes(seq, index_values)
+        if spilled is not None:
+            self.body_limiter.release(spilled)
+        return seq
+
+    def index(self, seq, **index_values):
+        """
+        Adds index values to message, e.g. when response for request is ready
+        :param seq: sequential id of message
+        :param index_values: values of fields to index message by
+        """
+        with self._lock:
+            self._add_to_indexes(seq, index_values)
+
+    def subscribe(self, filters=None, buffer_size=LogSubscription.DEFAULT_BUFFER_SIZE):
+        """
+        Subscribes to published messages
+        :param filters: dict with <field: value> of indexed fields. All of them must match
+        :param buffer_size: max count of messages waiting for subscriber
+        :return: subscription
+        """
+        subscription = LogSubscription(filters, buffer_size)
+        with self._lock:
+            self._subscriptions = self._subscriptions | {subscription}
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions = self._subscriptions - {subscription}
+
+    def get_statistics(self):
+        """
+        :return: dict with memory accounting of container
+        """
+        return {"entries": len(self.container),
+                "size": self.size,
+                "body_bytes": self._body_size,
+                "truncated_bodies": self._count_of_truncated}
+
+    def publish(self, seq):
+        """
+        Limits bodies of completed message and passes it to journal and subscribers. Never blocks.
+        Bodies are limited (hashed and maybe written to disk) outside of lock, so concurrent messages
+        can exceed total size of bodies by size of one message each
+        :param seq: sequential id of message
+        """
+        log_id = seq % self.size
+        with self._lock:
+            if self._seqs.get(log_id) != seq:
+                return
+            message = self.container[log_id]
+            total_size = self._body_size
+        body_size, count_of_truncated = self.body_limiter.limit(message, total_size)
+        spilled = self.body_limiter.get_spilled(message)
+        with self._lock:
+            is_current = self._seqs.get(log_id) == seq
+            if is_current:
+                self._body_size += body_size - self._body_sizes.get(log_id, 0)
+                self._body_sizes[log_id] = body_size
+                self._count_of_truncated += count_of_truncated
+                if len(spilled) > 0:
+                    self._spilled[log_id] = spilled
+        if not is_current:
+            # message was rewritten while its bodies were limited
+            self.body_limiter.release(spilled)
+            return
+
+        subscriptions = self._subscriptions
+        journal = self.journal
+        if len(subscriptions) == 0 and journal is None:
+            return
+        with self._lock:
+            if self._seqs.get(log_id) != seq:
+                return
+            item = (seq, self._timestamps[log_id], self.container[log_id])
+            indexed_values = self._indexed_values[log_id].copy()
+        if journal is not None:
+            journal.append(item[0], item[1], indexed_values, item[2])
+        for subscription in subscriptions:
+            if subscription.is_match(indexed_values):
+                subscription.put(item)
 
     def update_last_with_kv(self, key, value):
         if self._latest_id == -1:
@@ -30,3 +227,78 @@ class LogContainer(object):
         else:
             if isinstance(self.container[self._latest_id], dict):
                 self.container[self._latest_id][key] = value
+
+    def query(self, filters=None, cursor=None, limit=DEFAULT_QUERY_LIMIT, since=None, until=None):
+        """
+        Finds messages by indexed fields. If journal is set, messages are read from journal
+        :param filters: dict with <field: value>. All of them must match
+        :param cursor: sequential id. Only messages added after it are returned
+        :param limit: max count of messages. None - unlimited
+        :param since: timestamp. Only messages added at or after it are returned
+        :param until: timestamp. Only messages added before it are returned
+        :return: tuple (list of tuples (sequential id, timestamp, message) ordered by id, cursor for next query)
+        """
+        if self.journal is not None:
+            return self.journal.query(filters, cursor, limit, since, until)
+
+        with self._lock:
+            first_seq = max(0, self._next_seq - self.size)
+            if cursor is not None:
+                first_seq = max(first_seq, cursor + 1)
+            last_seq = self._next_seq
+            if since is not None:
+                first_seq = self._bisect_time(first_seq, last_seq, since)
+            if until is not None:
+                last_seq = self._bisect_time(first_seq, last_seq, until)
+
+            candidates = None
+            for field, value in (filters or {}).items():
+                seqs = self._indexes.get(field, {}).get(value, set())
+                candidates = seqs if candidates is None else candidates & seqs
+            if candidates is None:
+                seq_range = range(first_seq, last_seq)
+            else:
+                seq_range = sorted(seq for seq in candidates if first_seq <= seq < last_seq)
+
+            result = []
+            for seq in seq_range:
+                if limit is not None and len(result) >= limit:
+                    break
+                log_id = seq % self.size
+                result.append((seq, self._timestamps[log_id], self.container[log_id]))
+
+        next_cursor = result[-1][0] if len(result) > 0 else cursor
+        return result, next_cursor
+
+    def _bisect_time(self, first_seq, last_seq, timestamp):
+        """
+        :return: the first sequential id in range with time not less than timestamp
+        """
+        low, high = first_seq, last_seq
+        while low < high:
+            middle = (low + high) // 2
+            if self._timestamps[middle % self.size] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _add_to_indexes(self, seq, index_values):
+        log_id = seq % self.size
+        if self._seqs.get(log_id) != seq:
+            return
+        indexed_values = self._indexed_values[log_id]
+        for field, value in index_values.items():
+            if value is None:
+                continue
+            if field in indexed_values:
+                self._remove_from_indexes(seq, {field: indexed_values[field]})
+            indexed_values[field] = value
+            self._indexes.setdefault(field, {}).setdefault(value, set()).add(seq)
+
+    def _remove_from_indexes(self, seq, indexed_values):
+        for field, value in indexed_values.items():
+            seqs = self._indexes[field][value]
+            seqs.discard(seq)
+            if len(seqs) == 0:
+                del self._indexes[field][value]
@@ -0,0 +1,174 @@
+import bisect
+import collections
+import threading
+
+
+class Metrics(object):
+    """
+    Counters and histograms in Prometheus text format.
+    Every thread accumulates values in its own store, so there is no lock on request path.
+    Stores are summed on rendering. Stores of finished threads are merged into one, when a new thread registers
+    its store, so count of stores is bounded by count of running threads
+    """
+    DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._stores = collections.deque()  # deque of tuples (thread, store)
+        self._retired_store = self._new_store()
+        self._render_lock = threading.Lock()
+        self._help = {}  # dict with <name: (type, help text)>
+        self._gauges = {}  # dict with <name: function of summed counters>
+
+    @staticmethod
+    def _new_store():
+        return {'counters': {}, 'histograms': {}}
+
+    def _get_store(self):
+        store = getattr(self._local, 'store', None)
+        if store is None:
+            store = self._new_store()
+            self._local.store = store
+            with self._render_lock:
+                self._retire_finished()
+                self._stores.append((threading.current_thread(), store))
+        return store
+
+    def describe(self, name, metric_type, help_text):
+        """
+        :param name: name of metric
+        :param metric_type: counter, gauge or histogram
+        :param help_text: description of metric
+        """
+        self._help[name] = (metric_type, help_text)
+
+    def add_gauge(self, name, help_text, function):
+        """
+        Adds gauge calculated on rendering
+        :param name: name of metric
+        :param help_text: description of metric
+        :param function: function with argument - dict with summed counters. Returns value of gauge
+        """
+        self.describe(name, 'gauge', help_text)
+        self._gauges[name] = function
+
+    def inc(self, name, labels=(), value=1):
+        """
+        Increments counter
+        :param name: name of metric
+        :param labels: tuple of tuples (label, value)
+        :param value: increment
+        """
+        counters = self._get_store()['counters']
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        """
+        Adds value to histogram
+        :param name: name of metric
+        :param labels: tuple of tuples (label, value)
+        :param seconds: observed value
+        """
+        histograms = self._get_store()['histograms']
+        key = (name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = [[0] * (len(self.buckets) + 1), 0.0]
+            histograms[key] = histogram
+        histogram[0][bisect.bisect_left(self.buckets, seconds)] += 1
+        histogram[1] += seconds
+
+    def get_counters(self):
+        """
+        :return: dict with <(name, labels): value> summed over all threads
+        """
+        counters, histograms = self._collect()
+        return counters
+
+    def get_histograms(self):
+        """
+        :return: dict with <(name, labels): [list of counts per bucket, sum]> summed over all threads
+        """
+        counters, histograms = self._collect()
+        return histograms
+
+    def render(self):
+        """
+        :return: metrics in Prometheus text format
+        """
+        counters, histograms = self._collect()
+        lines = []
+        described = set()
+        for (name, labels), value in sorted(counters.items()):
+            self._add_help(lines, described, name)
+            lines.append('%s%s %s' % (name, self._format_labels(labels), value))
+        for name, function in sorted(self._gauges.items()):
+            self._add_help(lines, described, name)
+            lines.append('%s %s' % (name, function(counters)))
+        for (name, labels), (counts, total) in sorted(histograms.items()):
+            self._add_help(lines, described, name)
+            cumulative = 0
+            for bucket, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append('%s_bucket%s %s' % (name, self._format_labels(labels + (('le', str(bucket)),)),
+                                                 cumulative))
+            lines.append('%s_sum%s %s' % (name, self._format_labels(labels), total))
+            lines.append('%s_count%s %s' % (name, self._format_labels(labels), cumulative))
+        return '\n'.join(lines) + '\n'
+
+    def _add_help(self, lines, described, name):
+        if name in described or name not in self._help:
+            return
+        described.add(name)
+        metric_type, help_text = self._help[name]
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, metric_type))
+
+    @staticmethod
+    def _format_labels(labels):
+        if len(labels) == 0:
+            return ''
+        return '{%s}' % ','.join('%s="%s"' % (label, str(value).replace('\\', '\\\\')
+                                              .replace('"', '\\"').replace('\n', '\\n'))
+                                 for label, value in labels)
+
+    def _retire_finished(self):
+        """
+        Merges stores of finished threads into retired store. Must be called under render lock
+        """
+        for i in range(len(self._stores)):
+            thread, store = self._stores.popleft()
+            if thread.is_alive():
+                self._stores.append((thread, store))
+            else:
+                self._merge(self._retired_store, store)
+
+    def _collect(self):
+        with self._render_lock:
+            self._retire_finished()
+            stores = [self._retired_store] + [store for thread, store in list(self._stores)]
+
+            counters = {}
+            histograms = {}
+            for store in stores:
+                for key, value in store['counters'].copy().items():
+                    counters[key] = counters.get(key, 0) + value
+                for key, (counts, total) in store['histograms'].copy().items():
+                    if key not in histograms:
+                        histograms[key] = [[0] * len(counts), 0.0]
+                    histograms[key][0] = [a + b for a, b in zip(histograms[key][0], counts)]
+                    histograms[key][1] += total
+        return counters, histograms
+
+    @staticmethod
+    def _merge(target, source):
+        for key, value in source['counters'].items():
+            target['counters'][key] = target['counters'].get(key, 0) + value
+        for key, (counts, total) in source['histograms'].items():
+            if key not in target['histograms']:
+                target['histograms'][key] = [[0] * len(counts), 0.0]
+            histogram = target['histograms'][key]
+            histogram[0] = [a + b for a, b in zip(histogram[0], counts)]
+            histogram[1] += total
@@ -0,0 +1,206 @@
+import itertools
+import os
+import threading
+from urllib.parse import quote
+
+from expectation_manager import ExpectationManager
+from extensions import Extensions
+from log_container import LogContainer
+from persistent_journal import PersistentJournal
+
+
+class Namespace:
+    """
+    Isolated set of expectations with its own request log
+    """
+    name = None
+    expectation_manager = None
+    log_container = None
+    fallback = None  # expectation manager of global namespace or None
+
+    def __init__(self, name, expectation_manager=None, log_container=None, fallback=None):
+        self.name = name
+        self.expectation_manager = ExpectationManager() if expectation_manager is None else expectation_manager
+        self.log_container = LogContainer() if log_container is None else log_container
+        self.fallback = fallback
+        self._request_counter = itertools.count(1)
+        self._request_count = 0
+
+    @property
+    def request_count(self):
+        return self._request_count
+
+    def count_request(self):
+        self._request_count = next(self._request_counter)
+
+    def get_expectation_for_request(self, request):
+        """
+        :param request: incoming request
+        :return: tuple (key, expectation) from this namespace or from global namespace
+        """
+        return self.expectation_manager.get_expectation_for_request(request, self.fallback)
+
+    def get_near_misses(self, request, count):
+        """
+        :param request: incoming request without matched expectation
+        :param count: max count of expectations in result
+        :return: list of the closest expectations from this namespace and from global namespace
+        """
+        return self.expectation_manager.get_near_misses(request, count, self.fallback)
+
+    def clear(self):
+        self.expectation_manager.clear()
+        self.log_container.clear()
+
+    def to_dict(self):
+        return {"name": self.name,
+                "expectations": len(self.expectation_manager.get_expectations()),
+                "requests": self._request_count,
+                "expectations_bytes": Extensions.get_deep_size(self.expectation_manager.get_expectations()),
+                "logs_bytes": Extensions.get_deep_size(self.log_container.container)}
+
+
+class NamespaceManager:
+    """
+    Class for managing namespaces. Namespace of incoming request is selected by header or by path prefix:
+     - header 'X-Flamock-Namespace: team-a'
+     - path 'ns/team-a/path/to/resource', where 'ns' is path prefix. Prefix and namespace are cut from path
+
+    Requests without namespace belong to global namespace. Namespaces are created by admin requests only,
+    requests with unknown namespace also belong to global namespace, so count of namespaces doesn't grow
+    with distinct headers or paths of requests
+    """
+    GLOBAL = ''
+
+    header = None
+    path_prefix = None
+    use_global = True  # if True, namespaces also use expectations from global namespace
+    journal_directory = None  # if set, logs of each namespace are saved to subdirectory of it
+    journal_segment_size = PersistentJournal.DEFAULT_SEGMENT_SIZE
+    journal_max_segments = None
+    log_size = None  # count of messages in log of each namespace. None - LogContainer.DEFAULT_SIZE
+    log_body_limiter = None  # limits of bodies in log of each namespace. None - bodies are not limited
+
+    _namespaces = None  # dict with <name: Namespace>
+
+    def __init__(self, global_expectation_manager=None, global_log_container=None, log_size=None,
+                 log_body_limiter=None):
+        """
+        :param global_expectation_manager: expectation manager of global namespace
+        :param global_log_container: log container of global namespace
+        :param log_size: count of messages in log of each created namespace. None - LogContainer.DEFAULT_SIZE
+        :param log_body_limiter: limits of bodies in log of each created namespace. None - bodies are not limited
+        """
+        self.log_size = log_size
+        self.log_body_limiter = log_body_limiter
+        self._namespaces = {self.GLOBAL: Namespace(self.GLOBAL, global_expectation_manager, global_log_container)}
+        self._lock = threading.Lock()
+
+    @property
+    def global_namespace(self):
+        return self._namespaces[self.GLOBAL]
+
+    def find(self, name):
+        """
+        :param name: name of namespace. None or empty string for global namespace
+        :return: namespace or None if it doesn't exist
+        """
+        return self._namespaces.get(name or self.GLOBAL)
+
+    def get(self, name):
+        """
+        Gets namespace by name. Creates it if it doesn't exist. Used by admin requests
+        :param name: name of namespace. None or empty string for global namespace
+        :return: namespace
+        """
+        if not name:
+            name = self.GLOBAL
+        namespace = self._namespaces.get(name)
+        if namespace is None:
+            with self._lock:
+                namespace = self._namespaces.get(name)
+                if namespace is None:
+                    fallback = self.global_namespace.expectation_manager if self.use_global else None
+                    expectation_manager = ExpectationManager(self.global_namespace.expectation_manager.body_file_dir)
+                    log_container = LogContainer(self.log_size, self.log_body_limiter)
+                    namespace = Namespace(name, expectation_manager, log_container, fallback=fallback)
+                    self._set_journal(namespace)
+                    self._namespaces[name] = namespace
+        return namespace
+
+    def remove(self, name):
+        """
+        Removes namespace with its expectations and logs. Global namespace is cleared only
+        :return: True if namespace existed
+        """
+        if not name:
+            self.global_namespace.clear()
+            return True
+        with self._lock:
+            namespace = self._namespaces.pop(name, None)
+        if namespace is None:
+            return False
+        namespace.log_container.clear()
+        namespace.log_container.close()
+        return True
+
+    def enable_journal(self, directory, segment_size=PersistentJournal.DEFAULT_SEGMENT_SIZE, max_segments=None):
+        """
+        Saves logs of all namespaces to persistent journals
+        :param directory: root directory for journals
+        :param segment_size: size of segment file in bytes
+        :param max_segments: max count of segment files of each namespace. None - unlimited
+        """
+        self.journal_directory = directory
+        self.journal_segment_size = segment_size
+        self.journal_max_segments = max_segments
+        for namespace in list(self._namespaces.values()):
+            self._set_journal(namespace)
+
+    def _set_journal(self, namespace):
+        if self.journal_directory is None or namespace.log_container.journal is not None:
+            return
+        directory_name = 'ns_%s' % quote(namespace.name, safe='') if namespace.name else '_global'
+        namespace.log_container.set_journal(PersistentJournal(os.path.join(self.journal_directory, directory_name),
+                                                              self.journal_segment_size,
+                                                              max_segments=self.journal_max_segments))
+
+    def get_namespace_name(self, request):
+        """
+        :param request: incoming request
+        :return: name of namespace from header or path prefix. Empty string for global namespace
+        """
+        if self.header is not None and 'headers' in request and isinstance(request['headers'], dict):
+            name = Extensions.get_header(request['headers'], self.header)
+            if name:
+                return name
+
+        if self.path_prefix is not None and 'path' in request:
+            prefix = self.path_prefix + '/'
+            if request['path'].startswith(prefix):
+                return request['path'][len(prefix):].split('/', 1)[0].split('?', 1)[0]
+        return self.GLOBAL
+
+    def resolve(self, request):
+        """
+        Selects namespace for incoming request. Request with unknown namespace goes to global namespace as is
+        :param request: incoming request
+        :return: tuple (namespace, request). Path of request is cut if namespace is selected by path prefix
+        """
+        namespace = self.find(self.get_namespace_name(request))
+        if namespace is None:
+            return self.global_namespace, request
+        name = namespace.name
+        if name and self.path_prefix is not None and 'path' in request:
+            prefix = '%s/%s' % (self.path_prefix, name)
+            path = request['path']
+            if path.startswith(prefix) and path[len(prefix):len(prefix) + 1] in ('', '/', '?'):
+                request = dict(request)
+                request['path'] = path[len(prefix):].lstrip('/')
+        return namespace, request
+
+    def to_list(self):
+        """
+        :return: list with statistics of all namespaces
+        """
+        return [namespace.to_dict() for name, namespace in sorted(self._namespaces.copy().items())]
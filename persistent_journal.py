@@ -0,0 +1,347 @@
+import heapq
+import itertools
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+
+
+class SegmentIndex(object):
+    """
+    In-memory index of one segment: id, timestamp and position of every record and records by values of
+    indexed fields. Queries find records by index, so only messages of found records are decoded
+    """
+    def __init__(self):
+        self.ids = []
+        self.timestamps = []
+        self.offsets = []  # offsets of messages in segment file
+        self.lengths = []  # lengths of messages in bytes
+        self.values = {}  # dict with <field: dict with <value: list of positions of records>>
+        self.max_id = None
+        self.min_timestamp = None
+        self.max_timestamp = None
+
+    def add(self, record_id, timestamp, indexed_values, offset, length):
+        position = len(self.ids)
+        self.ids.append(record_id)
+        self.timestamps.append(timestamp)
+        self.offsets.append(offset)
+        self.lengths.append(length)
+        for field, value in indexed_values.items():
+            if isinstance(value, (str, int, float, bool)):
+                self.values.setdefault(field, {}).setdefault(value, []).append(position)
+        self.max_id = record_id if self.max_id is None else max(self.max_id, record_id)
+        self.min_timestamp = timestamp if self.min_timestamp is None else min(self.min_timestamp, timestamp)
+        self.max_timestamp = timestamp if self.max_timestamp is None else max(self.max_timestamp, timestamp)
+
+    def find(self, filters, cursor=None, since=None, until=None):
+        """
+        Parameters are the same as in LogContainer.query
+        :return: list of positions of found records
+        """
+        if self.max_id is None or (cursor is not None and self.max_id <= cursor) or \
+                (since is not None and self.max_timestamp < since) or \
+                (until is not None and self.min_timestamp >= until):
+            return []
+        positions = None
+        for field, value in filters.items():
+            found = self.values.get(field, {}).get(value, [])
+            positions = set(found) if positions is None else positions & set(found)
+        if positions is None:
+            positions = range(len(self.ids))
+        ids = self.ids
+        timestamps = self.timestamps
+        return [position for position in positions
+                if (cursor is None or ids[position] > cursor) and
+                (since is None or timestamps[position] >= since) and
+                (until is None or timestamps[position] < until)]
+
+
+class PersistentJournal(object):
+    """
+    Append-only journal of log messages on disk.
+    Records are written by background thread to segment files as 4-byte big-endian length of header,
+    4-byte big-endian length of message, header and message in JSON. Header is
+    {"id": id, "ts": timestamp, "index": {field: value}}
+    Ids are sequential ids of log container, so the same id is used by log queries, stream and journal.
+    A new segment is started when current one exceeds segment size. Segments are named by id of first record.
+    Every segment has in-memory index, which is built from headers when segment is read for the first time.
+    Segments are read through mmap
+    """
+    DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+    DEFAULT_QUEUE_SIZE = 100000
+    DEFAULT_BATCH_SIZE = 500
+    BATCH_INTERVAL = 0.05  # seconds to wait for more records before writing a batch
+    FLUSH_TIMEOUT = 5  # max seconds, which query waits for records appended before it
+    SEGMENT_SUFFIX = '.journal'
+
+    _lengths_format = struct.Struct('>II')
+
+    def __init__(self, directory, segment_size=DEFAULT_SEGMENT_SIZE, queue_size=DEFAULT_QUEUE_SIZE,
+                 max_segments=None):
+        """
+        :param directory: directory for segment files. Created if it doesn't exist
+        :param segment_size: size of segment in bytes before rotation
+        :param queue_size: max count of records waiting for writing. Extra records are dropped
+        :param max_segments: max count of segment files. The oldest segments are removed. None - unlimited
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        os.makedirs(directory, exist_ok=True)
+        self._queue = queue.Queue(queue_size)
+        self._write_lock = threading.Lock()
+        self._dropped_counter = itertools.count(1)
+        self._dropped = 0
+        self._appended_counter = itertools.count(1)
+        self._appended = 0  # count of records put to queue
+        self._written = 0  # count of records taken from queue and written (or dropped) by writer thread
+        self._written_condition = threading.Condition()
+        self._file = None
+        self._file_index = None
+        self._indexes = {}  # dict with <path of segment: SegmentIndex>
+        self._next_id = self._find_next_id()
+        self._thread = threading.Thread(target=self._run, name='journal-writer', daemon=True)
+        self._thread.start()
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+    @property
+    def next_id(self):
+        """
+        :return: id after the biggest id in journal
+        """
+        return self._next_id
+
+    def append(self, record_id, timestamp, indexed_values, message):
+        """
+        Puts record to queue of writer thread. Never blocks
+        """
+        try:
+            self._queue.put_nowait((record_id, timestamp, indexed_values, message))
+        except queue.Full:
+            self._dropped = next(self._dropped_counter)
+            return
+        self._appended = next(self._appended_counter)
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """
+        Waits until records appended before the call are written. Records appended during waiting
+        are not waited for, so it returns under constant appending too
+        :param timeout: max seconds to wait. None - unlimited
+        :return: True if records are written, False on timeout
+        """
+        appended = self._appended
+        with self._written_condition:
+            return self._written_condition.wait_for(lambda: self._written >= appended, timeout)
+
+    def close(self):
+        """
+        Writes queued records and stops writer thread
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def clear(self):
+        """
+        Removes all segments
+        """
+        self.flush()
+        with self._write_lock:
+            self._close_file()
+            for first_id, path in self._get_segments():
+                os.remove(path)
+            self._indexes.clear()
+            self._next_id = 0
+
+    def get_statistics(self):
+        segments = self._get_segments()
+        return {"segments": len(segments),
+                "bytes": sum(os.path.getsize(path) for first_id, path in segments),
+                "queue_size": self._queue.qsize(),
+                "dropped": self._dropped}
+
+    def query(self, filters=None, cursor=None, limit=None, since=None, until=None):
+        """
+        Finds records by indexes of segments. Parameters are the same as in LogContainer.query
+        :return: tuple (list of tuples (id, timestamp, message) ordered by id, cursor for next query)
+        """
+        self.flush()
+        filters = filters or {}
+        segments = self._get_segments()
+        found = []  # list of tuples (id, timestamp, path, offset of message, length of message)
+        for first_id, path in segments:
+            index = self._get_index(path)
+            with self._write_lock:
+                for position in index.find(filters, cursor, since, until):
+                    found.append((index.ids[position], index.timestamps[position], path,
+                                  index.offsets[position], index.lengths[position]))
+        with self._write_lock:
+            paths = set(path for first_id, path in segments)
+            for path, index in list(self._indexes.items()):
+                if path not in paths and index is not self._file_index:
+                    del self._indexes[path]
+
+        found = sorted(found) if limit is None else heapq.nsmallest(limit, found)
+        messages = {}
+        for path in set(record[2] for record in found):
+            positions = [(offset, length) for record_id, timestamp, record_path, offset, length in found
+                         if record_path == path]
+            messages.update(self._read_messages(path, positions))
+        result = [(record_id, timestamp, messages[(path, offset)])
+                  for record_id, timestamp, path, offset, length in found if (path, offset) in messages]
+        next_cursor = result[-1][0] if len(result) > 0 else cursor
+        return result, next_cursor
+
+    def _read_messages(self, path, positions):
+        """
+        :param positions: list of tuples (offset, length) of messages
+        :return: dict with <(path, offset): message>. Empty if segment is removed
+        """
+        messages = {}
+        try:
+            with open(path, 'rb') as segment_file:
+                with mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    for offset, length in positions:
+                        messages[(path, offset)] = json.loads(mapped[offset:offset + length].decode())
+        except (FileNotFoundError, ValueError):
+            return {}
+        return messages
+
+    def _get_index(self, path):
+        index = self._indexes.get(path)
+        if index is None:
+            index = self._build_index(path)
+            with self._write_lock:
+                index = self._indexes.setdefault(path, index)
+        return index
+
+    def _build_index(self, path):
+        """
+        Reads headers of records of segment. Incomplete record in the end of segment is ignored
+        :return: SegmentIndex
+        """
+        index = SegmentIndex()
+        try:
+            with open(path, 'rb') as segment_file:
+                if os.fstat(segment_file.fileno()).st_size == 0:
+                    return index
+                with mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    offset = 0
+                    size = len(mapped)
+                    while offset + self._lengths_format.size <= size:
+                        header_length, message_length = self._lengths_format.unpack_from(mapped, offset)
+                        offset += self._lengths_format.size
+                        if offset + header_length + message_length > size:
+                            break
+                        header = json.loads(mapped[offset:offset + header_length].decode())
+                        offset += header_length
+                        index.add(header['id'], header['ts'], header['index'], offset, message_length)
+                        offset += message_length
+        except FileNotFoundError:
+            pass
+        return index
+
+    def _get_segments(self):
+        """
+        :return: list of tuples (id of first record, path) ordered by id
+        """
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.SEGMENT_SUFFIX):
+                try:
+                    first_id = int(name[:-len(self.SEGMENT_SUFFIX)])
+                except ValueError:
+                    continue
+                segments.append((first_id, os.path.join(self.directory, name)))
+        return sorted(segments)
+
+    def _find_next_id(self):
+        max_ids = [self._get_index(path).max_id for first_id, path in self._get_segments()]
+        return max([max_id for max_id in max_ids if max_id is not None], default=-1) + 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            if batch[0] is not None and self._queue.qsize() < self.DEFAULT_BATCH_SIZE:
+                time.sleep(self.BATCH_INTERVAL)
+            while len(batch) < self.DEFAULT_BATCH_SIZE and batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            is_stopped = batch[-1] is None
+            if is_stopped:
+                batch.pop()
+            try:
+                self._write(batch)
+            except Exception:
+                for i in range(len(batch)):
+                    self._dropped = next(self._dropped_counter)
+            finally:
+                with self._written_condition:
+                    self._written += len(batch)
+                    self._written_condition.notify_all()
+            if is_stopped:
+                with self._write_lock:
+                    self._close_file()
+                return
+
+    def _write(self, batch):
+        with self._write_lock:
+            chunks = []
+            headers = []  # list of tuples (id, timestamp, indexed values, offset of message, length of message)
+            size = self._file.tell() if self._file is not None else None
+            for record_id, timestamp, indexed_values, message in batch:
+                if size is None or size >= self.segment_size:
+                    self._write_chunks(chunks, headers)
+                    chunks = []
+                    headers = []
+                    self._rotate(record_id)
+                    size = self._file.tell()
+                header = json.dumps({"id": record_id, "ts": timestamp, "index": indexed_values}, default=str).encode()
+                data = json.dumps(message, default=str).encode()
+                chunks.append(self._lengths_format.pack(len(header), len(data)))
+                chunks.append(header)
+                chunks.append(data)
+                size += self._lengths_format.size + len(header)
+                headers.append((record_id, timestamp, indexed_values, size, len(data)))
+                size += len(data)
+                self._next_id = max(self._next_id, record_id + 1)
+            self._write_chunks(chunks, headers)
+
+    def _write_chunks(self, chunks, headers):
+        """
+        Writes records to current segment and adds them to its index
+        """
+        if self._file is None or len(chunks) == 0:
+            return
+        self._file.write(b''.join(chunks))
+        self._file.flush()
+        for header in headers:
+            self._file_index.add(*header)
+
+    def _rotate(self, first_id):
+        self._close_file()
+        path = os.path.join(self.directory, '%020d%s' % (first_id, self.SEGMENT_SUFFIX))
+        self._file = open(path, 'ab')
+        self._file_index = self._indexes.get(path)
+        if self._file_index is None:
+            self._file_index = self._build_index(path)
+            self._indexes[path] = self._file_index
+        if self.max_segments is not None:
+            segments = self._get_segments()
+            for first_id, old_path in segments[:max(0, len(segments) - self.max_segments)]:
+                os.remove(old_path)
+                self._indexes.pop(old_path, None)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._file_index = None
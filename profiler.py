@@ -0,0 +1,188 @@
+import cProfile
+import collections
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+
+from custom_reponse import CustomResponse
+from status_codes import codes
+
+
+class Profiler(object):
+    """
+    Profiler of mocked requests. It is created only when profiling is started, so requests
+    are not slowed down otherwise.
+
+    Modes:
+     - cprofile # every request is run under cProfile. Result is aggregated pstats output
+     - sampling # background thread samples stacks of request threads. Result is collapsed stacks for flame graphs
+
+    Profiling is stopped after given count of requests, given count of seconds or on demand
+    """
+    CPROFILE = 'cprofile'
+    SAMPLING = 'sampling'
+    DEFAULT_INTERVAL = 0.005  # seconds between samples in sampling mode
+    DEFAULT_PSTATS_SORT = 'cumulative'
+    DEFAULT_PSTATS_LIMIT = 50
+
+    _clock = time.monotonic
+
+    def __init__(self, mode=CPROFILE, max_requests=None, seconds=None, interval=DEFAULT_INTERVAL):
+        self.mode = mode
+        self.max_requests = max_requests
+        self.interval = interval
+        self._deadline = None if seconds is None else self._clock() + seconds
+        self._lock = threading.Lock()
+        self._is_active = True
+        self._count_of_started = 0
+        self._count_of_profiled = 0
+        self._count_of_skipped = 0
+        self._stats = None  # aggregated pstats.Stats in cprofile mode
+        self._stacks = collections.Counter()  # count of samples by collapsed stack in sampling mode
+        self._thread_ids = set()  # threads which are processing requests in sampling mode
+        self._sampler = None
+        if mode == self.SAMPLING:
+            self._sampler = threading.Thread(target=self._sample, name='flamock-profiler', daemon=True)
+            self._sampler.start()
+
+    @classmethod
+    def from_dict(cls, settings):
+        """
+        :param settings: dict with optional fields 'mode', 'requests', 'seconds' and 'interval' (seconds)
+        :return: tuple (profiler or None, custom response)
+        """
+        mode = settings.get('mode', cls.CPROFILE)
+        if mode not in (cls.CPROFILE, cls.SAMPLING):
+            return None, CustomResponse("Error! Field 'mode' must be '%s' or '%s'" % (cls.CPROFILE, cls.SAMPLING),
+                                        codes.bad)
+        max_requests = settings.get('requests')
+        if max_requests is not None and (not isinstance(max_requests, int) or isinstance(max_requests, bool) or
+                                         max_requests <= 0):
+            return None, CustomResponse("Error! Field 'requests' must be positive integer", codes.bad)
+        for field in ('seconds', 'interval'):
+            value = settings.get(field)
+            if value is not None and (not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0):
+                return None, CustomResponse("Error! Field '%s' must be positive number" % field, codes.bad)
+        profiler = cls(mode, max_requests, settings.get('seconds'), settings.get('interval', cls.DEFAULT_INTERVAL))
+        return profiler, CustomResponse("Profiling in mode '%s' was started" % mode)
+
+    @property
+    def is_active(self):
+        if self._is_active and self._deadline is not None and self._clock() >= self._deadline:
+            self.stop()
+        return self._is_active
+
+    def stop(self):
+        with self._lock:
+            self._is_active = False
+        if self._sampler is not None and self._sampler is not threading.current_thread():
+            self._sampler.join()
+
+    def run(self, function, *args):
+        """
+        Runs function under profiler, if profiling is still active
+        :return: result of function
+        """
+        if not self.is_active:
+            return function(*args)
+        with self._lock:
+            if not self._is_active or (self.max_requests is not None and self._count_of_started >= self.max_requests):
+                return function(*args)
+            self._count_of_started += 1
+
+        try:
+            if self.mode == self.CPROFILE:
+                return self._run_with_cprofile(function, *args)
+            return self._run_with_sampling(function, *args)
+        finally:
+            with self._lock:
+                self._count_of_profiled += 1
+                is_finished = self.max_requests is not None and self._count_of_profiled >= self.max_requests
+            if is_finished:
+                self.stop()
+
+    def _run_with_cprofile(self, function, *args):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is active in this interpreter, e.g. for concurrent request on python 3.12+
+            with self._lock:
+                self._count_of_skipped += 1
+            return function(*args)
+        try:
+            return function(*args)
+        finally:
+            profile.disable()
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+
+    def _run_with_sampling(self, function, *args):
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._thread_ids = self._thread_ids | {thread_id}
+        try:
+            return function(*args)
+        finally:
+            with self._lock:
+                self._thread_ids = self._thread_ids - {thread_id}
+
+    def _sample(self):
+        while self.is_active:
+            time.sleep(self.interval)
+            thread_ids = self._thread_ids
+            if len(thread_ids) == 0:
+                continue
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    stack = self.collapse_stack(frame)
+                    with self._lock:
+                        self._stacks[stack] += 1
+
+    @staticmethod
+    def collapse_stack(frame):
+        """
+        :param frame: the innermost frame of stack
+        :return: stack as string 'outer;...;inner'. Frame is described as 'function (file:line)'
+        """
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append('%s (%s:%s)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+            frame = frame.f_back
+        names.reverse()
+        return ';'.join(names)
+
+    def get_statistics(self):
+        """
+        :return: dict with state of profiler
+        """
+        return {"mode": self.mode,
+                "active": self.is_active,
+                "profiled_requests": self._count_of_profiled,
+                "skipped_requests": self._count_of_skipped,
+                "samples": sum(self._stacks.values())}
+
+    def get_stats_as_text(self, sort=DEFAULT_PSTATS_SORT, limit=DEFAULT_PSTATS_LIMIT):
+        """
+        :param sort: sort key of pstats output
+        :param limit: max count of functions in pstats output
+        :return: pstats output in cprofile mode or collapsed stacks 'stack count' per line in sampling mode
+        """
+        with self._lock:
+            if self.mode == self.SAMPLING:
+                return ''.join('%s %s\n' % (stack, count) for stack, count in self._stacks.most_common())
+            if self._stats is None:
+                return ''
+            stream = io.StringIO()
+            self._stats.stream = stream
+            self._stats.sort_stats(sort).print_stats(limit)
+            return stream.getvalue()
@@ -1,15 +1,17 @@
+import json
 import logging
 import time
 
-import requests
-import urllib3
-from requests.status_codes import codes
+from werkzeug.http import parse_accept_header
 
 from custom_reponse import CustomResponse
+from expectation import Expectation
 from expectation_matcher import ExpectationMatcher
-from extensions import Extensions
+from host_whitelist import HostWhitelist
 from json_logging import JsonLogging
-from log_container import LogContainer
+from log_container import LogContainer, LogSubscription
+from metrics import Metrics
+from status_codes import codes
 
 
 class ResponseManager:
@@ -34,51 +36,99 @@ class ResponseManager:
      - - httpcode
      - - headers
      - - body
+     - - body_file # path to file with body. Used instead of body
+     - - compress # true or list of content encodings
+     - - throttle # slow network simulation, see Throttle. Also available for forward
+     - - template # bool. If true, body and headers are templates, see ResponseTemplate
 
      - delay # int
      - priority # int. 0 - lowest priority
+     - times # int. Count of hits before expectation is removed
+     - ttl # number of seconds before expectation is removed
+     - unlimited # bool. If true, 'times' is ignored
 
     """
 
-    host_whitelist = []
+    server_timing = False  # if true, duration of phases is added to responses and log entries
+    miss_status_code = codes.ok  # status of response without matched expectation
+    miss_body = None  # body of response without matched expectation. None - method and path of request
+    miss_diagnostics = 0  # count of the closest expectations in response without matched expectation. 0 - disabled
+    MISS_PATH_LIMIT = 200  # max count of chars of path in default body of response without matched expectation
     log_container = None
     logs_url = None
+    namespace_manager = None
 
     _logger = JsonLogging
     _expectation_manager = None
     _do_request = None
+    _requests_request = None  # requests.request, when it is imported
 
-    def __init__(self, expectation_manager=None, do_request=None):
+    def __init__(self, expectation_manager=None, do_request=None, log_container=None):
         self._expectation_manager = expectation_manager
-        self.log_container = LogContainer()
+        self.whitelist = HostWhitelist()
+        self.log_container = LogContainer() if log_container is None else log_container
+        self.metrics = Metrics()
+        self.metrics.describe('flamock_requests_total', 'counter', 'Requests by matched expectation and status')
+        self.metrics.describe('flamock_no_match_total', 'counter', 'Requests without matched expectation')
+        self.metrics.describe('flamock_phase_seconds', 'histogram',
+                              'Time of matching, delay, forward and response phases')
+        self.metrics.describe('flamock_forward_seconds', 'histogram', 'Time of forward requests by host')
+        self.metrics.add_gauge('flamock_in_flight_requests', 'Requests in progress',
+                               lambda counters: counters.get(('flamock_requests_started_total', ()), 0) -
+                               counters.get(('flamock_requests_finished_total', ()), 0))
 
         if do_request is None:
-            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-            logging.getLogger('requests.packages.urllib3.connectionpool').setLevel(logging.ERROR)
-
-            self._do_request = requests.request
+            self._do_request = self._request_with_requests
         else:
             self._do_request = do_request
 
-    def apply_action_from_expectation_to_request(self, expectation, request):
+    @classmethod
+    def _request_with_requests(cls, **kwargs):
+        """
+        Makes request with 'requests'. It is imported on the first forward request,
+        so flamock without forwarding doesn't spend startup time on it
+        :param kwargs: arguments of requests.request
+        :return: response of requests
+        """
+        if cls._requests_request is None:
+            import requests
+            import urllib3
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+            logging.getLogger('requests.packages.urllib3.connectionpool').setLevel(logging.ERROR)
+            ResponseManager._requests_request = requests.request
+        return cls._requests_request(**kwargs)
+
+    def apply_action_from_expectation_to_request(self, expectation, request, log_entry=None, timings=None):
         """
         executes 'action' of expectation
         :param expectation: expectation to be executed
         :param request: incoming request
+        :param log_entry: dict from log container to be updated with details of action
+        :param timings: dict to be updated with duration of phases in ns or None
         :return: custom response with result of action
         """
-        if 'delay' in expectation:
-            time.sleep(int(expectation['delay']))
+        if not isinstance(expectation, Expectation):
+            expectation = Expectation(expectation)
+
+        if expectation.delay is not None:
+            start_time = time.perf_counter_ns()
+            time.sleep(int(expectation.delay))
+            self._observe_phase('delay', time.perf_counter_ns() - start_time, timings)
 
-        if 'response' in expectation:
-            expected_response = expectation['response']
-            response_body = expected_response['body'] if 'body' in expected_response else ""
-            response_code = expected_response['httpcode'] if 'httpcode' in expected_response else 200
-            response_headers = expected_response['headers'] if 'headers' in expected_response else {}
-            return CustomResponse(text=response_body, status_code=response_code, headers=response_headers)
+        if expectation.has_response:
+            if expectation.response_template is not None:
+                return expectation.response_template.render(request)
+            return expectation.static_response
 
-        if 'forward' in expectation:
-            return self.make_forward_request(expectation['forward'], request)
+        if expectation.forward is not None:
+            start_time = time.perf_counter_ns()
+            response = self.make_forward_request(expectation.forward, request, log_entry)
+            response.throttle = expectation.forward_throttle
+            duration = time.perf_counter_ns() - start_time
+            self._observe_phase('forward', duration, timings)
+            self.metrics.observe('flamock_forward_seconds', (('host', expectation.forward.get('host', '')),),
+                                 duration / 1e9)
+            return response
         return None
 
     def generate_response(self, request):
@@ -91,52 +141,154 @@ class ResponseManager:
         :param request: Any request into mock
         :return: custom response with result
         """
-        self.log_container.add({'request': request})
+        response, log_context = self._generate_response(request)
+        self._complete_log_entry(response, log_context)
+        return response
+
+    def generate_flask_response(self, request):
+        """
+        Makes flask response for request. If server_timing is set, duration of phases
+        is added to response as 'Server-Timing' header and to log entry as 'timing' field
+        :param request: Any request into mock
+        :return: flask response
+        """
+        timings = {} if self.server_timing else None
+        response, log_context = self._generate_response(request, timings)
+        start_time = time.perf_counter_ns()
+        flask_response = response.to_flask_response()
+        self._observe_phase('response', time.perf_counter_ns() - start_time, timings)
+        if timings is not None:
+            flask_response.headers['Server-Timing'] = self.format_server_timing(timings)
+        self._complete_log_entry(response, log_context, timings)
+        return flask_response
+
+    @staticmethod
+    def format_server_timing(timings):
+        """
+        :param timings: dict with <phase: duration in ns>
+        :return: value of 'Server-Timing' header with durations in ms
+        """
+        return ', '.join('%s;dur=%.3f' % (phase, duration / 1e6) for phase, duration in timings.items())
+
+    def _observe_phase(self, phase, duration, timings=None):
+        """
+        :param phase: name of phase
+        :param duration: duration of phase in ns
+        :param timings: dict to be updated with duration of phase or None
+        """
+        self.metrics.observe('flamock_phase_seconds', (('phase', phase),), duration / 1e9)
+        if timings is not None:
+            timings[phase] = duration
+
+    def _generate_response(self, request, timings=None):
+        """
+        :return: tuple (custom response, log context for _complete_log_entry)
+        """
+        if self.namespace_manager is None:
+            namespace = None
+            log_container = self.log_container
+        else:
+            namespace, request = self.namespace_manager.resolve(request)
+            namespace.count_request()
+            log_container = namespace.log_container
+        namespace_name = namespace.name if namespace is not None else ''
+
+        log_entry = {'request': request}
+        log_seq = log_container.add(log_entry,
+                                    method=request['method'] if 'method' in request else None,
+                                    path=request['path'].split('?', 1)[0] if 'path' in request else None)
         if self.logs_url is None:
-            self._logger.info("Log id %s for request %s %s headers: %s" % (
-                self.log_container.get_latest_id(),
-                request['method'],
-                request['path'],
-                request['headers']))
+            self._logger.info("Log id %s for request %s %s headers: %s",
+                              log_container.get_latest_id(),
+                              request['method'],
+                              request['path'],
+                              request['headers'])
         else:
-            self._logger.info("Log %s/%s for request %s %s headers: %s" % (
-                self.logs_url,
-                self.log_container.get_latest_id(),
-                request['method'],
-                request['path'],
-                request['headers']))
-
-        if len(self.host_whitelist) > 0:
-            request_headers = request['headers'] if 'headers' in request else []
-            request_host = request_headers['Host'] if len(request_headers) > 0 and 'Host' in request['headers'] else ""
-            has_wl_match = False
-            for wl_host in self.host_whitelist:
-                has_wl_match = has_wl_match or ExpectationMatcher.value_matcher(wl_host, request_host)
-
-            if not has_wl_match:
-                self._logger.warning("Request's host '%s' not in a white list!" % request_host)
-                response = CustomResponse(status_code=codes.not_allowed)
-                self.log_container.update_last_with_kv('response', response)
-                return response
-
-        list_matched_expectations = self._expectation_manager.get_matched_expectations_for_request(request)
-
-        if len(list_matched_expectations) > 0:
-            expectation = Extensions.order_by_priority(list_matched_expectations)[0]
-            self._logger.debug("Matched expectation: %s" % expectation)
-            response = self.apply_action_from_expectation_to_request(expectation, request)
+            self._logger.info("Log %s/%s%s for request %s %s headers: %s",
+                              self.logs_url,
+                              log_container.get_latest_id(),
+                              '?namespace=%s' % namespace.name if namespace is not None and namespace.name else '',
+                              request['method'],
+                              request['path'],
+                              request['headers'])
+
+        request_headers = request['headers'] if 'headers' in request else []
+        request_host = request_headers['Host'] if len(request_headers) > 0 and 'Host' in request_headers else ""
+        if not self.whitelist.is_allowed(request_host):
+            self._logger.warning("Request's host '%s' not in a white list!", request_host)
+            response = CustomResponse(status_code=codes.not_allowed)
+            return response, (namespace_name, log_container, log_seq, log_entry, None)
+
+        start_time = time.perf_counter_ns()
+        if namespace is None:
+            key, expectation = self._expectation_manager.get_expectation_for_request(request)
         else:
-            self._logger.warning("List of expectations is empty!")
-            response = CustomResponse("No expectation for request: " + str(request))
-        self.log_container.update_last_with_kv('response', response.to_dict())
-        self._logger.debug("Response: %s" % response)
-        return response
+            key, expectation = namespace.get_expectation_for_request(request)
+        self._observe_phase('matching', time.perf_counter_ns() - start_time, timings)
+
+        if expectation is not None:
+            self._logger.debug("Matched expectation with key '%s': %s", key, expectation)
+            response = self.apply_action_from_expectation_to_request(expectation, request, log_entry, timings)
+        else:
+            self._logger.warning("No expectation for request %s %s", request.get('method'), request.get('path'))
+            response = self._make_miss_response(request, namespace, log_entry)
+            self.metrics.inc('flamock_no_match_total', (('namespace', namespace_name),))
+        log_entry['key'] = key
+        self._logger.debug("Response: %s", response)
+        return response, (namespace_name, log_container, log_seq, log_entry, key)
+
+    def _make_miss_response(self, request, namespace=None, log_entry=None):
+        """
+        Response without matched expectation. It doesn't echo request back. With miss_diagnostics
+        the closest expectations are found and saved to log entry as 'near_misses'
+        :param request: incoming request
+        :param namespace: namespace of request or None
+        :param log_entry: dict from log container to be updated with near misses
+        :return: custom response
+        """
+        if self.miss_body is not None:
+            message = self.miss_body
+        else:
+            path = request['path'] if 'path' in request else ''
+            if len(path) > self.MISS_PATH_LIMIT:
+                path = path[:self.MISS_PATH_LIMIT] + '...'
+            message = "No expectation for request: %s /%s" % (request.get('method', ''), path)
+        if self.miss_diagnostics <= 0:
+            return CustomResponse(message, self.miss_status_code)
+
+        if namespace is None:
+            near_misses = self._expectation_manager.get_near_misses(request, self.miss_diagnostics)
+        else:
+            near_misses = namespace.get_near_misses(request, self.miss_diagnostics)
+        if log_entry is not None:
+            log_entry['near_misses'] = near_misses
+        return CustomResponse(json.dumps({"message": message, "near_misses": near_misses}, default=str),
+                              self.miss_status_code,
+                              {'Content-Type': 'application/json'})
 
-    def make_forward_request(self, expectation_forward, request):
+    def _complete_log_entry(self, response, log_context, timings=None):
+        """
+        Saves response to log entry and publishes it
+        :param response: custom response
+        :param log_context: tuple (namespace name, log container, sequential id, log entry, key of expectation)
+        :param timings: dict with <phase: duration in ns> or None
+        """
+        namespace_name, log_container, log_seq, log_entry, key = log_context
+        log_entry['response'] = response.to_dict()
+        if timings is not None:
+            log_entry['timing'] = {phase: duration / 1e6 for phase, duration in timings.items()}
+        log_container.index(log_seq, key=key, status=response.status_code)
+        log_container.publish(log_seq)
+        self.metrics.inc('flamock_requests_total', (('namespace', namespace_name),
+                                                    ('key', key if key is not None else ''),
+                                                    ('status', response.status_code)))
+
+    def make_forward_request(self, expectation_forward, request, log_entry=None):
         """
         Makes request to 3rd party
         :param expectation_forward: description of forwarding request
         :param request: actual request is been forwarded
+        :param log_entry: dict from log container to be updated with forward request
         :return: response from 3rd party as CustomResponse
         """
         headers_in_request_to_ignore = ['Host',
@@ -161,13 +313,14 @@ class ResponseManager:
         if 'headers' in expectation_forward:
             for key, value in expectation_forward['headers'].items():
                 forward_headers[key] = value
-        self.log_container.update_last_with_kv('forward', {
-            "request_method": request_method,
-            "url": url_for_request,
-            "body": request_body,
-            "headers": forward_headers})
-        self._logger.debug("Forward request: %s %s body: %s headers: %s" % (
-            request_method, url_for_request, request_body, forward_headers))
+        if log_entry is not None:
+            log_entry['forward'] = {
+                "request_method": request_method,
+                "url": url_for_request,
+                "body": request_body,
+                "headers": forward_headers}
+        self._logger.debug("Forward request: %s %s body: %s headers: %s",
+                           request_method, url_for_request, request_body, forward_headers)
 
         try:
             resp = self._do_request(
@@ -176,28 +329,198 @@ class ResponseManager:
                 data=request_body,
                 headers=forward_headers,
                 verify=False,
-                timeout=60)
+                timeout=60,
+                stream=True)
 
             response_headers = {}
             for key, value in resp.headers.items():
                 if key not in headers_in_response_to_ignore:
                     response_headers[key] = value
 
-            cust_resp = CustomResponse(resp.content, resp.status_code, response_headers)
+            raw = getattr(resp, 'raw', None)
+            content_encoding = resp.headers.get('Content-Encoding', 'identity')
+            if raw is not None and content_encoding != 'identity' and \
+                    self._is_encoding_accepted(content_encoding, request_headers):
+                # body is passed as it is, compressed by 3rd party. Otherwise, it is decoded by requests
+                content = raw.read(decode_content=False)
+                resp.close()
+                response_headers['Content-Encoding'] = content_encoding
+            else:
+                content = resp.content
+            cust_resp = CustomResponse(content, resp.status_code, response_headers)
         except Exception as e:
             self._logger.exception(e)
             cust_resp = CustomResponse(str(e), codes.not_found)
         return cust_resp
 
+    @staticmethod
+    def _is_encoding_accepted(content_encoding, request_headers):
+        """
+        :param content_encoding: value of Content-Encoding header of response, e.g. 'gzip'
+        :param request_headers: dict with headers of request
+        :return: True if Accept-Encoding header of request accepts all codings of response
+        """
+        accept_encoding = None
+        for key, value in request_headers.items():
+            if key.lower() == 'accept-encoding':
+                accept_encoding = value
+        if accept_encoding is None:
+            return False
+        accept = parse_accept_header(accept_encoding)
+        return all(accept.quality(coding.strip()) > 0 for coding in content_encoding.split(','))
+
     def clear_log_messages(self):
         self.log_container.clear()
 
-    def return_log_messages(self, log_id):
+    def return_log_messages(self, log_id, log_container=None):
+        if log_container is None:
+            log_container = self.log_container
         if len(log_id) > 0:
             try:
                 log_id = int(log_id)
             except ValueError:
                 self._logger.error("Id for log message is not integer!")
-            if log_id in self.log_container.container:
-                return CustomResponse(str(self.log_container.container[log_id]))
-        return CustomResponse(str(self.log_container.container))
+            if log_id in log_container.container:
+                return CustomResponse(str(log_container.container[log_id]))
+        return CustomResponse(str(log_container.container))
+
+    def query_log_messages(self, query_args, log_container=None):
+        """
+        Finds log messages by fields
+        :param query_args: dict with optional fields:
+         - method, path (without query string), key (of matched expectation), status # filters
+         - since, until # unix timestamps
+         - cursor # id of the last message from previous query
+         - limit # max count of messages
+        :param log_container: container with messages
+        :return: custom response with JSON {"entries": [...], "cursor": id}
+        """
+        if log_container is None:
+            log_container = self.log_container
+        filters = {}
+        for field in ['method', 'path', 'key']:
+            if field in query_args:
+                filters[field] = query_args[field]
+        try:
+            if 'status' in query_args:
+                filters['status'] = int(query_args['status'])
+            cursor = int(query_args['cursor']) if 'cursor' in query_args else None
+            limit = int(query_args['limit']) if 'limit' in query_args else LogContainer.DEFAULT_QUERY_LIMIT
+            since = float(query_args['since']) if 'since' in query_args else None
+            until = float(query_args['until']) if 'until' in query_args else None
+        except ValueError as e:
+            self._logger.error("Wrong parameters of logs query: %s", e)
+            return CustomResponse("Error! Wrong parameters of logs query: %s" % e, codes.bad)
+
+        messages, next_cursor = log_container.query(filters, cursor, limit, since, until)
+        entries = self._log_messages_to_entries(messages)
+        return CustomResponse(json.dumps({'entries': entries, 'cursor': next_cursor}, default=str),
+                              headers={'Content-Type': 'application/json'})
+
+    def verify_requests(self, verification, expectation_manager=None, log_container=None):
+        """
+        Counts requests which match pattern
+        :param verification: dict with fields:
+         - key # key of expectation. If it is the only field, count of hits of expectation is returned
+         - request # request pattern in the same format as in expectation. Requests in log are matched against it
+         - entries # bool. If true, matched log entries are returned too
+         - limit # max count of returned entries
+        :param expectation_manager: manager with expectations
+        :param log_container: container with messages
+        :return: custom response with JSON {"count": count, "entries": [...]}
+        """
+        if expectation_manager is None:
+            expectation_manager = self._expectation_manager
+        if log_container is None:
+            log_container = self.log_container
+        if not isinstance(verification, dict):
+            verification = {}
+
+        key = verification.get('key')
+        request_pattern = verification.get('request')
+        with_entries = verification.get('entries', False)
+        limit = verification.get('limit', LogContainer.DEFAULT_QUERY_LIMIT)
+        if (key is None and request_pattern is None) or \
+                (request_pattern is not None and not isinstance(request_pattern, dict)) or \
+                not isinstance(limit, int):
+            self._logger.error("Wrong verification: %s", verification)
+            return CustomResponse("Error! Verification must have 'key' or 'request' pattern", codes.bad)
+
+        if request_pattern is None and not with_entries:
+            result = {'count': expectation_manager.get_hit_count(key)}
+        else:
+            messages, cursor = log_container.query({'key': key} if key is not None else {}, limit=None)
+            matched_messages = []
+            for seq, timestamp, message in messages:
+                if not isinstance(message, dict) or 'request' not in message:
+                    continue
+                if request_pattern is None or \
+                        ExpectationMatcher.is_expectation_match_request(request_pattern, message['request']):
+                    matched_messages.append((seq, timestamp, message))
+            result = {'count': len(matched_messages)}
+            if with_entries:
+                result['entries'] = self._log_messages_to_entries(matched_messages[:limit])
+        return CustomResponse(json.dumps(result, default=str), headers={'Content-Type': 'application/json'})
+
+    def get_metrics_as_response(self):
+        """
+        :return: custom response with metrics in Prometheus text format
+        """
+        return CustomResponse(self.metrics.render(), headers={'Content-Type': 'text/plain; version=0.0.4'})
+
+    def stream_log_messages(self, query_args, log_container=None, keepalive_timeout=15):
+        """
+        Generator of server-sent events with new log messages
+        :param query_args: dict with optional fields:
+         - path (without query string), key (of matched expectation) # filters
+         - buffer # max count of messages waiting for sending. Extra messages are dropped
+        :param log_container: container with messages
+        :param keepalive_timeout: seconds between keepalive comments when there are no messages
+        :return: generator of strings
+        """
+        if log_container is None:
+            log_container = self.log_container
+        filters = {}
+        for field in ['path', 'key']:
+            if field in query_args:
+                filters[field] = query_args[field]
+        try:
+            buffer_size = int(query_args.get('buffer', LogSubscription.DEFAULT_BUFFER_SIZE))
+        except ValueError:
+            buffer_size = LogSubscription.DEFAULT_BUFFER_SIZE
+
+        def generator():
+            subscription = log_container.subscribe(filters, buffer_size)
+            reported_dropped = 0
+            try:
+                yield ': subscribed\n\n'
+                while True:
+                    item = subscription.get(keepalive_timeout)
+                    if subscription.dropped != reported_dropped:
+                        reported_dropped = subscription.dropped
+                        yield 'event: dropped\ndata: %s\n\n' % reported_dropped
+                    if item is None:
+                        yield ': keepalive\n\n'
+                        continue
+                    entry = self._log_messages_to_entries([item])[0]
+                    yield 'id: %s\ndata: %s\n\n' % (entry['id'], json.dumps(entry, default=str))
+            finally:
+                log_container.unsubscribe(subscription)
+
+        return generator()
+
+    @staticmethod
+    def _log_messages_to_entries(messages):
+        """
+        :param messages: list of tuples (sequential id, timestamp, message) from log container
+        :return: list of dicts with fields of message, 'id' and 'ts'
+        """
+        entries = []
+        for seq, timestamp, message in messages:
+            entry = {'id': seq, 'ts': timestamp}
+            if isinstance(message, dict):
+                entry.update(message)
+            else:
+                entry['message'] = message
+            entries.append(entry)
+        return entries
@@ -0,0 +1,184 @@
+import datetime
+import re
+import time
+import uuid
+from urllib.parse import parse_qs
+
+from custom_reponse import CustomResponse
+from expectation_matcher import ExpectationMatcher
+from status_codes import codes
+
+
+class TemplateContext(object):
+    """
+    Values of actual request for rendering of templates. Values are parsed on first use
+    """
+
+    def __init__(self, request, patterns):
+        self.request = request
+        self._patterns = patterns
+        self._path_segments = None
+        self._query = None
+        self._headers = None
+        self._groups = {}
+
+    @property
+    def path(self):
+        return self.request['path'].split('?', 1)[0] if 'path' in self.request else ''
+
+    @property
+    def path_segments(self):
+        if self._path_segments is None:
+            self._path_segments = self.path.split('/')
+        return self._path_segments
+
+    @property
+    def query(self):
+        if self._query is None:
+            path = self.request['path'] if 'path' in self.request else ''
+            self._query = parse_qs(path.split('?', 1)[1]) if '?' in path else {}
+        return self._query
+
+    @property
+    def headers(self):
+        if self._headers is None:
+            headers = self.request['headers'] if 'headers' in self.request else {}
+            self._headers = {str(key).lower(): value for key, value in headers.items()} \
+                if isinstance(headers, dict) else {}
+        return self._headers
+
+    def group(self, field, group):
+        """
+        :param field: 'path' or 'body'
+        :param group: number or name of group in pattern of expectation's request
+        :return: value of group of pattern matched to actual request field or None
+        """
+        if field not in self._groups:
+            value = self.request[field] if field in self.request else ''
+            self._groups[field] = self._patterns[field].search(value) if isinstance(value, str) else None
+        match = self._groups[field]
+        return match.group(group) if match is not None else None
+
+
+class ResponseTemplate(object):
+    """
+    Response with body and headers rendered from actual request. Templates are compiled once,
+    when expectation is added, into list of literal strings and getters of values.
+
+    Placeholders {{ name }}:
+     - method, path, body
+     - path.N # N-th segment of path, from 0
+     - query.name # the first value of query parameter
+     - headers.name # header, case insensitive
+     - match.path.G, match.body.G # group G (number or name) of regex pattern of expectation's request
+     - uuid # random uuid
+     - timestamp, timestamp_ms # unix time in seconds or ms
+     - now # UTC time in ISO 8601 format
+
+    Unknown values are rendered as empty string
+    """
+    PLACEHOLDER = re.compile(r'\{\{\s*([\w.\-]+)\s*\}\}')
+    MATCH_FIELDS = ('path', 'body')
+
+    def __init__(self, expected_response, request_pattern=None, throttle=None):
+        """
+        :param expected_response: 'response' field of expectation
+        :param request_pattern: 'request' field of expectation
+        :param throttle: throttle of body or None
+        :raise ValueError: if template has unknown placeholder
+        """
+        self._request_pattern = request_pattern or {}
+        self._patterns = {}
+        self.status_code = expected_response['httpcode'] if 'httpcode' in expected_response else codes.ok
+        self.throttle = throttle
+        body = expected_response['body'] if 'body' in expected_response else ''
+        self._body = self.compile(body) if isinstance(body, str) else body
+        headers = expected_response['headers'] if 'headers' in expected_response else {}
+        self._headers = [(key, self.compile(value) if isinstance(value, str) else value)
+                         for key, value in headers.items()]
+
+    def compile(self, text):
+        """
+        :param text: template
+        :return: text itself if it has no placeholders. Otherwise - list of literal strings and getters
+        """
+        parts = []
+        position = 0
+        for placeholder in self.PLACEHOLDER.finditer(text):
+            if placeholder.start() > position:
+                parts.append(text[position:placeholder.start()])
+            parts.append(self._compile_placeholder(placeholder.group(1)))
+            position = placeholder.end()
+        if len(parts) == 0:
+            return text
+        if position < len(text):
+            parts.append(text[position:])
+        return parts
+
+    def _compile_placeholder(self, name):
+        """
+        :return: function, which gets value from template context
+        """
+        if name in ('method', 'body'):
+            return lambda context: context.request.get(name, '')
+        if name == 'path':
+            return lambda context: context.path
+        if name == 'uuid':
+            return lambda context: str(uuid.uuid4())
+        if name == 'timestamp':
+            return lambda context: str(int(time.time()))
+        if name == 'timestamp_ms':
+            return lambda context: str(int(time.time() * 1000))
+        if name == 'now':
+            return lambda context: datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+        source, _, argument = name.partition('.')
+        if source == 'path' and argument.isdigit():
+            index = int(argument)
+            return lambda context: context.path_segments[index] if index < len(context.path_segments) else ''
+        if source == 'query' and len(argument) > 0:
+            return lambda context: context.query[argument][0] if argument in context.query else ''
+        if source == 'headers' and len(argument) > 0:
+            header = argument.lower()
+            return lambda context: context.headers.get(header, '')
+        if source == 'match':
+            field, _, group = argument.partition('.')
+            if field in self.MATCH_FIELDS and len(group) > 0:
+                pattern = self._compile_pattern(field)
+                group = int(group) if group.isdigit() else group
+                if group not in pattern.groupindex and not (isinstance(group, int) and group <= pattern.groups):
+                    raise ValueError("Pattern of field '%s' of request has no group '%s'" % (field, group))
+                return lambda context: context.group(field, group) or ''
+        raise ValueError("Unknown placeholder '{{%s}}' in template" % name)
+
+    def _compile_pattern(self, field):
+        """
+        :return: compiled regex pattern of field of expectation's request
+        """
+        if field not in self._patterns:
+            pattern = self._request_pattern.get(field)
+            if not isinstance(pattern, str):
+                raise ValueError("Placeholder 'match.%s' needs regex pattern in field '%s' of request" % (field, field))
+            try:
+                self._patterns[field] = re.compile(pattern, ExpectationMatcher._re_flags)
+            except re.error as e:
+                raise ValueError("Pattern of field '%s' of request is not valid regex: %s" % (field, e))
+        return self._patterns[field]
+
+    @staticmethod
+    def _render(template, context):
+        if not isinstance(template, list):
+            return template
+        return ''.join([part if isinstance(part, str) else part(context) for part in template])
+
+    def render(self, request):
+        """
+        :param request: actual request
+        :return: custom response
+        """
+        context = TemplateContext(request, self._patterns)
+        response = CustomResponse(self._render(self._body, context),
+                                  self.status_code,
+                                  {key: self._render(value, context) for key, value in self._headers})
+        response.throttle = self.throttle
+        return response
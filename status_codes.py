@@ -0,0 +1,13 @@
+from http import HTTPStatus
+
+
+class codes:
+    """
+    Names of HTTP status codes, which are used by flamock, as in requests.status_codes.
+    Package requests takes long to import and is needed only for forwarding, so it is imported on the first forward
+    """
+    ok = int(HTTPStatus.OK)
+    bad = int(HTTPStatus.BAD_REQUEST)
+    not_found = int(HTTPStatus.NOT_FOUND)
+    not_allowed = int(HTTPStatus.METHOD_NOT_ALLOWED)
+    service_unavailable = int(HTTPStatus.SERVICE_UNAVAILABLE)
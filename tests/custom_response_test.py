@@ -1,4 +1,6 @@
+import gzip
 import unittest
+import zlib
 
 from custom_reponse import CustomResponse
 from flask_factory import FlaskFactory
@@ -11,3 +13,48 @@ class CustomResponseTest(unittest.TestCase):
         resp = CustomResponse(text)
         flask_resp = resp.to_flask_response()
         self.assertEquals(flask_resp.data.decode(), text)
+
+    def test_020_static_response_is_same_as_dynamic(self):
+        FlaskFactory.flask_factory()
+        for expected_response in [{'body': 'тело', 'httpcode': 201, 'headers': {'X-Header': 1, 'Content-Length': 1}},
+                                  {'body': '{}', 'headers': {'content-type': 'application/json'}},
+                                  {}]:
+            dynamic_resp = CustomResponse.from_expected_response(expected_response).to_flask_response()
+            static_resp = CustomResponse.from_expected_response(expected_response, True)
+            for i in range(2):
+                flask_resp = static_resp.to_flask_response()
+                self.assertEqual(dynamic_resp.status_code, flask_resp.status_code)
+                self.assertEqual(dynamic_resp.get_data(), flask_resp.get_data())
+                self.assertEqual(sorted(dynamic_resp.headers.items()), sorted(flask_resp.headers.items()))
+            self.assertEqual([None], list(static_resp._variants.keys()))
+
+    def test_030_static_response_with_not_str_body(self):
+        FlaskFactory.flask_factory()
+        resp = CustomResponse.from_expected_response({'body': {'a': 1}}, True)
+        self.assertEqual({'a': 1}, resp.to_flask_response().get_json())
+        self.assertIsNone(resp._variants)
+
+    def test_040_compressed_variants(self):
+        flask_app = FlaskFactory.flask_factory()
+        body = 'compressible body ' * 100
+        resp = CustomResponse.from_expected_response({'body': body, 'compress': True}, True)
+        for accept_encoding, encoding in [('gzip, br', 'gzip'), ('gzip;q=0.5, deflate', 'deflate'),
+                                          ('br', None), ('gzip;q=0', None), (None, None)]:
+            headers = {} if accept_encoding is None else {'Accept-Encoding': accept_encoding}
+            with flask_app.test_request_context(headers=headers):
+                flask_resp = resp.to_flask_response()
+            self.assertEqual(encoding, flask_resp.headers.get('Content-Encoding'))
+            self.assertEqual('Accept-Encoding', flask_resp.headers['Vary'])
+            data = flask_resp.get_data()
+            self.assertEqual(str(len(data)), flask_resp.headers['Content-Length'])
+            if encoding == 'gzip':
+                data = gzip.decompress(data)
+            elif encoding == 'deflate':
+                data = zlib.decompress(data)
+            self.assertEqual(body.encode(), data)
+        self.assertEqual({'gzip', 'deflate', None}, set(resp._variants.keys()))
+
+        resp = CustomResponse.from_expected_response({'body': body, 'compress': ['deflate']}, True)
+        with flask_app.test_request_context(headers={'Accept-Encoding': 'gzip'}):
+            self.assertNotIn('Content-Encoding', resp.to_flask_response().headers)
+        self.assertRaises(ValueError, CustomResponse.from_expected_response, {'compress': ['br']}, True)
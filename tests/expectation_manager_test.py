@@ -1,5 +1,9 @@
 import json
 import logging
+import os
+import shutil
+import tempfile
+import threading
 import unittest
 from logging_format import logging_format
 
@@ -152,6 +156,237 @@ class ExpectationManagerTest(unittest.TestCase):
         for key, value in items:
             self.assertEqual(exp2, value)
 
+    def test_080_times(self):
+        exp = {'key': 'limited', 'request': {'path': 'pathv'}, 'times': 2}
+        resp = self._expectation_manager.add(exp)
+        self.assertEqual(200, resp.status_code)
+        req = {'method': 'GET', 'path': 'pathv'}
+
+        self.assertEqual(('limited', exp), self._expectation_manager.get_expectation_for_request(req))
+        self.assertEqual(1, self._expectation_manager.get_remaining_hits('limited'))
+        self.assertEqual(('limited', exp), self._expectation_manager.get_expectation_for_request(req))
+        self.assertEqual((None, None), self._expectation_manager.get_expectation_for_request(req))
+        self.assertEqual(len(self._expectation_manager.get_expectations()), 0)
+
+    def test_090_times_falls_through_to_lower_priority(self):
+        exp1 = {'key': 'once', 'times': 1, 'priority': 1}
+        exp2 = {'key': 'always', 'priority': 0}
+        self._expectation_manager.add(exp1)
+        self._expectation_manager.add(exp2)
+        req = {'method': 'GET', 'path': 'pathv'}
+
+        self.assertEqual('once', self._expectation_manager.get_expectation_for_request(req)[0])
+        self.assertEqual('always', self._expectation_manager.get_expectation_for_request(req)[0])
+        self.assertEqual('always', self._expectation_manager.get_expectation_for_request(req)[0])
+
+    def test_100_unlimited_ignores_times(self):
+        exp = {'key': 'unlimited', 'times': 1, 'unlimited': True}
+        self._expectation_manager.add(exp)
+        req = {'method': 'GET', 'path': 'pathv'}
+        for i in range(3):
+            self.assertEqual('unlimited', self._expectation_manager.get_expectation_for_request(req)[0])
+        self.assertIsNone(self._expectation_manager.get_remaining_hits('unlimited'))
+
+    def test_110_ttl(self):
+        now = [1000.0]
+        self._expectation_manager._clock = lambda: now[0]
+        self._expectation_manager.add({'key': 'short', 'ttl': 1})
+        self._expectation_manager.add({'key': 'long', 'ttl': 10})
+        self.assertEqual(len(self._expectation_manager.get_expectations()), 2)
+
+        now[0] += 5
+        req = {'method': 'GET', 'path': 'pathv'}
+        self.assertEqual(['long'], [key for key in self._expectation_manager.get_expectations()])
+        self.assertEqual('long', self._expectation_manager.get_expectation_for_request(req)[0])
+
+        now[0] += 5
+        self.assertEqual((None, None), self._expectation_manager.get_expectation_for_request(req))
+        self.assertEqual(len(self._expectation_manager._expiry_heap), 0)
+
+    def test_120_ttl_of_updated_expectation(self):
+        now = [1000.0]
+        self._expectation_manager._clock = lambda: now[0]
+        self._expectation_manager.add({'key': 'k', 'ttl': 1})
+        self._expectation_manager.add({'key': 'k', 'ttl': 10})
+        now[0] += 5
+        self.assertEqual(len(self._expectation_manager.get_expectations()), 1)
+
+    def test_130_invalid_times_and_ttl(self):
+        resp = self._expectation_manager.add({'key': 'k', 'times': 0})
+        self.assertEqual(400, resp.status_code)
+        resp = self._expectation_manager.add({'key': 'k', 'ttl': 'abc'})
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(len(self._expectation_manager.get_expectations()), 0)
+
+    def test_140_remove_by_filter(self):
+        self._expectation_manager.add({'key': 'suite1_a', 'request': {'path': 'payments'}, 'tags': ['suite1']})
+        self._expectation_manager.add({'key': 'suite1_b', 'request': {'path': 'orders'}, 'tags': ['suite1', 'x']})
+        self._expectation_manager.add({'key': 'suite2_a', 'request': {'path': 'payments/1'}, 'tags': ['suite2']})
+        self._expectation_manager.add({'key': 'other', 'times': 3, 'ttl': 100})
+
+        resp = self._expectation_manager.remove_by_filter({'tag': 'suite1', 'request': {'path': 'orders'}})
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(['suite1_a', 'suite2_a', 'other'], list(self._expectation_manager.get_expectations()))
+        self.assertEqual({'suite1': {'suite1_a'}, 'suite2': {'suite2_a'}}, self._expectation_manager._keys_by_tag)
+
+        resp = self._expectation_manager.remove_by_filter({'request': {'path': 'payments'}})
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(['other'], list(self._expectation_manager.get_expectations()))
+
+        resp = self._expectation_manager.remove_by_filter({'key_prefix': 'oth'})
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(0, len(self._expectation_manager.get_expectations()))
+        self.assertIsNone(self._expectation_manager.get_remaining_hits('other'))
+        self.assertEqual({}, self._expectation_manager._keys_by_tag)
+
+    def test_150_remove_by_filter_negative(self):
+        resp = self._expectation_manager.remove_by_filter({})
+        self.assertEqual(400, resp.status_code)
+        resp = self._expectation_manager.add({'key': 'k', 'tags': 'not a list'})
+        self.assertEqual(400, resp.status_code)
+
+    def test_160_hit_count(self):
+        self._expectation_manager.add({'key': 'k1', 'request': {'path': 'a'}, 'times': 2})
+        self._expectation_manager.add({'key': 'k2', 'request': {'path': 'b'}})
+        for path in ['a', 'a', 'a', 'b']:
+            self._expectation_manager.get_expectation_for_request({'method': 'GET', 'path': path})
+        self.assertEqual(2, self._expectation_manager.get_hit_count('k1'))
+        self.assertEqual(1, self._expectation_manager.get_hit_count('k2'))
+        self.assertEqual(0, self._expectation_manager.get_hit_count('unknown'))
+
+        self._expectation_manager.add({'key': 'k2', 'request': {'path': 'b'}})
+        self.assertEqual(0, self._expectation_manager.get_hit_count('k2'))
+
+    def test_170_match_costs(self):
+        self._expectation_manager.add({'key': 'k1', 'request': {'path': 'a'}})
+        self._expectation_manager.add({'key': 'k2', 'response': {}})
+        for path in ['a', 'b']:
+            self._expectation_manager.get_expectation_for_request({'method': 'GET', 'path': path})
+        self.assertEqual(2, self._expectation_manager.match_costs.get('k1')['count'])
+        self.assertIsNone(self._expectation_manager.match_costs.get('k2'))
+
+        costs = json.loads(self._expectation_manager.get_match_costs_as_response(10).text)
+        self.assertEqual(['k1'], [cost['key'] for cost in costs])
+        self.assertFalse(costs[0]['skipped'])
+
+        self._expectation_manager.add({'key': 'k1', 'request': {'path': 'a'}})
+        self.assertIsNone(self._expectation_manager.match_costs.get('k1'))
+
+    def test_180_match_time_budget(self):
+        self._expectation_manager.add({'key': 'slow', 'request': {'body': '(a*)*b'}, 'priority': 1})
+        self._expectation_manager.add({'key': 'fast', 'request': {'body': 'a'}})
+        request = {'method': 'POST', 'path': '', 'body': 'aaab'}
+        self._expectation_manager.match_time_budget = 0.5
+        # start and end of matching of 'slow' and then of 'fast' in 3 requests
+        self._expectation_manager._budget_clock = iter([0, 10 ** 9, 10 ** 9, 10 ** 9 + 1000] * 3).__next__
+        for i in range(ExpectationManager.SLOW_STREAK - 1):
+            key, expectation = self._expectation_manager.get_expectation_for_request(request)
+            self.assertEqual('slow', key)
+        key, expectation = self._expectation_manager.get_expectation_for_request(request)
+        self.assertEqual('fast', key)
+
+        costs = json.loads(self._expectation_manager.get_match_costs_as_response(10).text)
+        self.assertEqual([('slow', 1000.0, True), ('fast', 0.001, False)],
+                         [(cost['key'], cost['max_ms'], cost['skipped']) for cost in costs])
+
+        del self._expectation_manager._budget_clock
+        key, expectation = self._expectation_manager.get_expectation_for_request(request)
+        self.assertEqual('fast', key)
+        self._expectation_manager.add({'key': 'slow', 'request': {'body': '(a*)*b'}, 'priority': 1})
+        key, expectation = self._expectation_manager.get_expectation_for_request(request)
+        self.assertEqual('slow', key)
+
+    def test_190_unsupported_compression(self):
+        resp = self._expectation_manager.add({'key': 'k1', 'response': {'body': 'a', 'compress': ['br']}})
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual({}, self._expectation_manager.get_expectations())
+
+    def test_200_near_misses(self):
+        self._expectation_manager.add({'key': 'k1', 'request': {'path': 'users', 'headers': {'h1': 'hv1', 'h2': 'hv2'}},
+                                       'response': {'httpcode': 200}})
+        self._expectation_manager.add({'key': 'k2', 'request': {'method': 'GET', 'path': 'orders'},
+                                       'response': {'httpcode': 200}})
+        self._expectation_manager.add({'key': 'k3', 'response': {'httpcode': 200}})
+        req = {'method': 'GET', 'path': 'users/' + 'a' * 200, 'headers': {'h1': 'hv1', 'h2': 'other'}}
+        near_misses = self._expectation_manager.get_near_misses(req, 5)
+        self.assertEqual(['k1', 'k2'], [near_miss['key'] for near_miss in near_misses])
+        self.assertEqual([{'field': 'headers', 'expected': {'h2': 'hv2'}, 'actual': {'h2': 'other'}}],
+                         near_misses[0]['failed'])
+        self.assertEqual(['method'], near_misses[1]['matched'])
+        self.assertEqual(103, len(near_misses[1]['failed'][0]['actual']))
+
+        try:
+            ExpectationManager.near_miss_max_evaluations = 1
+            self.assertEqual(1, len(self._expectation_manager.get_near_misses(req, 5)))
+        finally:
+            ExpectationManager.near_miss_max_evaluations = 1000
+
+    def test_210_body_file_is_closed_with_expectation(self):
+        directory = tempfile.mkdtemp()
+        with open(os.path.join(directory, 'fixture.txt'), 'wb') as file:
+            file.write(b'content')
+        self._expectation_manager.body_file_dir = directory
+        try:
+            exp = {'key': 'k1', 'response': {'body_file': 'fixture.txt'}}
+            self.assertEqual(200, self._expectation_manager.add(exp).status_code)
+            first_file_body = self._expectation_manager.get_expectations()['k1'].static_response.file_body
+            self.assertEqual(200, self._expectation_manager.add(exp).status_code)
+            self.assertTrue(first_file_body._mmap.closed)
+            second_file_body = self._expectation_manager.get_expectations()['k1'].static_response.file_body
+            self._expectation_manager.remove({'key': 'k1'})
+            self.assertTrue(second_file_body._mmap.closed)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_220_hit_count_of_concurrent_requests(self):
+        self._expectation_manager.add({'key': 'k1', 'request': {'path': 'a'}})
+
+        def send_requests():
+            for i in range(1000):
+                self._expectation_manager.get_expectation_for_request({'method': 'GET', 'path': 'a'})
+
+        threads = [threading.Thread(target=send_requests) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(8000, self._expectation_manager.get_hit_count('k1'))
+
+    def test_230_hit_count_of_fallback_expectation(self):
+        fallback = ExpectationManager()
+        fallback.add({'key': 'k1', 'request': {'path': 'a'}, 'times': 5})
+        for i in range(3):
+            self._expectation_manager.get_expectation_for_request({'method': 'GET', 'path': 'a'}, fallback)
+        fallback.get_expectation_for_request({'method': 'GET', 'path': 'a'})
+        # hit is counted by manager, which request was sent to
+        self.assertEqual(3, self._expectation_manager.get_hit_count('k1'))
+        self.assertEqual(1, fallback.get_hit_count('k1'))
+        self.assertEqual(1, fallback.get_remaining_hits('k1'))
+
+    def test_240_single_slow_matching_is_not_flagged(self):
+        self._expectation_manager.add({'key': 'k1', 'request': {'path': 'a'}})
+        self._expectation_manager.match_time_budget = 0.5
+        # matchings longer than budget are interrupted by fast one, so they are not in a row
+        durations = [10 ** 9, 10 ** 9, 1000, 10 ** 9, 10 ** 9, 1000]
+        self._expectation_manager._budget_clock = iter(
+            [value for duration in durations for value in (0, duration)]).__next__
+        for duration in durations:
+            key, expectation = self._expectation_manager.get_expectation_for_request({'method': 'GET', 'path': 'a'})
+            self.assertEqual('k1', key)
+        costs = json.loads(self._expectation_manager.get_match_costs_as_response(10).text)
+        self.assertFalse(costs[0]['skipped'])
+
+    def test_250_expiry_heap_is_compacted(self):
+        for i in range(1000):
+            self._expectation_manager.add({'key': 'k1', 'ttl': 3600, 'times': 1, 'response': {}})
+        self.assertLessEqual(len(self._expectation_manager._expiry_heap), 2)
+        self._expectation_manager.add({'key': 'k2', 'ttl': 3600, 'response': {}})
+        key, expectation = self._expectation_manager.get_expectation_for_request({'method': 'GET', 'path': 'a'})
+        self.assertEqual('k1', key)
+        self.assertEqual(['k2'], list(self._expectation_manager.get_expectations()))
+        self._expectation_manager.remove({'key': 'k2'})
+        self.assertEqual([], self._expectation_manager._expiry_heap)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,8 @@
+import threading
 import unittest
 import logging
 from logging_format import logging_format
-from expectation_matcher import ExpectationMatcher
+from expectation_matcher import ExpectationMatcher, MatchCosts, RequestPattern
 
 logging.basicConfig(level=logging.DEBUG, format=logging_format)
 
@@ -36,3 +37,72 @@ class ExpectationMatcherTest(unittest.TestCase):
         self.assertTrue(ExpectationMatcher.is_expectation_match_request(exp_request, req))
         exp_request = {'headers': {'h1': 'hv2'}}
         self.assertFalse(ExpectationMatcher.is_expectation_match_request(exp_request, req))
+
+    def test_050_max_scan_length(self):
+        req = {'body': 'a' * 100 + '<label>'}
+        exp_request = {'body': '<label>'}
+        try:
+            ExpectationMatcher.max_scan_length = 50
+            self.assertFalse(ExpectationMatcher.is_expectation_match_request(exp_request, req))
+            ExpectationMatcher.max_scan_length = 200
+            self.assertTrue(ExpectationMatcher.is_expectation_match_request(exp_request, req))
+        finally:
+            ExpectationMatcher.max_scan_length = None
+
+    def test_060_match_costs(self):
+        match_costs = MatchCosts()
+        match_costs.add([('k1', 1000000), ('k2', 5000000)])
+        match_costs.add([('k1', 3000000), ('k2', 1000000)])
+        match_costs.add([('k1', 3000000)])
+        self.assertEqual({'key': 'k1', 'count': 3, 'total_ms': 7.0, 'max_ms': 3.0}, match_costs.get('k1'))
+        self.assertEqual(['k1'], [cost['key'] for cost in match_costs.get_top(1)])
+        self.assertEqual(['k2', 'k1'], [cost['key'] for cost in match_costs.get_top(5, 'max')])
+
+        match_costs.remove('k1')
+        self.assertIsNone(match_costs.get('k1'))
+        match_costs.clear()
+        self.assertEqual([], match_costs.get_top(5))
+
+    def test_070_compile_pattern(self):
+        self.assertIs(ExpectationMatcher.compile_pattern('^/api/[0-9]+$'),
+                      ExpectationMatcher.compile_pattern(''.join(['^/api/', '[0-9]+$'])))
+        self.assertIsInstance(ExpectationMatcher.compile_pattern('/api/items'), str)
+        self.assertIsInstance(ExpectationMatcher.compile_pattern('/api/[items'), str)
+        self.assertTrue(ExpectationMatcher.search(ExpectationMatcher.compile_pattern('/api/[items'), '/api/[items]'))
+        self.assertTrue(ExpectationMatcher.search(ExpectationMatcher.compile_pattern('^/api/[0-9]+$'), '/api/12'))
+        self.assertFalse(ExpectationMatcher.search(ExpectationMatcher.compile_pattern('^/api/[0-9]+$'), '/api/a'))
+
+    def test_080_request_pattern(self):
+        request_pattern = RequestPattern({'method': 'GET', 'path': '^/api/[0-9]+$', 'headers': {'h1': 'hv1'}})
+        self.assertTrue(request_pattern.is_match({'method': 'GET', 'path': '/api/12', 'headers': {'h1': 'hv1'}}))
+        self.assertFalse(request_pattern.is_match({'method': 'GET', 'path': '/api/12', 'headers': {'h1': 'hv2'}}))
+        self.assertFalse(request_pattern.is_match({'method': 'POST', 'path': '/api/12', 'headers': {'h1': 'hv1'}}))
+        self.assertFalse(request_pattern.is_match({'method': 'GET', 'headers': {'h1': 'hv1'}}))
+        self.assertTrue(RequestPattern({}).is_match({'method': 'GET'}))
+        self.assertFalse(RequestPattern({'body': None}).is_match({'method': 'GET', 'body': ''}))
+        with self.assertRaises(ValueError):
+            RequestPattern('GET')
+
+    def test_090_match_costs_of_threads(self):
+        match_costs = MatchCosts()
+        threads = [threading.Thread(target=match_costs.add, args=([('k1', 1000000 * i), ('k2', 1000000)],))
+                   for i in range(1, 5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        match_costs.add([('k1', 1000000)])
+        self.assertEqual({'key': 'k1', 'count': 5, 'total_ms': 11.0, 'max_ms': 4.0}, match_costs.get('k1'))
+        self.assertEqual({'key': 'k2', 'count': 4, 'total_ms': 4.0, 'max_ms': 1.0}, match_costs.get('k2'))
+        match_costs.remove('k1')
+        self.assertIsNone(match_costs.get('k1'))
+        self.assertEqual(4, match_costs.get('k2')['count'])
+
+    def test_100_stores_of_finished_threads_are_merged(self):
+        match_costs = MatchCosts()
+        for i in range(100):
+            thread = threading.Thread(target=match_costs.add, args=([('k1', 1000000)],))
+            thread.start()
+            thread.join()
+        self.assertLessEqual(len(match_costs._stores), 1)
+        self.assertEqual(100, match_costs.get('k1')['count'])
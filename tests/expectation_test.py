@@ -0,0 +1,47 @@
+import unittest
+from expectation import Expectation
+
+
+class ExpectationTest(unittest.TestCase):
+    def test_010_to_dict(self):
+        expectation_as_dict = {'key': 'k1',
+                               'request': {'method': 'GET', 'path': '^/api/[0-9]+$'},
+                               'response': {'httpcode': 200, 'body': 'тело'},
+                               'priority': 2,
+                               'tags': ['t1']}
+        expectation = Expectation(expectation_as_dict)
+        self.assertEqual(expectation_as_dict, expectation.to_dict())
+        self.assertEqual(expectation_as_dict, expectation)
+        self.assertEqual(2, expectation.priority)
+        self.assertEqual(('t1',), expectation.tags)
+        self.assertTrue(expectation.request.is_match({'method': 'GET', 'path': '/api/1'}))
+        self.assertFalse(hasattr(expectation, '__dict__'))
+
+    def test_020_fingerprint(self):
+        self.assertEqual(Expectation.fingerprint({'request': {'path': 'a', 'method': 'GET'}, 'response': {}}),
+                         Expectation.fingerprint({'response': {}, 'request': {'method': 'GET', 'path': 'a'}}))
+        self.assertNotEqual(Expectation.fingerprint({'request': {'path': 'a'}}),
+                            Expectation.fingerprint({'request': {'path': 'b'}}))
+
+    def test_030_defaults(self):
+        expectation = Expectation({'forward': {'scheme': 'http', 'host': 'example.com'}})
+        self.assertIsNone(expectation.request)
+        self.assertEqual(0, expectation.priority)
+        self.assertIsNone(expectation.delay)
+        self.assertFalse(expectation.has_response)
+        self.assertEqual({'scheme': 'http', 'host': 'example.com'}, expectation.forward)
+
+    def test_040_body_and_request_are_not_copied_to_source(self):
+        body = 'x' * 100000
+        expectation_as_dict = {'key': 'k1', 'request': {'path': 'a', 'headers': {'h': 'v'}},
+                               'response': {'httpcode': 200, 'body': body}}
+        expectation = Expectation(expectation_as_dict)
+        self.assertLess(len(expectation._source), 100)
+        self.assertIs(body, expectation.to_dict()['response']['body'])
+        self.assertIs(body, expectation.static_response._text)
+        self.assertEqual({'path': 'a', 'headers': {'h': 'v'}}, expectation.request_as_dict)
+        self.assertEqual(['key', 'request', 'response'], list(expectation.to_dict().keys()))
+
+        expectation_as_dict['request']['headers']['h'] = 'changed'
+        self.assertEqual({'h': 'v'}, expectation.to_dict()['request']['headers'])
+        self.assertNotEqual(Expectation(dict(expectation_as_dict, response={'body': 'y'})), expectation)
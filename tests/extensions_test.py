@@ -22,3 +22,24 @@ class ExtensionsTest(unittest.TestCase):
         ]
         sorted_list = Extensions.order_by_priority(list_of_exp)
         self.assertEquals(sorted_list, expected_list)
+
+    def test_030_get_header(self):
+        headers = {'Content-Type': 'text/xml'}
+        self.assertEqual(Extensions.get_header(headers, 'Content-Type'), 'text/xml')
+        self.assertEqual(Extensions.get_header(headers, 'content-type'), 'text/xml')
+        self.assertIsNone(Extensions.get_header(headers, 'Host'))
+
+    def test_040_get_deep_size(self):
+        small = {'key': 'value'}
+        big = {'key': 'value' * 1000}
+        self.assertGreater(Extensions.get_deep_size(big), Extensions.get_deep_size(small))
+        self.assertGreater(Extensions.get_deep_size(big), 5000)
+
+    def test_050_get_deep_size_of_slots(self):
+        class Slotted(object):
+            __slots__ = ('value',)
+
+            def __init__(self, value):
+                self.value = value
+
+        self.assertGreater(Extensions.get_deep_size(Slotted('value' * 1000)), 5000)
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from file_body import FileBody, MmapReader
+
+
+class FileBodyTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as file:
+            file.write(content)
+        return path
+
+    def test_010_describe_file(self):
+        file_body = FileBody(self.write_file('fixture.json', b'{"a": 1}'), self.directory)
+        self.assertEqual(8, file_body.size)
+        self.assertEqual('application/json', file_body.mimetype)
+        self.assertEqual(b'{"a": 1}', b''.join(file_body.open({})))
+
+        self.assertEqual('application/octet-stream', FileBody(self.write_file('fixture', b''), self.directory).mimetype)
+        self.assertRaises(OSError, FileBody, 'unknown', self.directory)
+
+    def test_020_file_wrapper_of_server(self):
+        file_body = FileBody(self.write_file('fixture.txt', b'content'), self.directory)
+        opened = []
+
+        def file_wrapper(file, buffer_size):
+            opened.append(file)
+            return iter([file.read()])
+        self.assertEqual([b'content'], list(file_body.open({'wsgi.file_wrapper': file_wrapper})))
+        opened[0].close()
+
+    def test_030_mmap_reader(self):
+        reader = MmapReader(b'0123456789')
+        self.assertEqual(b'012', reader.read(3))
+        self.assertEqual(3, reader.tell())
+        reader.seek(8)
+        self.assertEqual(b'89', reader.read(5))
+        self.assertEqual(b'', reader.read(5))
+        reader.seek(-4, os.SEEK_END)
+        self.assertEqual(b'6789', reader.read())
+
+    def test_040_directory_for_body_files(self):
+        path = self.write_file('fixture.txt', b'content')
+        self.assertEqual(os.path.realpath(path), FileBody.resolve_path(path, self.directory))
+        self.assertEqual(os.path.realpath(path), FileBody.resolve_path('fixture.txt', self.directory))
+        self.assertRaises(ValueError, FileBody.resolve_path, path, None)
+        self.assertRaises(ValueError, FileBody.resolve_path, '/etc/passwd', self.directory)
+        self.assertRaises(ValueError, FileBody.resolve_path, '../fixture.txt', self.directory)
+        os.symlink('/etc', os.path.join(self.directory, 'link'))
+        self.assertRaises(ValueError, FileBody.resolve_path, 'link/passwd', self.directory)
+
+    def test_050_close(self):
+        file_body = FileBody(self.write_file('fixture.txt', b'content'), self.directory)
+        reader = file_body.open({})
+        file_body.close()
+        # memory map is closed after the last reader
+        self.assertEqual(b'content', b''.join(reader))
+        reader.close()
+        self.assertTrue(file_body._mmap.closed)
+        reader = file_body.open({})
+        self.assertEqual(b'content', b''.join(reader))
+        reader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
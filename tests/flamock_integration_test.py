@@ -1,5 +1,8 @@
 import json
 import logging
+import os
+import tempfile
+import time
 import unittest
 from logging_format import logging_format
 from flask_factory import FlaskFactory
@@ -15,7 +18,7 @@ class FlamockTest(unittest.TestCase):
     def setUp(self):
         self.app = FlaskFactory.flask_factory()
         self.app.config['TESTING'] = True
-        self.app.response_manager.host_whitelist = ["0.0.0.0"]
+        self.app.response_manager.whitelist.update(["0.0.0.0"])
         self.app.response_manager.clear_log_messages()
         self.app.expectation_manager.clear()
         self.client = self.app.test_client()
@@ -218,6 +221,257 @@ class FlamockTest(unittest.TestCase):
         self.assertIn('response', resp_text)
         self.assertIn('No expectation for request', resp_text)
 
+    def test_100_namespaces(self):
+        admin_url = self.base_url + '/' + self.flamock_admin_path
+        self.app.namespace_manager.header = 'X-Flamock-Namespace'
+        exp = {'response': {'httpcode': 200, 'body': 'Answer for team'}}
+        resp = self.client.post(admin_url + '/add_expectation?namespace=team', data=json.dumps(exp))
+        self.assertEqual(resp.status_code, 200)
+
+        resp = self.client.get(self.base_url + '/a', headers={'X-Flamock-Namespace': 'team'})
+        self.assertEqual('Answer for team', resp.get_data(as_text=True))
+        resp = self.client.get(self.base_url + '/a')
+        self.assertIn('No expectation for request', resp.get_data(as_text=True))
+
+        resp = self.client.get(admin_url + '/namespaces')
+        namespaces = json.loads(resp.get_data(as_text=True))
+        self.assertEqual(['', 'team'], [namespace['name'] for namespace in namespaces])
+        self.assertEqual(1, namespaces[1]['requests'])
+
+        resp = self.client.post(admin_url + '/remove_namespace', headers={'X-Flamock-Namespace': 'team'})
+        self.assertEqual(resp.status_code, 200)
+        resp = self.client.get(admin_url + '/namespaces')
+        self.assertEqual(1, len(json.loads(resp.get_data(as_text=True))))
+
+        resp = self.client.post(admin_url + '/remove_namespace', headers={'X-Flamock-Namespace': 'team'})
+        self.assertEqual(resp.status_code, 404)
+        resp = self.client.get(admin_url + '/logs?namespace=typo&limit=1')
+        self.assertEqual(resp.status_code, 404)
+        resp = self.client.post(admin_url + '/get_expectations?namespace=typo')
+        self.assertEqual(resp.status_code, 404)
+        resp = self.client.get(admin_url + '/namespaces')
+        self.assertEqual(1, len(json.loads(resp.get_data(as_text=True))))
+
+    def test_110_status_details(self):
+        resp = self.client.get(self.base_url + '/' + self.flamock_admin_path + '/status?details=true')
+        self.assertEqual(resp.status_code, 200)
+        status = json.loads(resp.get_data(as_text=True))
+        self.assertEqual('OK', status['status'])
+        self.assertFalse(status['logging']['queued'])
+        self.assertEqual(0, status['log']['body_bytes'])
+
+    def test_120_query_logs(self):
+        exp = {'key': 'k1', 'request': {'path': 'a'}, 'response': {'httpcode': 201}}
+        self.client.post(self.base_url + '/' + self.flamock_admin_path + '/add_expectation', data=json.dumps(exp))
+        self.client.get(self.base_url + '/a?x=1')
+        self.client.post(self.base_url + '/b')
+        self.client.get(self.base_url + '/a')
+
+        logs_url = self.base_url + '/' + self.flamock_admin_path + '/logs'
+        resp = self.client.get(logs_url + '?key=k1&limit=1')
+        self.assertEqual(resp.status_code, 200)
+        logs = json.loads(resp.get_data(as_text=True))
+        self.assertEqual(1, len(logs['entries']))
+        self.assertEqual('a?x=1', logs['entries'][0]['request']['path'])
+        self.assertEqual(201, logs['entries'][0]['response']['status_code'])
+
+        resp = self.client.get(logs_url + '?key=k1&cursor=%s' % logs['cursor'])
+        logs = json.loads(resp.get_data(as_text=True))
+        self.assertEqual(['a'], [entry['request']['path'] for entry in logs['entries']])
+
+        resp = self.client.get(logs_url + '?method=POST&path=b')
+        logs = json.loads(resp.get_data(as_text=True))
+        self.assertEqual(1, len(logs['entries']))
+        self.assertIsNone(logs['entries'][0]['key'])
+
+        resp = self.client.get(logs_url + '?status=abc')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_130_verify(self):
+        admin_url = self.base_url + '/' + self.flamock_admin_path
+        exp = {'key': 'k1', 'request': {'path': 'payments'}, 'response': {'httpcode': 200}}
+        self.client.post(admin_url + '/add_expectation', data=json.dumps(exp))
+        for i in range(3):
+            self.client.post(self.base_url + '/payments', data='<id>%s</id>' % i)
+
+        resp = self.client.post(admin_url + '/verify', data=json.dumps({'key': 'k1'}))
+        self.assertEqual({'count': 3}, json.loads(resp.get_data(as_text=True)))
+
+        resp = self.client.post(admin_url + '/verify', data=json.dumps({'request': {'body': '<id>[12]</id>'}}))
+        self.assertEqual({'count': 2}, json.loads(resp.get_data(as_text=True)))
+
+    def test_140_metrics(self):
+        exp = {'key': 'k1', 'request': {'path': 'a'}, 'response': {'httpcode': 201}}
+        self.client.post(self.base_url + '/' + self.flamock_admin_path + '/add_expectation', data=json.dumps(exp))
+        self.client.get(self.base_url + '/a')
+        self.client.get(self.base_url + '/b')
+
+        resp = self.client.get(self.base_url + '/' + self.flamock_admin_path + '/metrics')
+        self.assertEqual(resp.status_code, 200)
+        text = resp.get_data(as_text=True)
+        self.assertIn('flamock_requests_total{namespace="",key="k1",status="201"} 1', text)
+        self.assertIn('flamock_requests_total{namespace="",key="",status="200"} 1', text)
+        self.assertIn('flamock_no_match_total{namespace=""} 1', text)
+        self.assertIn('flamock_phase_seconds_count{phase="matching"} 2', text)
+        self.assertIn('flamock_phase_seconds_count{phase="response"} 2', text)
+        self.assertIn('flamock_in_flight_requests 0', text)
+
+    def test_150_server_timing(self):
+        exp = {'key': 'k1', 'request': {'path': 'a'}, 'response': {'httpcode': 201}}
+        self.client.post(self.base_url + '/' + self.flamock_admin_path + '/add_expectation', data=json.dumps(exp))
+        resp = self.client.get(self.base_url + '/a')
+        self.assertNotIn('Server-Timing', resp.headers)
+
+        self.app.response_manager.server_timing = True
+        resp = self.client.get(self.base_url + '/a')
+        self.assertEqual(resp.status_code, 201)
+        self.assertRegex(resp.headers['Server-Timing'], r'^matching;dur=\d+\.\d{3}, response;dur=\d+\.\d{3}$')
+
+        entries, cursor = self.app.response_manager.log_container.query({'key': 'k1'})
+        self.assertNotIn('timing', entries[0][2])
+        self.assertEqual(['matching', 'response'], list(entries[1][2]['timing'].keys()))
+
+    def test_160_profiler(self):
+        admin_url = self.base_url + '/' + self.flamock_admin_path
+        resp = self.client.get(admin_url + '/profiler')
+        self.assertEqual(resp.status_code, 404)
+        resp = self.client.post(admin_url + '/profiler/start', data=json.dumps({'mode': 'other'}))
+        self.assertEqual(resp.status_code, 400)
+
+        resp = self.client.post(admin_url + '/profiler/start', data=json.dumps({'requests': 2}))
+        self.assertEqual(resp.status_code, 200)
+        for i in range(3):
+            self.client.get(self.base_url + '/a')
+        resp = self.client.get(admin_url + '/status?details=true')
+        profiler_status = json.loads(resp.get_data(as_text=True))['profiler']
+        self.assertEqual(2, profiler_status['profiled_requests'])
+        self.assertFalse(profiler_status['active'])
+
+        resp = self.client.get(admin_url + '/profiler?sort=tottime&limit=5')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('generate_flask_response', self.client.get(admin_url + '/profiler').get_data(as_text=True))
+        resp = self.client.post(admin_url + '/profiler/stop?sort=unknown')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_170_match_costs(self):
+        admin_url = self.base_url + '/' + self.flamock_admin_path
+        exp = {'key': 'k1', 'request': {'path': 'a'}, 'response': {'httpcode': 201}}
+        self.client.post(admin_url + '/add_expectation', data=json.dumps(exp))
+        self.client.get(self.base_url + '/a')
+
+        resp = self.client.get(admin_url + '/match_costs?top=5&sort=max')
+        costs = json.loads(resp.get_data(as_text=True))
+        self.assertEqual(['k1'], [cost['key'] for cost in costs])
+        self.assertEqual(1, costs[0]['count'])
+        resp = self.client.get(admin_url + '/match_costs?sort=other')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_180_body_file(self):
+        admin_url = self.base_url + '/' + self.flamock_admin_path
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'fixture.txt')
+        with open(path, 'wb') as file:
+            file.write(b'0123456789' * 1000)
+        exp = {'key': 'k1', 'request': {'path': 'download'}, 'response': {'body_file': 'fixture.txt'}}
+        resp = self.client.post(admin_url + '/add_expectation', data=json.dumps(exp))
+        self.assertEqual(resp.status_code, 400)
+
+        self.app.expectation_manager.body_file_dir = directory
+        try:
+            resp = self.client.post(admin_url + '/add_expectation', data=json.dumps(exp))
+            self.assertEqual(resp.status_code, 200)
+
+            resp = self.client.get(self.base_url + '/download')
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(b'0123456789' * 1000, resp.get_data())
+            self.assertEqual('10000', resp.headers['Content-Length'])
+            self.assertTrue(resp.headers['Content-Type'].startswith('text/plain'))
+            etag = resp.headers['ETag']
+
+            resp = self.client.get(self.base_url + '/download', headers={'If-None-Match': etag})
+            self.assertEqual(resp.status_code, 304)
+            resp = self.client.get(self.base_url + '/download', headers={'Range': 'bytes=5-14'})
+            self.assertEqual(resp.status_code, 206)
+            self.assertEqual(b'5678901234', resp.get_data())
+            resp = self.client.get(self.base_url + '/download', headers={'Range': 'bytes=20000-'})
+            self.assertEqual(resp.status_code, 416)
+
+            for body_file in ['/etc/passwd', '../' + os.path.basename(directory) + '_other/fixture.txt', 'unknown']:
+                exp = {'request': {'path': 'download'}, 'response': {'body_file': body_file}}
+                resp = self.client.post(admin_url + '/add_expectation', data=json.dumps(exp))
+                self.assertEqual(resp.status_code, 400)
+        finally:
+            self.app.expectation_manager.body_file_dir = None
+            os.remove(path)
+            os.rmdir(directory)
+
+    def test_190_throttle(self):
+        admin_url = self.base_url + '/' + self.flamock_admin_path
+        exp = {'key': 'k1', 'request': {'path': 'slow'},
+               'response': {'body': 'a' * 1024, 'throttle': {'ttfb': 100, 'rate': 5, 'chunk_size': 512}}}
+        resp = self.client.post(admin_url + '/add_expectation', data=json.dumps(exp))
+        self.assertEqual(resp.status_code, 200)
+
+        start_time = time.monotonic()
+        resp = self.client.get(self.base_url + '/slow')
+        self.assertEqual('a' * 1024, resp.get_data(as_text=True))
+        self.assertEqual('1024', resp.headers['Content-Length'])
+        # ttfb and then the second chunk after 0.1 s
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.2)
+
+        exp = {'request': {'path': 'slow'}, 'response': {'throttle': {'rate': -1}}}
+        resp = self.client.post(admin_url + '/add_expectation', data=json.dumps(exp))
+        self.assertEqual(resp.status_code, 400)
+
+    def test_200_template(self):
+        admin_url = self.base_url + '/' + self.flamock_admin_path
+        exp = {'key': 'k1', 'request': {'path': r'users/(\d+)'},
+               'response': {'template': True, 'body': '{"id": {{match.path.1}}, "lang": "{{query.lang}}"}',
+                            'headers': {'X-Request-Id': '{{headers.X-Request-Id}}'}}}
+        resp = self.client.post(admin_url + '/add_expectation', data=json.dumps(exp))
+        self.assertEqual(resp.status_code, 200)
+
+        for user_id in ['1', '22']:
+            resp = self.client.get(self.base_url + '/users/%s?lang=en' % user_id, headers={'X-Request-Id': 'r1'})
+            self.assertEqual({'id': int(user_id), 'lang': 'en'}, json.loads(resp.get_data(as_text=True)))
+            self.assertEqual('r1', resp.headers['X-Request-Id'])
+
+        exp = {'request': {'path': 'a'}, 'response': {'template': True, 'body': '{{unknown}}'}}
+        resp = self.client.post(admin_url + '/add_expectation', data=json.dumps(exp))
+        self.assertEqual(resp.status_code, 400)
+
+    def test_210_whitelist(self):
+        admin_url = self.base_url + '/' + self.flamock_admin_path
+        exp = {'response': {'httpcode': 200, 'body': 'ok'}}
+        self.client.post(admin_url + '/add_expectation', data=json.dumps(exp))
+        self.assertEqual(200, self.client.get(self.base_url + '/a').status_code)
+
+        resp = self.client.post(admin_url + '/whitelist', data=json.dumps({'hosts': ['example.com']}))
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(['example.com'], json.loads(resp.get_data(as_text=True))['hosts'])
+        self.assertEqual(405, self.client.get(self.base_url + '/a').status_code)
+        self.assertEqual(200, self.client.get('http://example.com/a').status_code)
+
+        resp = self.client.post(admin_url + '/whitelist', data=json.dumps({'hosts': 'example.com'}))
+        self.assertEqual(400, resp.status_code)
+        resp = self.client.get(admin_url + '/whitelist')
+        self.assertEqual({'hosts': ['example.com'], 'cached_decisions': 2}, json.loads(resp.get_data(as_text=True)))
+
+    def test_220_readiness(self):
+        admin_url = self.base_url + '/' + self.flamock_admin_path
+        self.app.is_ready = False
+        resp = self.client.get(admin_url + '/status')
+        self.assertEqual(503, resp.status_code)
+        self.assertEqual('1', resp.headers['Retry-After'])
+        resp = self.client.get(admin_url + '/status?details=true')
+        self.assertEqual(503, resp.status_code)
+        self.assertFalse(json.loads(resp.get_data(as_text=True))['ready'])
+        self.assertEqual(503, self.client.get(self.base_url + '/a').status_code)
+
+        self.app.is_ready = True
+        self.assertEqual(200, self.client.get(admin_url + '/status').status_code)
+        self.assertEqual(200, self.client.get(self.base_url + '/a').status_code)
+
 
 if __name__ == '__main__':
     unittest.main()
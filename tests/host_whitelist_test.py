@@ -0,0 +1,40 @@
+import unittest
+
+from host_whitelist import HostWhitelist
+
+
+class HostWhitelistTest(unittest.TestCase):
+    def test_010_empty_whitelist(self):
+        whitelist = HostWhitelist()
+        self.assertTrue(whitelist.is_allowed('example.com'))
+        self.assertTrue(whitelist.is_allowed(''))
+
+    def test_020_patterns(self):
+        whitelist = HostWhitelist(['travix.com', r'^api[0-9]+\.example\.org$', 'bad[regex'])
+        self.assertTrue(whitelist.is_allowed('blabla.travix.com'))
+        self.assertTrue(whitelist.is_allowed('api12.example.org'))
+        self.assertTrue(whitelist.is_allowed('bad[regex.com'))
+        self.assertFalse(whitelist.is_allowed('api.example.org'))
+        self.assertFalse(whitelist.is_allowed('travix.org'))
+
+    def test_030_patterns_which_can_not_be_combined(self):
+        whitelist = HostWhitelist(['(?P<name>a)host', '(?P<name>b)host'])
+        self.assertTrue(whitelist.is_allowed('bhost'))
+        self.assertFalse(whitelist.is_allowed('chost'))
+
+        whitelist = HostWhitelist(['(x)y', r'(a)\1\.com', 'travix.com'])
+        self.assertTrue(whitelist.is_allowed('aa.com'))
+        self.assertTrue(whitelist.is_allowed('xy'))
+        self.assertTrue(whitelist.is_allowed('travix.com'))
+        self.assertFalse(whitelist.is_allowed('ab.com'))
+
+    def test_040_cache(self):
+        whitelist = HostWhitelist(['travix.com'], cache_size=2)
+        for host in ['a.travix.com', 'b.com', 'c.com', 'c.com']:
+            whitelist.is_allowed(host)
+        self.assertEqual(2, whitelist.get_statistics()['cached_decisions'])
+
+        whitelist.update(['b.com'])
+        self.assertEqual({'hosts': ['b.com'], 'cached_decisions': 0}, whitelist.get_statistics())
+        self.assertTrue(whitelist.is_allowed('b.com'))
+        self.assertFalse(whitelist.is_allowed('a.travix.com'))
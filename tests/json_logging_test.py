@@ -0,0 +1,130 @@
+import io
+import json
+import logging
+import threading
+import unittest
+
+from json_logging import JsonLogging, QueuedJsonWriter
+
+
+class StrCounter:
+    count_of_calls = 0
+
+    def __str__(self):
+        self.count_of_calls += 1
+        return 'str\nvalue'
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class JsonLoggingTest(unittest.TestCase):
+    def setUp(self):
+        self._logger = logging.getLogger('json_logging_test')
+        self._logger.propagate = False
+        self._handler = ListHandler()
+        self._logger.handlers = [self._handler]
+        self._previous_logger = JsonLogging.logger
+        JsonLogging.logger = self._logger
+
+    def tearDown(self):
+        JsonLogging.disable_queue()
+        JsonLogging.logger = self._previous_logger
+
+    def test_010_deferred_arguments(self):
+        self._logger.setLevel(logging.DEBUG)
+        JsonLogging.info("Value: %s, count: %s", StrCounter(), 2)
+        self.assertEqual(1, len(self._handler.messages))
+        message = json.loads(self._handler.messages[0])
+        self.assertEqual('Value: str value, count: 2', message['message'])
+        self.assertEqual('INFO', message['level'])
+
+    def test_020_disabled_level_is_not_formatted(self):
+        self._logger.setLevel(logging.INFO)
+        value = StrCounter()
+        JsonLogging.debug("Value: %s", value)
+        self.assertEqual(0, value.count_of_calls)
+        self.assertEqual(0, len(self._handler.messages))
+        self.assertFalse(JsonLogging.is_enabled_for(logging.DEBUG))
+
+    def test_030_message_without_arguments(self):
+        self._logger.setLevel(logging.DEBUG)
+        JsonLogging.warning("100%")
+        self.assertEqual('100%', json.loads(self._handler.messages[0])['message'])
+
+    def test_040_queued_to_logger(self):
+        self._logger.setLevel(logging.INFO)
+        JsonLogging.enable_queue()
+        for i in range(10):
+            JsonLogging.info("Message %s", i)
+        JsonLogging.debug("Debug is disabled")
+        JsonLogging.disable_queue()
+        self.assertEqual(['Message %s' % i for i in range(10)],
+                         [json.loads(message)['message'] for message in self._handler.messages])
+
+    def test_050_queued_message_is_formatted_by_caller(self):
+        self._logger.setLevel(logging.INFO)
+        JsonLogging.enable_queue()
+        value = ['before']
+        JsonLogging.warning("Line\nbreak: %s", value)
+        value[0] = 'after'
+        self.assertTrue(JsonLogging.get_statistics()["queued"])
+        JsonLogging.disable_queue()
+        self.assertEqual(1, len(self._handler.messages))
+        message = json.loads(self._handler.messages[0])
+        self.assertEqual("Line break: ['before']", message['message'])
+        self.assertEqual('WARNING', message['level'])
+        self.assertEqual({"queued": False}, JsonLogging.get_statistics())
+
+    def test_060_queue_drops_when_full(self):
+        lock = threading.Lock()
+
+        class BlockedHandler(ListHandler):
+            def emit(self, record):
+                with lock:
+                    super().emit(record)
+
+        self._logger.setLevel(logging.INFO)
+        self._logger.handlers = [BlockedHandler()]
+        with lock:
+            writer = QueuedJsonWriter(self._logger, queue_size=2, block=False)
+            for i in range(10):
+                writer.put(logging.INFO, "Message %s", (i,))
+            self.assertGreaterEqual(writer.dropped, 5)
+        writer.stop()
+        self.assertEqual(10 - writer.dropped, len(self._logger.handlers[0].messages))
+
+    def test_070_queued_batch_is_flushed_once(self):
+        class CountingStream(io.StringIO):
+            count_of_flushes = 0
+
+            def flush(self):
+                self.count_of_flushes += 1
+
+        stream = CountingStream()
+        self._logger.setLevel(logging.INFO)
+        self._logger.handlers = [logging.StreamHandler(stream)]
+        writer = QueuedJsonWriter(self._logger)
+        writer._write([(logging.INFO, 100.0, 'first'), (logging.WARNING, 100.0, 'second')])
+        writer.stop()
+        self.assertEqual(['first', 'second'], [json.loads(line)['message'] for line in stream.getvalue().splitlines()])
+        self.assertEqual(1, stream.count_of_flushes)
+
+    def test_080_queued_exception(self):
+        self._logger.setLevel(logging.INFO)
+        JsonLogging.enable_queue()
+        try:
+            raise ValueError('broken')
+        except ValueError:
+            JsonLogging.exception('Failed')
+        JsonLogging.disable_queue()
+        message = json.loads(self._handler.messages[0])
+        self.assertEqual('ERROR', message['level'])
+        self.assertTrue(message['message'].startswith('Failed Traceback'))
+        self.assertIn('ValueError: broken', message['message'])
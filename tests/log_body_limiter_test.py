@@ -0,0 +1,89 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from log_body_limiter import LogBodyLimiter
+from log_container import LogContainer
+
+
+class LogBodyLimiterTest(unittest.TestCase):
+    def test_010_unlimited(self):
+        message = {'request': {'body': 'x' * 100}, 'response': {'text': 'y' * 10}}
+        self.assertEqual((110, 0), LogBodyLimiter().limit(message, 0))
+        self.assertEqual('x' * 100, message['request']['body'])
+
+    def test_020_max_body_size(self):
+        request = {'body': 'abcdef' * 10, 'path': 'p'}
+        message = {'request': request, 'response': {'text': 'short'}}
+        body_size, count_of_truncated = LogBodyLimiter(max_body_size=10, prefix_size=4).limit(message, 0)
+        self.assertEqual(1, count_of_truncated)
+        self.assertEqual(4 + 5, body_size)
+        self.assertEqual({'truncated': True,
+                          'length': 60,
+                          'sha256': hashlib.sha256(('abcdef' * 10).encode()).hexdigest(),
+                          'prefix': 'abcd'}, message['request']['body'])
+        self.assertEqual('p', message['request']['path'])
+        self.assertEqual('abcdef' * 10, request['body'])
+
+    def test_030_entry_and_total_size(self):
+        limiter = LogBodyLimiter(max_entry_size=15, max_total_size=100, prefix_size=2)
+        message = {'request': {'body': 'x' * 10}, 'forward': {'body': 'y' * 10}}
+        self.assertEqual((12, 1), limiter.limit(message, 0))
+        self.assertEqual('yy', message['forward']['body']['prefix'])
+
+        message = {'request': {'body': 'x' * 10}}
+        self.assertEqual((0, 1), limiter.limit(message, 100))
+        self.assertEqual('', message['request']['body']['prefix'])
+
+    def test_035_size_in_bytes(self):
+        limiter = LogBodyLimiter(max_body_size=10, prefix_size=5)
+        message = {'request': {'body': 'абвгде'}, 'response': {'text': 'аб'}}
+        self.assertEqual((4 + 4, 1), limiter.limit(message, 0))
+        self.assertEqual(12, message['request']['body']['length'])
+        # prefix doesn't end with part of character
+        self.assertEqual('аб', message['request']['body']['prefix'])
+
+    def test_040_spill(self):
+        directory = tempfile.mkdtemp()
+        try:
+            limiter = LogBodyLimiter(max_body_size=3, spill_directory=directory)
+            message = {'response': {'text': b'binary body'}}
+            limiter.limit(message, 0)
+            sha256 = message['response']['text']['spilled']
+            self.assertEqual(b'binary body', limiter.read_spilled(sha256))
+            self.assertIsNone(limiter.read_spilled('../' + sha256))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_050_log_container_accounting(self):
+        log_container = LogContainer(2)
+        log_container.body_limiter = LogBodyLimiter(max_body_size=5, prefix_size=1)
+        for body in ['abc', 'abcdefgh', 'ab']:
+            seq = log_container.add({'request': {'body': body}})
+            log_container.publish(seq)
+
+        statistics = log_container.get_statistics()
+        self.assertEqual(1 + 2, statistics['body_bytes'])
+        self.assertEqual(1, statistics['truncated_bodies'])
+        self.assertEqual(2, statistics['entries'])
+
+    def test_060_spill_files_are_removed_with_log_entries(self):
+        directory = tempfile.mkdtemp()
+        try:
+            log_container = LogContainer(2, LogBodyLimiter(max_body_size=3, spill_directory=directory))
+            for body in ['same body', 'same body', 'other body']:
+                log_container.publish(log_container.add({'request': {'body': body}}))
+            # the first entry is evicted, but its body is referenced by the second one
+            self.assertEqual(2, len(os.listdir(directory)))
+            log_container.publish(log_container.add({'request': {'body': 'ab'}}))
+            self.assertEqual([hashlib.sha256(b'other body').hexdigest()], os.listdir(directory))
+            log_container.clear()
+            self.assertEqual([], os.listdir(directory))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
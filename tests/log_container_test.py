@@ -54,3 +54,82 @@ class LogContainerTest(unittest.TestCase):
         self.log_container.add("<root></root>")
         self.assertEqual(0, self.log_container.get_latest_id())
         self.assertEqual(0, self.log_container.get_latest_id())
+
+    def test_060_add_returns_sequential_id(self):
+        log_container = LogContainer(2)
+        self.assertEqual([0, 1, 2], [log_container.add(i) for i in range(3)])
+        self.assertEqual(0, log_container.get_latest_id())
+
+    def test_070_query_by_index(self):
+        log_container = LogContainer(10)
+        for i in range(6):
+            seq = log_container.add({'i': i}, method='GET' if i % 2 == 0 else 'POST', path='p%s' % (i % 3))
+            log_container.index(seq, status=200 if i < 3 else 500)
+
+        entries, cursor = log_container.query({'method': 'GET'})
+        self.assertEqual([0, 2, 4], [message['i'] for seq, ts, message in entries])
+        self.assertEqual(4, cursor)
+
+        entries, cursor = log_container.query({'method': 'GET', 'status': 500})
+        self.assertEqual([4], [message['i'] for seq, ts, message in entries])
+
+        entries, cursor = log_container.query({'path': 'p1'})
+        self.assertEqual([1, 4], [message['i'] for seq, ts, message in entries])
+
+        entries, cursor = log_container.query({'method': 'DELETE'})
+        self.assertEqual([], entries)
+        self.assertIsNone(cursor)
+
+    def test_080_query_with_cursor_and_limit(self):
+        log_container = LogContainer(10)
+        for i in range(5):
+            log_container.add(i)
+        entries, cursor = log_container.query(limit=2)
+        self.assertEqual([0, 1], [message for seq, ts, message in entries])
+        entries, cursor = log_container.query(cursor=cursor, limit=2)
+        self.assertEqual([2, 3], [message for seq, ts, message in entries])
+        entries, cursor = log_container.query(cursor=cursor, limit=2)
+        self.assertEqual([4], [message for seq, ts, message in entries])
+        entries, next_cursor = log_container.query(cursor=cursor, limit=2)
+        self.assertEqual([], entries)
+        self.assertEqual(cursor, next_cursor)
+
+    def test_090_index_is_updated_on_rewrite(self):
+        log_container = LogContainer(3)
+        for i in range(5):
+            log_container.add(i, method='GET')
+        entries, cursor = log_container.query({'method': 'GET'})
+        self.assertEqual([2, 3, 4], [message for seq, ts, message in entries])
+        self.assertEqual({2, 3, 4}, log_container._indexes['method']['GET'])
+
+        log_container.index(0, status=200)
+        self.assertNotIn('status', log_container._indexes)
+
+    def test_100_query_by_time(self):
+        log_container = LogContainer(10)
+        now = [100.0]
+        log_container._clock = lambda: now[0]
+        for i in range(5):
+            log_container.add(i)
+            now[0] += 10
+        entries, cursor = log_container.query(since=110, until=140)
+        self.assertEqual([1, 2, 3], [message for seq, ts, message in entries])
+        self.assertEqual([110, 120, 130], [ts for seq, ts, message in entries])
+
+    def test_110_subscribe(self):
+        log_container = LogContainer(10)
+        subscription = log_container.subscribe({'key': 'k1'}, buffer_size=2)
+        for i in range(4):
+            seq = log_container.add(i)
+            log_container.index(seq, key='k1' if i < 3 else 'k2')
+            log_container.publish(seq)
+
+        self.assertEqual(0, subscription.get(0)[2])
+        self.assertEqual(1, subscription.get(0)[2])
+        self.assertIsNone(subscription.get(0))
+        self.assertEqual(1, subscription.dropped)
+
+        log_container.unsubscribe(subscription)
+        seq = log_container.add(5, key='k1')
+        log_container.publish(seq)
+        self.assertIsNone(subscription.get(0))
@@ -0,0 +1,68 @@
+import threading
+import unittest
+
+from metrics import Metrics
+
+
+class MetricsTest(unittest.TestCase):
+    def test_010_counters(self):
+        metrics = Metrics()
+        metrics.inc('requests_total', (('key', 'k1'),))
+        metrics.inc('requests_total', (('key', 'k1'),), 2)
+        metrics.inc('requests_total', (('key', 'k"2'),))
+        self.assertEqual({('requests_total', (('key', 'k1'),)): 3,
+                          ('requests_total', (('key', 'k"2'),)): 1}, metrics.get_counters())
+
+        metrics.describe('requests_total', 'counter', 'Requests')
+        text = metrics.render()
+        self.assertIn('# TYPE requests_total counter\n', text)
+        self.assertIn('requests_total{key="k1"} 3\n', text)
+        self.assertIn('requests_total{key="k\\"2"} 1\n', text)
+
+    def test_020_histogram(self):
+        metrics = Metrics(buckets=(0.1, 1.0))
+        for value in [0.05, 0.5, 0.7, 5]:
+            metrics.observe('latency_seconds', (('phase', 'matching'),), value)
+        text = metrics.render()
+        self.assertIn('latency_seconds_bucket{phase="matching",le="0.1"} 1\n', text)
+        self.assertIn('latency_seconds_bucket{phase="matching",le="1.0"} 3\n', text)
+        self.assertIn('latency_seconds_bucket{phase="matching",le="+Inf"} 4\n', text)
+        self.assertIn('latency_seconds_count{phase="matching"} 4\n', text)
+        self.assertIn('latency_seconds_sum{phase="matching"} 6.25\n', text)
+
+    def test_030_threads(self):
+        metrics = Metrics(buckets=(1.0,))
+
+        def work():
+            for i in range(100):
+                metrics.inc('requests_total')
+                metrics.observe('latency_seconds', (), 0.5)
+
+        threads = [threading.Thread(target=work) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        metrics.inc('requests_total')
+
+        self.assertEqual({('requests_total', ()): 501}, metrics.get_counters())
+        self.assertEqual([500, 0], metrics.get_histograms()[('latency_seconds', ())][0])
+        self.assertEqual(1, len(metrics._stores))
+
+    def test_040_gauge(self):
+        metrics = Metrics()
+        metrics.inc('started')
+        metrics.inc('started')
+        metrics.inc('finished')
+        metrics.add_gauge('in_flight', 'In flight',
+                          lambda counters: counters[('started', ())] - counters[('finished', ())])
+        self.assertIn('# TYPE in_flight gauge\nin_flight 1\n', metrics.render())
+
+    def test_050_stores_are_bounded_without_rendering(self):
+        metrics = Metrics()
+        for i in range(1000):
+            thread = threading.Thread(target=metrics.inc, args=('requests_total',))
+            thread.start()
+            thread.join()
+        self.assertLessEqual(len(metrics._stores), 1)
+        self.assertEqual({('requests_total', ()): 1000}, metrics.get_counters())
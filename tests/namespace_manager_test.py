@@ -0,0 +1,116 @@
+import logging
+import unittest
+
+from expectation_manager import ExpectationManager
+from log_body_limiter import LogBodyLimiter
+from log_container import LogContainer
+from logging_format import logging_format
+from namespace_manager import NamespaceManager
+from response_manager import ResponseManager
+
+logging.basicConfig(level=logging.DEBUG, format=logging_format)
+
+
+class NamespaceManagerTest(unittest.TestCase):
+    _namespace_manager = None
+    _response_manager = None
+
+    def setUp(self):
+        expectation_manager = ExpectationManager()
+        self._response_manager = ResponseManager(expectation_manager)
+        self._namespace_manager = NamespaceManager(expectation_manager, self._response_manager.log_container)
+        self._namespace_manager.header = 'X-Flamock-Namespace'
+        self._namespace_manager.path_prefix = 'ns'
+        self._response_manager.namespace_manager = self._namespace_manager
+
+    def test_010_namespace_name(self):
+        get_name = self._namespace_manager.get_namespace_name
+        self.assertEqual('', get_name({'path': 'a/b', 'headers': {}}))
+        self.assertEqual('team', get_name({'path': 'a/b', 'headers': {'X-Flamock-Namespace': 'team'}}))
+        self.assertEqual('team', get_name({'path': 'a/b', 'headers': {'x-flamock-namespace': 'team'}}))
+        self.assertEqual('team', get_name({'path': 'ns/team/a/b', 'headers': {}}))
+        self.assertEqual('team', get_name({'path': 'ns/team?q=1', 'headers': {}}))
+        self.assertEqual('', get_name({'path': 'nsx/team/a', 'headers': {}}))
+
+    def test_020_resolve_cuts_path_prefix(self):
+        self._namespace_manager.get('team')
+        self._namespace_manager.get('x')
+        namespace, request = self._namespace_manager.resolve({'path': 'ns/team/a/b?q=1', 'headers': {}})
+        self.assertEqual('team', namespace.name)
+        self.assertEqual('a/b?q=1', request['path'])
+
+        namespace, request = self._namespace_manager.resolve({'path': 'a/b', 'headers': {'X-Flamock-Namespace': 'x'}})
+        self.assertEqual('x', namespace.name)
+        self.assertEqual('a/b', request['path'])
+
+    def test_030_namespaces_are_isolated(self):
+        self._namespace_manager.get('a').expectation_manager.add({'response': {'body': 'A'}})
+        self._namespace_manager.get('b').expectation_manager.add({'response': {'body': 'B'}})
+
+        resp = self._response_manager.generate_response(
+            {'method': 'GET', 'path': 'p', 'headers': {'X-Flamock-Namespace': 'a'}})
+        self.assertEqual('A', resp.text)
+        resp = self._response_manager.generate_response({'method': 'GET', 'path': 'ns/b/p', 'headers': {}})
+        self.assertEqual('B', resp.text)
+        resp = self._response_manager.generate_response({'method': 'GET', 'path': 'p', 'headers': {}})
+        self.assertIn('No expectation for request', resp.text)
+
+        self.assertEqual(1, len(self._namespace_manager.get('a').log_container.container))
+        self.assertEqual(1, len(self._namespace_manager.get('b').log_container.container))
+        self.assertEqual(1, len(self._namespace_manager.global_namespace.log_container.container))
+        self.assertEqual(1, self._namespace_manager.get('a').request_count)
+
+    def test_040_global_fallback(self):
+        self._namespace_manager.global_namespace.expectation_manager.add({'response': {'body': 'G'}, 'priority': 1})
+        self._namespace_manager.get('a').expectation_manager.add({'request': {'path': 'own'},
+                                                                  'response': {'body': 'A'},
+                                                                  'priority': 1})
+        headers = {'X-Flamock-Namespace': 'a'}
+        resp = self._response_manager.generate_response({'method': 'GET', 'path': 'own', 'headers': headers})
+        self.assertEqual('A', resp.text)
+        resp = self._response_manager.generate_response({'method': 'GET', 'path': 'other', 'headers': headers})
+        self.assertEqual('G', resp.text)
+
+    def test_050_isolated_namespace(self):
+        self._namespace_manager.use_global = False
+        self._namespace_manager.get('a')
+        self._namespace_manager.global_namespace.expectation_manager.add({'response': {'body': 'G'}})
+        resp = self._response_manager.generate_response(
+            {'method': 'GET', 'path': 'p', 'headers': {'X-Flamock-Namespace': 'a'}})
+        self.assertIn('No expectation for request', resp.text)
+
+    def test_060_remove_and_statistics(self):
+        self._namespace_manager.get('a').expectation_manager.add({'response': {'body': 'A'}})
+        self._namespace_manager.global_namespace.expectation_manager.add({'response': {'body': 'G'}})
+        namespaces = self._namespace_manager.to_list()
+        self.assertEqual(['', 'a'], [namespace['name'] for namespace in namespaces])
+        self.assertEqual(1, namespaces[1]['expectations'])
+        self.assertGreater(namespaces[1]['expectations_bytes'], 0)
+
+        self.assertTrue(self._namespace_manager.remove('a'))
+        self.assertFalse(self._namespace_manager.remove('a'))
+        self.assertEqual(1, len(self._namespace_manager.global_namespace.expectation_manager.get_expectations()))
+
+    def test_070_unknown_namespace_is_not_created(self):
+        self._namespace_manager.global_namespace.expectation_manager.add({'request': {'path': 'ns/x/p'},
+                                                                          'response': {'body': 'G'}})
+        for i in range(10):
+            resp = self._response_manager.generate_response(
+                {'method': 'GET', 'path': 'p', 'headers': {'X-Flamock-Namespace': 'n%s' % i}})
+            self.assertIn('No expectation for request', resp.text)
+        resp = self._response_manager.generate_response({'method': 'GET', 'path': 'ns/x/p', 'headers': {}})
+        self.assertEqual('G', resp.text)
+        self.assertEqual([''], [namespace['name'] for namespace in self._namespace_manager.to_list()])
+        self.assertEqual(11, self._namespace_manager.global_namespace.request_count)
+
+    def test_080_log_size_and_body_limiter(self):
+        log_body_limiter = LogBodyLimiter(max_body_size=5)
+        namespace_manager = NamespaceManager(log_size=3, log_body_limiter=log_body_limiter)
+        self.assertEqual(3, namespace_manager.get('a').log_container.size)
+        self.assertIs(log_body_limiter, namespace_manager.get('a').log_container.body_limiter)
+        self.assertIsNone(LogContainer().body_limiter.max_body_size)
+        self.assertEqual(LogContainer.DEFAULT_SIZE, NamespaceManager().get('a').log_container.size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from log_container import LogContainer
+from persistent_journal import PersistentJournal
+
+
+class PersistentJournalTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._journals = []
+
+    def tearDown(self):
+        for journal in self._journals:
+            journal.close()
+        shutil.rmtree(self._directory)
+
+    def _create_journal(self, **kwargs):
+        journal = PersistentJournal(self._directory, **kwargs)
+        self._journals.append(journal)
+        return journal
+
+    def test_010_append_and_query(self):
+        journal = self._create_journal()
+        for i in range(5):
+            journal.append(i, 100.0 + i, {'method': 'GET' if i % 2 == 0 else 'POST', 'status': 200}, {'i': i})
+
+        records, cursor = journal.query()
+        self.assertEqual([0, 1, 2, 3, 4], [record[0] for record in records])
+        self.assertEqual({'i': 4}, records[4][2])
+        self.assertEqual(4, cursor)
+
+        records, cursor = journal.query({'method': 'GET', 'status': 200}, cursor=0, limit=1)
+        self.assertEqual([2], [record[0] for record in records])
+        records, cursor = journal.query(since=101, until=103)
+        self.assertEqual([1, 2], [record[0] for record in records])
+
+    def test_020_rotation_and_restart(self):
+        journal = self._create_journal(segment_size=200)
+        for i in range(10):
+            journal.append(i, 100.0, {}, {'body': 'x' * 50})
+        journal.close()
+        self._journals.remove(journal)
+        self.assertGreater(len([name for name in os.listdir(self._directory)]), 2)
+
+        journal = self._create_journal(segment_size=200)
+        self.assertEqual(10, journal.next_id)
+        journal.append(journal.next_id, 100.0, {}, {'body': 'after restart'})
+        records, cursor = journal.query(cursor=8)
+        self.assertEqual([9, 10], [record[0] for record in records])
+        self.assertEqual('after restart', records[1][2]['body'])
+
+    def test_030_incomplete_record_is_ignored(self):
+        journal = self._create_journal()
+        journal.append(0, 100.0, {}, 'message')
+        journal.close()
+        self._journals.remove(journal)
+        first_id, path = journal._get_segments()[0]
+        with open(path, 'ab') as segment_file:
+            segment_file.write(b'\x00\x00\x00\x10\x00\x00\x01\x00{"id"')
+
+        journal = self._create_journal()
+        records, cursor = journal.query()
+        self.assertEqual(['message'], [record[2] for record in records])
+
+    def test_040_log_container_with_journal(self):
+        log_container = LogContainer(2)
+        log_container.set_journal(self._create_journal())
+        for i in range(5):
+            seq = log_container.add({'i': i}, method='GET')
+            log_container.index(seq, status=200)
+            log_container.publish(seq)
+
+        self.assertEqual(2, len(log_container.container))
+        records, cursor = log_container.query({'method': 'GET', 'status': 200})
+        self.assertEqual([0, 1, 2, 3, 4], [record[2]['i'] for record in records])
+
+        log_container.clear()
+        records, cursor = log_container.query()
+        self.assertEqual([], records)
+
+    def test_050_ids_of_log_container_continue_after_restart(self):
+        log_container = LogContainer(2)
+        log_container.set_journal(self._create_journal())
+        subscription = log_container.subscribe()
+        for i in range(3):
+            log_container.publish(log_container.add({'i': i}))
+        log_container.close()
+        self._journals.pop()
+
+        log_container = LogContainer(2)
+        log_container.set_journal(self._create_journal())
+        seq = log_container.add({'i': 3})
+        log_container.publish(seq)
+        self.assertEqual(3, seq)
+        # ids of journal are the same as ids of stream
+        self.assertEqual([0, 1, 2], [subscription.get(0)[0] for i in range(3)])
+        records, cursor = log_container.query(cursor=1)
+        self.assertEqual([(2, 2), (3, 3)], [(record[0], record[2]['i']) for record in records])
+
+    def test_060_query_decodes_only_found_records(self):
+        journal = self._create_journal(segment_size=300)
+        # records are written in order of completion, not in order of ids
+        for record_id in [1, 0, 3, 2, 5, 4, 7, 6]:
+            journal.append(record_id, 100.0 + record_id, {'key': 'k%s' % (record_id % 2)}, {'id': record_id})
+        read_positions = []
+        read_messages = journal._read_messages
+        journal._read_messages = lambda path, positions: read_positions.extend(positions) or \
+            read_messages(path, positions)
+
+        records, cursor = journal.query({'key': 'k1'}, limit=3)
+        self.assertEqual([1, 3, 5], [record[2]['id'] for record in records])
+        self.assertEqual(3, len(read_positions))
+        records, cursor = journal.query(cursor=cursor, since=100, until=107)
+        self.assertEqual([6], [record[0] for record in records])
+        self.assertEqual(4, len(read_positions))
+        self.assertEqual(8, journal.next_id)
+
+    def test_070_max_segments(self):
+        journal = self._create_journal(segment_size=100, max_segments=2)
+        for i in range(10):
+            journal.append(i, 100.0, {}, {'body': 'x' * 100})
+        records, cursor = journal.query()
+        self.assertEqual(2, journal.get_statistics()['segments'])
+        self.assertEqual([8, 9], [record[0] for record in records])
+        self.assertEqual(2, len(journal._indexes))
+
+    def test_080_query_under_constant_appending(self):
+        journal = self._create_journal()
+        journal.append(0, 100.0, {'key': 'first'}, 'first')
+        is_stopped = threading.Event()
+
+        def append():
+            record_id = 1
+            while not is_stopped.is_set():
+                journal.append(record_id, 100.0, {}, 'next')
+                record_id += 1
+
+        thread = threading.Thread(target=append)
+        thread.start()
+        try:
+            start_time = time.monotonic()
+            records, cursor = journal.query({'key': 'first'})
+            self.assertLess(time.monotonic() - start_time, 2)
+            self.assertEqual(['first'], [record[2] for record in records])
+        finally:
+            is_stopped.set()
+            thread.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
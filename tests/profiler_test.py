@@ -0,0 +1,59 @@
+import time
+import unittest
+
+from profiler import Profiler
+
+
+def slow_function(value):
+    time.sleep(0.05)
+    return value * 2
+
+
+class ProfilerTest(unittest.TestCase):
+    def test_010_cprofile_for_count_of_requests(self):
+        profiler = Profiler(Profiler.CPROFILE, max_requests=2)
+        self.assertEqual(2, profiler.run(slow_function, 1))
+        self.assertTrue(profiler.is_active)
+        self.assertEqual(4, profiler.run(slow_function, 2))
+        self.assertFalse(profiler.is_active)
+        self.assertEqual(6, profiler.run(slow_function, 3))
+
+        self.assertEqual(2, profiler.get_statistics()['profiled_requests'])
+        text = profiler.get_stats_as_text()
+        self.assertRegex(text, r'(?m)^\s+2\s.*\(slow_function\)$')
+
+    def test_020_sampling(self):
+        profiler = Profiler(Profiler.SAMPLING, interval=0.001)
+        profiler.run(slow_function, 1)
+        profiler.stop()
+        self.assertFalse(profiler.is_active)
+
+        lines = profiler.get_stats_as_text().splitlines()
+        self.assertGreater(len(lines), 0)
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertIn('slow_function (profiler_test.py:7)', stack.split(';'))
+        self.assertGreater(int(count), 0)
+        self.assertEqual(sum(int(line.rsplit(' ', 1)[1]) for line in lines), profiler.get_statistics()['samples'])
+
+    def test_030_stops_after_seconds(self):
+        profiler = Profiler(Profiler.CPROFILE, seconds=10)
+        self.assertTrue(profiler.is_active)
+        profiler._deadline = Profiler._clock()
+        self.assertFalse(profiler.is_active)
+        profiler.run(slow_function, 1)
+        self.assertEqual(0, profiler.get_statistics()['profiled_requests'])
+
+    def test_040_from_dict(self):
+        profiler, resp = Profiler.from_dict({'mode': 'sampling', 'seconds': 0.01})
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(Profiler.SAMPLING, profiler.mode)
+        profiler.stop()
+
+        for settings in [{'mode': 'other'}, {'requests': 0}, {'requests': 1.5}, {'seconds': -1}, {'interval': 'a'}]:
+            profiler, resp = Profiler.from_dict(settings)
+            self.assertIsNone(profiler)
+            self.assertEqual(400, resp.status_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
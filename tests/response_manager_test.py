@@ -1,4 +1,8 @@
+import json
 import logging
+import os
+import subprocess
+import sys
 import time
 import unittest
 
@@ -41,11 +45,7 @@ class ResponseManagerTest(unittest.TestCase):
         resp = self._response_manager.generate_response(req)
 
         self.assertEquals(200, resp.status_code)
-        self.assertIn('No expectation for request:', resp.text)
-        self.assertIn('pathv', resp.text)
-        self.assertIn("[('h1', 'hv1')]", resp.text)
-        self.assertIn('bodyv', resp.text)
-        self.assertIn("'c1': 'cv1'", resp.text)
+        self.assertEquals('No expectation for request: GET /pathv', resp.text)
 
     def test_020_expected_response(self):
         req = {'method': 'GET', 'path': 'pathv', 'headers': [('h1', 'hv1')], 'body': 'bodyv', 'cookies': {'c1': 'cv1'}}
@@ -211,7 +211,7 @@ class ResponseManagerTest(unittest.TestCase):
         self.assertEquals('', resp.text)
 
     def test_180_whitelist_request(self):
-        self._response_manager.host_whitelist = ["travix.com"]
+        self._response_manager.whitelist.update(["travix.com"])
         hosts_to_check = ['xxnet-403.appspot.com', 'testp1.piwo.pila.pl', 'testp4.pospr.waw.pl']
         for host in hosts_to_check:
             req = {'method': 'GET', 'path': '', 'headers': {'Host': host}}
@@ -243,6 +243,121 @@ class ResponseManagerTest(unittest.TestCase):
         self.assertEquals(200, resp.status_code)
         self.assertEquals(text, resp.text)
 
+    def test_210_verify_by_key(self):
+        self._expectation_manager.add({'key': 'pay', 'request': {'path': 'payments'}, 'response': {}})
+        for path in ['payments', 'payments/1', 'orders']:
+            self._response_manager.generate_response({'method': 'POST', 'path': path, 'headers': {}, 'body': ''})
+
+        resp = self._response_manager.verify_requests({'key': 'pay'})
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual({'count': 2}, json.loads(resp.text))
+
+        resp = self._response_manager.verify_requests({'key': 'pay', 'entries': True, 'limit': 1})
+        result = json.loads(resp.text)
+        self.assertEqual(2, result['count'])
+        self.assertEqual(['payments'], [entry['request']['path'] for entry in result['entries']])
+
+    def test_220_verify_by_request_pattern(self):
+        for path in ['payments', 'payments/1', 'orders']:
+            self._response_manager.generate_response({'method': 'POST', 'path': path, 'headers': {}, 'body': ''})
+
+        resp = self._response_manager.verify_requests({'request': {'method': 'POST', 'path': '^payments'}})
+        self.assertEqual({'count': 2}, json.loads(resp.text))
+        resp = self._response_manager.verify_requests({'request': {'method': 'GET'}})
+        self.assertEqual({'count': 0}, json.loads(resp.text))
+
+        resp = self._response_manager.verify_requests({'entries': True})
+        self.assertEqual(400, resp.status_code)
+
+    def test_230_stream_log_messages(self):
+        stream = self._response_manager.stream_log_messages({'path': 'a'}, keepalive_timeout=0)
+        self.assertEqual(': subscribed\n\n', next(stream))
+        self._response_manager.generate_response({'method': 'GET', 'path': 'b', 'headers': {}})
+        self._response_manager.generate_response({'method': 'GET', 'path': 'a?x=1', 'headers': {}})
+
+        event = next(stream)
+        self.assertTrue(event.startswith('id: 1\ndata: '))
+        self.assertEqual('a?x=1', json.loads(event.split('data: ', 1)[1])['request']['path'])
+        self.assertEqual(': keepalive\n\n', next(stream))
+
+        stream.close()
+        self.assertEqual(0, len(self._response_manager.log_container._subscriptions))
+
+    def test_240_format_server_timing(self):
+        timings = {'matching': 52000, 'delay': 1000000000, 'forward': 12345678}
+        self.assertEqual('matching;dur=0.052, delay;dur=1000.000, forward;dur=12.346',
+                         ResponseManager.format_server_timing(timings))
+
+    def test_250_static_response_is_prepared_once(self):
+        req = {'method': 'GET', 'path': 'static', 'headers': {}}
+        self._expectation_manager.add({'key': 'k1', 'request': {'path': 'static'},
+                                       'response': {'httpcode': 201, 'body': 'static body'}})
+        first_resp = self._response_manager.generate_response(req)
+        second_resp = self._response_manager.generate_response(req)
+        self.assertIs(first_resp, second_resp)
+        self.assertEqual(201, first_resp.status_code)
+        self.assertEqual('static body', first_resp.text)
+
+    def test_260_make_request_keeps_compressed_body(self):
+        class RawMock(object):
+            def read(self, decode_content=True):
+                return b'compressed' if not decode_content else b'decompressed'
+
+        def do_compressed_request_mock(**kwargs):
+            resp = CustomResponse(b'decompressed', 200, {'Content-Encoding': 'gzip', 'Content-Length': '10'})
+            resp.content = b'decompressed'
+            resp.raw = RawMock()
+            resp.close = lambda: None
+            return resp
+
+        self._response_manager._do_request = do_compressed_request_mock
+        req = {'method': 'GET', 'path': 'a', 'headers': {'Accept-Encoding': 'gzip, deflate'}}
+        resp = self._response_manager.make_forward_request({'scheme': 'http', 'host': 'real_host'}, req)
+        self.assertEqual(b'compressed', resp.text)
+        self.assertEqual({'Content-Encoding': 'gzip'}, resp.headers)
+
+        # client, which doesn't accept encoding of upstream, gets decoded body
+        for headers in [{}, {'Accept-Encoding': 'deflate'}, {'Accept-Encoding': 'gzip;q=0'}]:
+            req = {'method': 'GET', 'path': 'a', 'headers': headers}
+            resp = self._response_manager.make_forward_request({'scheme': 'http', 'host': 'real_host'}, req)
+            self.assertEqual(b'decompressed', resp.text)
+            self.assertEqual({}, resp.headers)
+
+    def test_270_miss_response(self):
+        req = {'method': 'POST', 'path': 'a' * 1000, 'headers': {}, 'body': 'b' * 10000}
+        resp = self._response_manager.generate_response(req)
+        self.assertEqual(200, resp.status_code)
+        self.assertLess(len(resp.text), 300)
+        self.assertNotIn('bbb', resp.text)
+
+        self._response_manager.miss_status_code = 404
+        self._response_manager.miss_body = 'Not mocked'
+        resp = self._response_manager.generate_response(req)
+        self.assertEqual(404, resp.status_code)
+        self.assertEqual('Not mocked', resp.text)
+
+    def test_280_miss_diagnostics(self):
+        self._response_manager.miss_diagnostics = 1
+        self._expectation_manager.add({'key': 'k1', 'request': {'method': 'GET', 'path': 'users'},
+                                       'response': {'httpcode': 200}})
+        self._expectation_manager.add({'key': 'k2', 'request': {'method': 'POST', 'path': 'users'},
+                                       'response': {'httpcode': 200}})
+        req = {'method': 'PUT', 'path': 'users/1', 'headers': {}}
+        resp = self._response_manager.generate_response(req)
+        result = json.loads(resp.text)
+        self.assertEqual('No expectation for request: PUT /users/1', result['message'])
+        self.assertEqual([{'key': 'k1', 'priority': 0, 'matched': ['path'],
+                           'failed': [{'field': 'method', 'expected': 'GET', 'actual': 'PUT'}]}],
+                         result['near_misses'])
+        entries = json.loads(self._response_manager.query_log_messages({}).text)['entries']
+        self.assertEqual(result['near_misses'], entries[-1]['near_misses'])
+
+    def test_290_requests_is_imported_on_first_forward(self):
+        script = "import sys; import flask_factory; print('requests' in sys.modules or 'urllib3' in sys.modules)"
+        output = subprocess.check_output([sys.executable, '-c', script],
+                                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual('False', output.decode().strip())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import uuid
+
+from response_template import ResponseTemplate
+
+
+class ResponseTemplateTest(unittest.TestCase):
+    request = {'method': 'POST',
+               'path': 'users/42/orders?id=7&id=8&lang=en',
+               'headers': {'X-Request-Id': 'abc'},
+               'body': '<order><id>1001</id></order>'}
+
+    def test_010_request_fields(self):
+        template = ResponseTemplate({'body': '{{method}} {{path}} {{ path.1 }} {{path.5}} {{query.id}} '
+                                             '{{query.unknown}} {{headers.x-request-id}}',
+                                     'headers': {'X-Id': 'id-{{query.lang}}', 'X-Static': 'static'},
+                                     'httpcode': 201})
+        response = template.render(self.request)
+        self.assertEqual('POST users/42/orders 42  7  abc', response.text)
+        self.assertEqual({'X-Id': 'id-en', 'X-Static': 'static'}, response.headers)
+        self.assertEqual(201, response.status_code)
+
+    def test_020_groups_of_request_pattern(self):
+        template = ResponseTemplate({'body': '{{match.path.1}}:{{match.body.id}}'},
+                                    {'path': r'users/(\d+)', 'body': r'<id>(?P<id>\d+)</id>'})
+        self.assertEqual('42:1001', template.render(self.request).text)
+        self.assertEqual(':', template.render({'path': 'users', 'body': ''}).text)
+
+    def test_030_helpers(self):
+        template = ResponseTemplate({'body': '{{uuid}}|{{timestamp}}|{{timestamp_ms}}|{{now}}'})
+        value_uuid, timestamp, timestamp_ms, now = template.render(self.request).text.split('|')
+        uuid.UUID(value_uuid)
+        self.assertTrue(timestamp.isdigit())
+        self.assertEqual(timestamp, timestamp_ms[:len(timestamp)])
+        self.assertTrue(now.endswith('+00:00'))
+        self.assertNotEqual(value_uuid, template.render(self.request).text.split('|')[0])
+
+    def test_040_compiled_once(self):
+        template = ResponseTemplate({'body': 'static body'})
+        self.assertEqual('static body', template._body)
+        template = ResponseTemplate({'body': 'id={{query.id}};'})
+        self.assertEqual('id=', template._body[0])
+        self.assertEqual(';', template._body[2])
+
+    def test_050_invalid_templates(self):
+        for expected_response, request_pattern in [({'body': '{{unknown}}'}, None),
+                                                   ({'headers': {'h': '{{query.}}'}}, None),
+                                                   ({'body': '{{match.path.1}}'}, None),
+                                                   ({'body': '{{match.path.2}}'}, {'path': '(a)'}),
+                                                   ({'body': '{{match.path.name}}'}, {'path': '(a)'}),
+                                                   ({'body': '{{match.path.1}}'}, {'path': '(a'})]:
+            self.assertRaises(ValueError, ResponseTemplate, expected_response, request_pattern)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import socket
+import time
+import unittest
+
+from throttle import Throttle
+from throttle import ThrottleScheduler
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.sleeps.append(round(delay, 6))
+        self.now += delay
+
+
+class ThrottleTest(unittest.TestCase):
+    def make_throttle(self, settings):
+        throttle = Throttle.from_dict(settings)
+        fake_clock = FakeClock()
+        throttle._clock = fake_clock.clock
+        throttle._sleep = fake_clock.sleep
+        return throttle, fake_clock
+
+    def test_010_rate_and_ttfb(self):
+        throttle, fake_clock = self.make_throttle({'ttfb': 200, 'rate': 1, 'chunk_size': 256})
+        chunks = list(throttle.wrap([b'a' * 600, 'b' * 424]))
+        self.assertEqual([256, 256, 88, 256, 168], [len(chunk) for chunk in chunks])
+        self.assertEqual(b'a' * 600 + b'b' * 424, b''.join(chunks))
+        # first chunk after ttfb, then every 256 bytes take 0.25 s at 1 KB/s
+        self.assertEqual([0.2, 0.25, 0.25, 0.085938, 0.25], fake_clock.sleeps)
+
+    def test_020_default_chunk_size(self):
+        self.assertEqual(10 * 1024, Throttle.from_dict({'rate': 100}).chunk_size)
+        self.assertEqual(Throttle.MIN_CHUNK_SIZE, Throttle.from_dict({'rate': 1}).chunk_size)
+
+        throttle, fake_clock = self.make_throttle({'ttfb': 100})
+        self.assertEqual([b'body'], list(throttle.wrap([b'body'])))
+        self.assertEqual([0.1], fake_clock.sleeps)
+
+    def test_030_closes_body(self):
+        class Body(object):
+            is_closed = False
+
+            def __iter__(self):
+                return iter([b'a' * 2000])
+
+            def close(self):
+                self.is_closed = True
+
+        throttle, fake_clock = self.make_throttle({'rate': 1})
+        body = Body()
+        generator = throttle.wrap(body)
+        next(generator)
+        generator.close()
+        self.assertTrue(body.is_closed)
+
+    def test_040_invalid_settings(self):
+        for settings in [[], {'rate': 0}, {'rate': 'fast'}, {'ttfb': -1}, {'chunk_size': True}]:
+            self.assertRaises(ValueError, Throttle.from_dict, settings)
+
+    def test_050_scheduler(self):
+        scheduler = ThrottleScheduler()
+        connections = [socket.socketpair() for i in range(3)]
+        bodies = [[b'a' * 600, b'b' * 424], [], [b'c' * 100]]
+        start_time = time.monotonic()
+        for (server_side, client_side), body in zip(connections, bodies):
+            scheduler.send(server_side, b'head:', body, Throttle.from_dict({'ttfb': 100, 'rate': 4, 'chunk_size': 512}))
+        for (server_side, client_side), body in zip(connections, bodies):
+            received = b''
+            data = client_side.recv(4096)
+            while len(data) > 0:
+                received += data
+                data = client_side.recv(4096)
+            client_side.close()
+            self.assertEqual(b'head:' + b''.join(body), received)
+        # ttfb and then the second chunk of 512 bytes after 0.125 s
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.225)
+        self.assertEqual(0, scheduler.count_of_transfers)
+
+
+if __name__ == '__main__':
+    unittest.main()
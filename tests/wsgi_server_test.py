@@ -0,0 +1,84 @@
+import http.client
+import json
+import threading
+import time
+import unittest
+
+from flask_factory import FlaskFactory
+from wsgi_server import WSGIServer
+
+
+class WSGIServerTest(unittest.TestCase):
+    def setUp(self):
+        self.app = FlaskFactory.flask_factory()
+        self.server = WSGIServer('127.0.0.1', 0, self.app, max_threads=2)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def request(self, method, path, body=None):
+        """
+        :return: tuple (status, headers, body)
+        """
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.server_port, timeout=10)
+        try:
+            connection.request(method, path, body)
+            response = connection.getresponse()
+            return response.status, dict(response.getheaders()), response.read()
+        finally:
+            connection.close()
+
+    def add_expectation(self, expectation):
+        status, _, body = self.request('POST', '/flamock/add_expectation', json.dumps(expectation))
+        self.assertEqual(200, status, body)
+
+    def test_010_not_throttled(self):
+        self.add_expectation({'request': {'path': 'fast'}, 'response': {'body': 'fast'}})
+        status, headers, body = self.request('GET', '/fast')
+        self.assertEqual(200, status)
+        self.assertEqual(b'fast', body)
+
+    def test_020_throttled_downloads_on_bounded_pool(self):
+        body = 'a' * 2048
+        self.add_expectation({'request': {'path': 'slow'},
+                              'response': {'body': body, 'headers': {'X-Test': '1'},
+                                           'throttle': {'ttfb': 300, 'rate': 8, 'chunk_size': 1024}}})
+        results = []
+
+        def download():
+            results.append(self.request('GET', '/slow'))
+
+        # every download takes 0.3 s ttfb + 0.125 s for the second chunk. 40 downloads on 2 threads,
+        # which wait for body, would take more than 8 s
+        start_time = time.monotonic()
+        threads = [threading.Thread(target=download) for i in range(40)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.monotonic() - start_time
+
+        self.assertEqual(40, len(results))
+        for status, headers, response_body in results:
+            self.assertEqual(200, status)
+            self.assertEqual(body.encode(), response_body)
+            self.assertEqual('2048', headers['Content-Length'])
+            self.assertEqual('1', headers['X-Test'])
+            self.assertEqual('close', headers['Connection'])
+        self.assertGreaterEqual(duration, 0.4)
+        self.assertLess(duration, 4)
+
+    def test_030_throttled_empty_body(self):
+        self.add_expectation({'request': {'path': 'slow'}, 'response': {'httpcode': 404, 'throttle': {'ttfb': 100}}})
+        start_time = time.monotonic()
+        status, headers, body = self.request('GET', '/slow')
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.1)
+        self.assertEqual(404, status)
+        self.assertEqual(b'', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
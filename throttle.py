@@ -0,0 +1,198 @@
+import heapq
+import itertools
+import socket
+import threading
+import time
+
+
+class Throttle(object):
+    """
+    Slow network simulation: body is sent in chunks at target rate after time to first byte.
+    Time of every chunk is computed from start of response, so waits don't accumulate drift,
+    and chunk is big enough for a few wakeups per second at any rate
+
+    Fields of 'throttle' in expectation:
+     - ttfb # number of ms before the first byte
+     - rate # number of KB (1024 bytes) per second. Without rate, only ttfb is applied
+     - chunk_size # number of bytes in chunk. By default, chunk takes CHUNK_INTERVAL seconds
+
+    Server, which can send responses by ThrottleScheduler, puts ENVIRON_KEY with None to WSGI environ.
+    Response stores its throttle under this key instead of waiting in body iterator
+    """
+    CHUNK_INTERVAL = 0.1  # seconds of transfer per chunk by default
+    MIN_CHUNK_SIZE = 512
+    ENVIRON_KEY = 'flamock.throttle'
+
+    _clock = time.monotonic
+    _sleep = time.sleep
+
+    def __init__(self, rate=None, ttfb=0, chunk_size=None):
+        """
+        :param rate: bytes per second or None
+        :param ttfb: seconds before the first byte
+        :param chunk_size: bytes in chunk or None
+        """
+        self.rate = rate
+        self.ttfb = ttfb
+        if chunk_size is None:
+            chunk_size = 64 * 1024 if rate is None else max(self.MIN_CHUNK_SIZE, int(rate * self.CHUNK_INTERVAL))
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_dict(cls, settings):
+        """
+        :param settings: 'throttle' field of expectation
+        :return: throttle
+        :raise ValueError: if settings are not valid
+        """
+        if not isinstance(settings, dict):
+            raise ValueError("Field 'throttle' must be object")
+        for field in ('ttfb', 'rate', 'chunk_size'):
+            value = settings.get(field)
+            if value is not None and (not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0 or
+                                      (field != 'ttfb' and value == 0)):
+                raise ValueError("Field 'throttle.%s' must be positive number" % field)
+        rate = settings.get('rate')
+        chunk_size = settings.get('chunk_size')
+        return cls(rate * 1024 if rate is not None else None,
+                   settings.get('ttfb', 0) / 1000,
+                   int(chunk_size) if chunk_size is not None else None)
+
+    def schedule(self, iterable, start_time):
+        """
+        :param iterable: body of response as iterable over bytes
+        :param start_time: time of start of response by _clock
+        :return: generator of tuples (time to send chunk at, chunk). It doesn't wait and doesn't close iterable
+        """
+        first_byte_time = start_time + self.ttfb
+        sent = 0
+        for data in iterable:
+            if isinstance(data, str):
+                data = data.encode()
+            view = memoryview(data)
+            for offset in range(0, len(view), self.chunk_size):
+                chunk = view[offset:offset + self.chunk_size].tobytes()
+                yield first_byte_time + sent / self.rate if self.rate is not None else first_byte_time, chunk
+                sent += len(chunk)
+
+    def wrap(self, iterable):
+        """
+        Used, when server can't send response by ThrottleScheduler. Thread of request waits while body is sent
+        :param iterable: body of response as iterable over bytes
+        :return: generator of chunks of body, which waits before each chunk until its time
+        """
+        start_time = self._clock()
+        try:
+            self._wait_until(start_time + self.ttfb)
+            for send_time, chunk in self.schedule(iterable, start_time):
+                self._wait_until(send_time)
+                yield chunk
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+    def _wait_until(self, deadline):
+        delay = deadline - self._clock()
+        if delay > 0:
+            self._sleep(delay)
+
+
+class ThrottleScheduler(object):
+    """
+    Sends throttled responses of all connections from one background thread. Transfers wait in heap by time
+    of their next chunk, so no thread is held by connection while it waits. Sockets are non-blocking:
+    when socket buffer is full, the rest of chunk is sent after RETRY_INTERVAL
+    """
+    RETRY_INTERVAL = 0.01  # seconds
+
+    _clock = time.monotonic
+
+    def __init__(self):
+        self._heap = []  # tuples (time of the next send, sequence number, transfer)
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    @property
+    def count_of_transfers(self):
+        return len(self._heap)
+
+    def send(self, connection, head, body, throttle):
+        """
+        Takes ownership of connection: sends head and body according to throttle and closes connection
+        :param connection: connected socket
+        :param head: status line and headers of response as bytes. They are sent with the first byte of body
+        :param body: body of response as iterable over bytes. It is closed after transfer
+        :param throttle: throttle
+        """
+        connection.setblocking(False)
+        start_time = self._clock()
+        chunks = itertools.chain([(start_time + throttle.ttfb, head)], throttle.schedule(body, start_time))
+        self._push(start_time + throttle.ttfb, _Transfer(connection, body, chunks))
+
+    def _push(self, send_time, transfer):
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='flamock-throttle', daemon=True)
+                self._thread.start()
+            heapq.heappush(self._heap, (send_time, next(self._sequence), transfer))
+            if self._heap[0][2] is transfer:
+                self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while len(self._heap) == 0 or self._heap[0][0] > self._clock():
+                    self._condition.wait(self._heap[0][0] - self._clock() if len(self._heap) > 0 else None)
+                _, _, transfer = heapq.heappop(self._heap)
+            send_time = self._send(transfer)
+            if send_time is None:
+                transfer.close()
+            else:
+                self._push(send_time, transfer)
+
+    def _send(self, transfer):
+        """
+        Sends chunks of transfer, which are due
+        :return: time of the next send or None if transfer is finished or failed
+        """
+        try:
+            while True:
+                if len(transfer.buffer) > 0:
+                    try:
+                        sent = transfer.connection.send(transfer.buffer)
+                    except (BlockingIOError, InterruptedError):
+                        sent = 0
+                    transfer.buffer = transfer.buffer[sent:]
+                    if len(transfer.buffer) > 0:
+                        return self._clock() + self.RETRY_INTERVAL
+                send_time, chunk = next(transfer.chunks, (None, None))
+                if chunk is None:
+                    return None
+                transfer.buffer = memoryview(chunk)
+                if send_time > self._clock():
+                    return send_time
+        except Exception:
+            # connection is closed by client or body can't be read. Client gets incomplete response
+            return None
+
+
+class _Transfer(object):
+    __slots__ = ('connection', 'body', 'chunks', 'buffer')
+
+    def __init__(self, connection, body, chunks):
+        self.connection = connection
+        self.body = body
+        self.chunks = chunks  # iterator over tuples (time to send chunk at, chunk)
+        self.buffer = memoryview(b'')  # part of chunk, which is not sent yet
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            try:
+                self.connection.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+            self.connection.close()
@@ -0,0 +1,122 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import ThreadedWSGIServer
+from werkzeug.serving import WSGIRequestHandler
+
+from throttle import Throttle
+from throttle import ThrottleScheduler
+
+
+class RequestHandler(WSGIRequestHandler):
+    """
+    Request handler, which hands throttled response over to scheduler of server. Status and headers
+    are written by werkzeug to nowhere, the same status and headers are sent by scheduler with the first byte of body
+    """
+    _transfer = None  # tuple (head, body, throttle) of response handed over to scheduler
+
+    def make_environ(self):
+        environ = super().make_environ()
+        environ[Throttle.ENVIRON_KEY] = None
+        environ[WSGIServer.HANDLER_ENVIRON_KEY] = self
+        return environ
+
+    def detach(self, status, headers, body, throttle):
+        """
+        :param status: status of response, e.g. '200 OK'
+        :param headers: list of headers of response
+        :param body: body of response as iterable over bytes
+        :param throttle: throttle
+        """
+        lines = ['%s %s' % (self.protocol_version, status),
+                 'Server: %s' % self.version_string(),
+                 'Date: %s' % self.date_time_string()]
+        lines += ['%s: %s' % (key, value) for key, value in headers
+                  if key.lower() not in ('connection', 'transfer-encoding')]
+        # without Content-Length end of body is the end of connection
+        lines.append('Connection: close')
+        self._transfer = (('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'), body, throttle)
+        self.wfile = _NullWriter()
+
+    def finish(self):
+        super().finish()
+        if self._transfer is not None:
+            self.server.send_throttled(self.connection, *self._transfer)
+
+
+class WSGIServer(ThreadedWSGIServer):
+    """
+    Threaded werkzeug server. Throttled responses are sent by scheduler, so thread of request is released
+    as soon as response is prepared and hundreds of slow downloads don't need hundreds of threads.
+    With max_threads requests are handled by bounded pool of threads instead of thread per connection
+    """
+    HANDLER_ENVIRON_KEY = 'flamock.request_handler'
+
+    def __init__(self, host, port, app, max_threads=None):
+        """
+        :param max_threads: count of threads, which handle requests. None - thread per connection
+        """
+        super().__init__(host, port, self._send_throttled(app), RequestHandler)
+        self.throttle_scheduler = ThrottleScheduler()
+        self._detached_connections = set()  # connections, which are closed by scheduler
+        self._detached_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_threads, 'flamock-request') if max_threads is not None else None
+
+    def _send_throttled(self, app):
+        """
+        :return: WSGI application, which detaches connection, if response of app has throttle
+        """
+        def application(environ, start_response):
+            response = []
+
+            def capture_start_response(status, headers, exc_info=None):
+                response[:] = [status, headers]
+                return start_response(status, headers, exc_info)
+
+            body = app(environ, capture_start_response)
+            throttle = environ.get(Throttle.ENVIRON_KEY)
+            if throttle is None or len(response) == 0:
+                return body
+            environ[self.HANDLER_ENVIRON_KEY].detach(response[0], response[1], body, throttle)
+            return []
+
+        return application
+
+    def send_throttled(self, connection, head, body, throttle):
+        """
+        Hands connection over to scheduler, it is not closed by server after request
+        """
+        with self._detached_lock:
+            self._detached_connections.add(connection)
+        self.throttle_scheduler.send(connection, head, body, throttle)
+
+    def process_request(self, request, client_address):
+        if self._executor is None:
+            super().process_request(request, client_address)
+        else:
+            self._executor.submit(self.process_request_thread, request, client_address)
+
+    def shutdown_request(self, request):
+        with self._detached_lock:
+            if request in self._detached_connections:
+                self._detached_connections.discard(request)
+                return
+        super().shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+class _NullWriter(object):
+    closed = False
+
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass